@@ -1,16 +1,202 @@
 from django.contrib import admin
-from main_app.models import Article, Newspaper
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from main_app.models import Article, CorpusSlice, Newspaper, Posting, RequestProfile
+from main_app.tokenizers import index_tokenize
 
 # admin.site.site_title = 'Site Administration'
 admin.site.site_header = 'corpus.bekhruz.com'
 
+# article fields never shown in the admin lists, loaded only when an article is opened
+HEAVY_FIELDS = ["content", "minhash", "word_sketch"]
+
+
+class ArticlePageFormSet(BaseInlineFormSet):
+    """Inline formset showing one page of the articles, see `ArticleInline.get_formset`"""
+
+    page = 1
+    per_page = 20
+
+    def get_queryset(self):
+        if not hasattr(self, "_page_queryset"):
+            self.count = super().get_queryset().count()
+            self.pages = max(1, -(-self.count // self.per_page))
+            self.page = min(self.page, self.pages)
+            start = (self.page - 1) * self.per_page
+            self._page_queryset = super().get_queryset().defer(*HEAVY_FIELDS)[start : start + self.per_page]
+            # evaluate once, the forms are built from the cached rows
+            len(self._page_queryset)
+        return self._page_queryset
+
+
 class ArticleInline(admin.TabularInline):
+    """The articles of a newspaper, a page of titles at a time (?articles_page=), edited in full in `ArticleAdmin`"""
+
     model = Article
-    extra = 1
+    formset = ArticlePageFormSet
+    fields = ["title", "language", "published_year", "issue_number"]
+    template = "admin/main_app/newspaper/article_inline.html"
+    extra = 0
+    show_change_link = True
+    per_page = 20
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        try:
+            formset.page = max(1, int(request.GET.get("articles_page") or 1))
+        except ValueError:
+            formset.page = 1
+        formset.per_page = self.per_page
+        return formset
+
 
 class NewspaperAdmin(admin.ModelAdmin):
+    list_display = ["title", "link", "published_year"]
+    search_fields = ["title"]
     inlines = [ArticleInline]
 
 admin.site.register(Newspaper, NewspaperAdmin)
 
 
+class YearListFilter(admin.SimpleListFilter):
+    title = "year"
+    parameter_name = "year"
+
+    def lookups(self, request, model_admin):
+        # the years of the precomputed corpus slices instead of a scan over the articles
+        years = CorpusSlice.objects.exclude(year=0).order_by("-year").values_list("year", flat=True).distinct()
+        return [(year, year) for year in years]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(published_year__year=self.value())
+        return queryset
+
+
+class ArticleAdmin(admin.ModelAdmin):
+    list_display = ["title", "newspaper", "language", "published_year", "word_count_total", "chunk_count"]
+    list_filter = ["language", YearListFilter, "newspaper", ("duplicate_of", admin.EmptyFieldListFilter)]
+    list_select_related = ["newspaper"]
+    list_per_page = 50
+    # no second COUNT over the whole table on filtered pages
+    show_full_result_count = False
+    raw_id_fields = ["newspaper", "duplicate_of"]
+    readonly_fields = ["word_count_total", "word_count_unique", "chunk_count"]
+    search_fields = ["title"]
+    search_help_text = "Words of the text, found through the search index, or part of the title"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(*HEAVY_FIELDS)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Articles containing every word of the search term, or with the term in their title"""
+        words = index_tokenize(search_term)
+        if not words:
+            return queryset, False
+        indexed = Q()
+        for word in words:
+            indexed &= Q(pk__in=Posting.objects.filter(term__word=word).values("article_id"))
+        return queryset.filter(indexed | Q(title__icontains=search_term.strip())), False
+
+admin.site.register(Article, ArticleAdmin)
+
+
+def _tree_lines(node, interval, total, depth=0, lines=None):
+    """Indented text rendering of a profile call tree, hiding nodes under 1%"""
+    lines = [] if lines is None else lines
+    share = node["samples"] / total if total else 0
+    lines.append(f"{'  ' * depth}{share:6.1%} {node['samples'] * interval * 1000:8.1f}ms  {node['name']}")
+    for child in node["children"]:
+        if total and child["samples"] / total >= 0.01:
+            _tree_lines(child, interval, total, depth + 1, lines)
+    return lines
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ["created", "method", "path", "view_name", "status_code", "duration_ms", "query_count", "user"]
+    list_filter = ["view_name", "method"]
+    search_fields = ["path"]
+    date_hierarchy = "created"
+    list_select_related = ["user"]
+    exclude = ["call_tree", "top_functions", "queries"]
+    readonly_fields = [
+        "created", "user", "method", "path", "view_name", "status_code", "duration", "interval",
+        "sample_count", "download", "top_functions_table", "queries_table", "call_tree_text",
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="duration (ms)", ordering="duration")
+    def duration_ms(self, obj):
+        return round(obj.duration * 1000, 1)
+
+    @admin.display(description="queries")
+    def query_count(self, obj):
+        return len(obj.queries)
+
+    @admin.display(description="download")
+    def download(self, obj):
+        url = reverse("admin:main_app_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">profile-{}.json</a>', url, obj.pk)
+
+    @admin.display(description="call tree")
+    def call_tree_text(self, obj):
+        lines = _tree_lines(obj.call_tree, obj.interval, obj.sample_count)
+        return format_html("<pre>{}</pre>", "\n".join(lines))
+
+    @admin.display(description="top functions")
+    def top_functions_table(self, obj):
+        lines = [f"{f['self_ms']:>9} {f['cumulative_ms']:>9}  {f['function']}" for f in obj.top_functions]
+        return format_html("<pre>{}\n{}</pre>", f"{'self ms':>9} {'cum ms':>9}  function", "\n".join(lines))
+
+    @admin.display(description="SQL")
+    def queries_table(self, obj):
+        blocks = []
+        for query in sorted(obj.queries, key=lambda q: -q["duration_ms"]):
+            block = f"-- {query['duration_ms']} ms\n{query['sql']}\n-- params: {query['params']}"
+            if query["explain"]:
+                block += f"\n{query['explain']}"
+            blocks.append(block)
+        return format_html("<pre>{}</pre>", "\n\n".join(blocks))
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<int:profile_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="main_app_requestprofile_download",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, profile_id):
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        data = {
+            "method": profile.method,
+            "path": profile.path,
+            "view_name": profile.view_name,
+            "created": profile.created.isoformat(),
+            "status_code": profile.status_code,
+            "duration": profile.duration,
+            "interval": profile.interval,
+            "sample_count": profile.sample_count,
+            "top_functions": profile.top_functions,
+            "queries": profile.queries,
+            "call_tree": profile.call_tree,
+        }
+        response = JsonResponse(data, json_dumps_params={"indent": 1})
+        response["Content-Disposition"] = f'attachment; filename="profile-{profile.pk}.json"'
+        return response
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,240 @@
+"""
+Admission control of the expensive views.
+
+Views are grouped in cost classes, configured by ``settings.ADMISSION_CLASSES``:
+at most ``limit`` requests of a class run at once on the host, up to ``queue``
+more wait up to ``timeout`` seconds for a free slot and the rest are answered
+right away with ``429 Too Many Requests`` and a ``Retry-After`` header. Cheap
+pages never wait, so a burst of exports cannot take every worker.
+
+The slots are ``flock`` locks on files in ``settings.ADMISSION_DIR``, shared
+by every worker process and thread and released by the kernel if a worker
+dies. Streamed responses keep their slot until they are sent. Holders also
+mark their slot in a state file of the class, which the ``/metrics`` gauge
+reads so that scrapes never take the locks.
+"""
+
+import asyncio
+import fcntl
+import os
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from main_app.instrumentation import DURATION_BUCKETS, registry
+
+# downloads and exports, and statistics pages
+EXPORT = "export"
+REPORT = "report"
+
+# seconds between tries to get a run slot while queued
+POLL_INTERVAL = 0.05
+
+
+class Slot:
+    """A held slot lock, released once"""
+
+    def __init__(self, fd: int, name: str, kind: str, index: int):
+        self.fd = fd
+        self.state = (name, kind, index)
+
+    def release(self):
+        if self.fd is not None:
+            # unmarked before it is unlocked, the next holder marks it again
+            _mark(*self.state, False)
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def _path(name: str, kind: str, index: int) -> str:
+    return os.path.join(settings.ADMISSION_DIR, f"{name}.{kind}.{index}")
+
+
+def _state_path(name: str, kind: str) -> str:
+    return os.path.join(settings.ADMISSION_DIR, f"{name}.{kind}.held")
+
+
+def _mark(name: str, kind: str, index: int, held: bool):
+    """Record whether slot `index` of `kind` is held, one byte per slot in its state file"""
+    fd = os.open(_state_path(name, kind), os.O_WRONLY | os.O_CREAT, 0o666)
+    try:
+        os.pwrite(fd, b"1" if held else b"0", index)
+    finally:
+        os.close(fd)
+
+
+def _take(name: str, kind: str, size: int) -> Slot | None:
+    """Lock the first free of the `size` slot files of `kind`"""
+    os.makedirs(settings.ADMISSION_DIR, exist_ok=True)
+    for index in range(size):
+        fd = os.open(_path(name, kind, index), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        _mark(name, kind, index, True)
+        return Slot(fd, name, kind, index)
+    return None
+
+
+def _held(name: str, kind: str, size: int) -> int:
+    """
+    Number of slots of `kind` marked held in its state file, read without
+    touching the locks. A slot of a worker that died stays marked until the
+    slot is taken again.
+    """
+    try:
+        with open(_state_path(name, kind), "rb") as file:
+            return file.read(size).count(b"1")
+    except FileNotFoundError:
+        return 0
+
+
+def _rejected(name: str) -> HttpResponse:
+    registry.inc("corpus_admission_rejected_total", {"class": name})
+    response = HttpResponse(
+        "Too many expensive requests are running, please retry in a moment", status=429, content_type="text/plain"
+    )
+    response["Retry-After"] = str(settings.ADMISSION_CLASSES[name]["retry_after"])
+    return response
+
+
+def _admitted(name: str, started: float, slot: Slot) -> Slot:
+    registry.observe("corpus_admission_wait_seconds", {"class": name}, time.monotonic() - started)
+    return slot
+
+
+def admit(name: str) -> Slot | None:
+    """Wait for a run slot of class `name`, None when the queue is full or the wait timed out"""
+    config, started = settings.ADMISSION_CLASSES[name], time.monotonic()
+    slot = _take(name, "run", config["limit"])
+    if slot is not None:
+        return _admitted(name, started, slot)
+    ticket = _take(name, "queue", config["queue"])
+    if ticket is None:
+        return None
+    try:
+        while time.monotonic() - started < config["timeout"]:
+            time.sleep(POLL_INTERVAL)
+            slot = _take(name, "run", config["limit"])
+            if slot is not None:
+                return _admitted(name, started, slot)
+        return None
+    finally:
+        ticket.release()
+
+
+async def aadmit(name: str) -> Slot | None:
+    """`admit` waiting on the event loop"""
+    config, started = settings.ADMISSION_CLASSES[name], time.monotonic()
+    slot = _take(name, "run", config["limit"])
+    if slot is not None:
+        return _admitted(name, started, slot)
+    ticket = _take(name, "queue", config["queue"])
+    if ticket is None:
+        return None
+    try:
+        while time.monotonic() - started < config["timeout"]:
+            await asyncio.sleep(POLL_INTERVAL)
+            slot = _take(name, "run", config["limit"])
+            if slot is not None:
+                return _admitted(name, started, slot)
+        return None
+    finally:
+        ticket.release()
+
+
+class _Releasing:
+    """Streamed content that releases the slot when the response is closed, sent or not"""
+
+    def __init__(self, content, slot: Slot):
+        self.content = content
+        self.slot = slot
+
+    def __iter__(self):
+        yield from self.content
+
+    def close(self):
+        self.slot.release()
+
+
+class _AsyncReleasing:
+    """`_Releasing` of asynchronously streamed content"""
+
+    def __init__(self, content, slot: Slot):
+        self.content = content
+        self.slot = slot
+
+    def __aiter__(self):
+        return aiter(self.content)
+
+    def close(self):
+        self.slot.release()
+
+
+def _release_after(response, slot: Slot):
+    if getattr(response, "streaming", False):
+        releasing = _AsyncReleasing if response.is_async else _Releasing
+        response.streaming_content = releasing(response.streaming_content, slot)
+    else:
+        slot.release()
+    return response
+
+
+def admission(name: str):
+    """Decorator running a (sync or async) view only when class `name` has a free slot"""
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def wrapper(*args, **kwargs):
+                slot = await aadmit(name)
+                if slot is None:
+                    return _rejected(name)
+                try:
+                    response = await view(*args, **kwargs)
+                except BaseException:
+                    slot.release()
+                    raise
+                return _release_after(response, slot)
+
+        else:
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                slot = admit(name)
+                if slot is None:
+                    return _rejected(name)
+                try:
+                    response = view(*args, **kwargs)
+                except BaseException:
+                    slot.release()
+                    raise
+                return _release_after(response, slot)
+
+        return wrapper
+
+    return decorator
+
+
+def _slots() -> dict:
+    if not os.path.isdir(settings.ADMISSION_DIR):
+        return {}
+    gauges = {}
+    for name, config in settings.ADMISSION_CLASSES.items():
+        gauges[(("class", name), ("state", "running"))] = _held(name, "run", config["limit"])
+        gauges[(("class", name), ("state", "queued"))] = _held(name, "queue", config["queue"])
+    return gauges
+
+
+registry.register(
+    "corpus_admission_wait_seconds", "histogram", "Time admitted requests waited for a slot by class", DURATION_BUCKETS
+)
+registry.register("corpus_admission_rejected_total", "counter", "Requests answered with 429 by class")
+registry.register_gauge("corpus_admission_slots", "Running and queued expensive requests of the host by class", _slots)
@@ -0,0 +1,157 @@
+"""
+Chunked storage of book-length texts.
+
+A text longer than ``settings.ARTICLE_CHUNK_THRESHOLD`` characters is split at
+paragraph (or word) boundaries into chunks of about ``settings.ARTICLE_CHUNK_SIZE``
+characters. The first chunk stays in `Article.content`, so listings, excerpts
+and the MinHash signature work like for any article; the rest are stored as
+`ArticleChunk` rows with their character and token offsets in the whole text
+and their own word counts. Splitting only between words keeps the token
+positions of the search index valid across chunks, so a posting position maps
+to its chunk with a binary search over the chunk token offsets.
+
+Search contexts are only extracted from the chunks containing a hit, the
+reading view loads one chunk per page and statistics add up the stored
+per-chunk counts instead of tokenizing the whole text.
+"""
+
+from bisect import bisect_right
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.html import strip_tags
+
+from main_app.counter import WordCounter
+from main_app.indexing import unpack_positions
+from main_app.tokenizers import index_tokenize
+
+
+def split_text(text: str, size: int) -> list[str]:
+    """
+    Consecutive pieces of about `size` characters that join back to `text`,
+    cut after a paragraph break or whitespace when there is one
+    """
+    pieces = []
+    start = 0
+    while len(text) - start > size:
+        end = start + size
+        cut = text.rfind("\n\n", start + size // 2, end)
+        if cut == -1:
+            cut = max(text.rfind(" ", start + size // 2, end), text.rfind("\n", start + size // 2, end))
+        cut = end if cut == -1 else cut + 1
+        pieces.append(text[start:cut])
+        start = cut
+    pieces.append(text[start:])
+    return pieces
+
+
+def split_article(article):
+    """
+    Keep only the first chunk of a long text in `content`, the others are
+    left in `article._chunks` for `store_chunks` once the article is saved.
+    The content of a stored chunked article is its first chunk until a new
+    text is assigned, which then replaces all of its chunks.
+    """
+    if hasattr(article, "_chunks"):
+        # already split, e.g. by `ingest.analyze_text`
+        return
+    if article.pk and article.chunk_count:
+        stored = type(article).objects.filter(pk=article.pk).values_list("content", flat=True).first()
+        if article.content == stored:
+            return
+    elif len(article.content) <= settings.ARTICLE_CHUNK_THRESHOLD:
+        return
+    if len(article.content) > settings.ARTICLE_CHUNK_THRESHOLD:
+        article.content, *article._chunks = split_text(article.content, settings.ARTICLE_CHUNK_SIZE)
+    else:
+        # a short new text, `store_chunks` deletes the old chunks
+        article._chunks = []
+    article.chunk_count = len(article._chunks)
+
+
+def store_chunks(articles: list):
+    """Replace the stored chunks of the saved articles that were split by `split_article`"""
+    from main_app.models import ArticleChunk
+
+    articles = [article for article in articles if hasattr(article, "_chunks")]
+    ArticleChunk.objects.filter(article__in=[article.pk for article in articles]).delete()
+    chunks = []
+    for article in articles:
+        start = len(article.content)
+        start_token = len(index_tokenize(strip_tags(article.content)))
+        for number, text in enumerate(article._chunks, start=1):
+            counter = WordCounter([text])
+            chunks.append(
+                ArticleChunk(
+                    article_id=article.pk,
+                    number=number,
+                    start=start,
+                    start_token=start_token,
+                    content=text,
+                    word_count=counter.total_words,
+                    word_freq=counter.word_freq,
+                )
+            )
+            start += len(text)
+            start_token += len(index_tokenize(strip_tags(text)))
+        del article._chunks
+    ArticleChunk.objects.bulk_create(chunks, batch_size=100)
+
+
+def matching_chunks(articles: list, query: str | None = None, words: list[str] | None = None) -> dict[int, list[str]]:
+    """
+    Contents of the stored chunks of long articles that contain the `query`
+    substring, or one of the index `words` according to their postings
+    """
+    from main_app.models import ArticleChunk, Posting
+
+    ids = [article.pk for article in articles if article.chunk_count]
+    if not ids:
+        return {}
+    chunks = ArticleChunk.objects.filter(article_id__in=ids)
+    if words is None:
+        chunks = chunks.filter(content__icontains=query)
+    else:
+        offsets: dict[int, tuple[list[int], list[int]]] = {}
+        for article_id, number, start_token in chunks.order_by("article_id", "number").values_list(
+            "article_id", "number", "start_token"
+        ):
+            starts, numbers = offsets.setdefault(article_id, ([], []))
+            starts.append(start_token)
+            numbers.append(number)
+        hits: dict[int, set[int]] = {}
+        postings = Posting.objects.filter(article_id__in=ids, term__word__in=words).values_list(
+            "article_id", "positions"
+        )
+        for article_id, positions in postings:
+            starts, numbers = offsets[article_id]
+            for position in unpack_positions(positions):
+                i = bisect_right(starts, position)
+                if i:
+                    hits.setdefault(article_id, set()).add(numbers[i - 1])
+        if not hits:
+            return {}
+        condition = Q()
+        for article_id, found in hits.items():
+            condition |= Q(article_id=article_id, number__in=found)
+        chunks = chunks.filter(condition)
+    contents: dict[int, list[str]] = {}
+    for article_id, content in chunks.order_by("article_id", "number").values_list("article_id", "content"):
+        contents.setdefault(article_id, []).append(content)
+    return contents
+
+
+def chunk_counts(articles) -> list[tuple[dict[str, int], int]]:
+    """Stored word frequencies and word count of every chunk of the articles (a queryset)"""
+    from main_app.models import ArticleChunk
+
+    return list(ArticleChunk.objects.filter(article__in=articles).values_list("word_freq", "word_count"))
+
+
+async def achunk_counts(articles) -> list[tuple[dict[str, int], int]]:
+    from main_app.models import ArticleChunk
+
+    return [
+        counts
+        async for counts in ArticleChunk.objects.filter(article__in=articles).values_list("word_freq", "word_count")
+    ]
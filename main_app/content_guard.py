@@ -0,0 +1,115 @@
+"""
+Development check for article texts loaded but never read.
+
+Article lists should be queried with `ArticleQuerySet.listing` or
+`with_excerpt`, which leave ``content`` out. With ``DEBUG`` on,
+`ContentGuardMiddleware` counts the articles every request loads with their
+``content`` and the ones whose ``content`` was actually read, and logs a
+warning, and sets an ``X-Unread-Content`` header, for views loading texts they
+don't use. Streamed responses are not checked, their content is read after
+the view returns.
+"""
+
+import contextvars
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.models.query_utils import DeferredAttribute
+
+logger = logging.getLogger(__name__)
+
+# articles loaded with their content during the current request
+_loaded = contextvars.ContextVar("content_loaded", default=None)
+# set while a deferred content is fetched, the fetched copy is read right away
+_fetching = contextvars.ContextVar("content_fetching", default=False)
+
+
+class _ReadTracking(DeferredAttribute):
+    """The ``content`` attribute, marking the instances it is read from"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        instance.__dict__["_content_read"] = True
+        token = _fetching.set(True)
+        try:
+            return super().__get__(instance, cls)
+        finally:
+            _fetching.reset(token)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+def _install():
+    from main_app.models import Article
+
+    if isinstance(Article.__dict__["content"], _ReadTracking):
+        return
+    Article.content = _ReadTracking(Article._meta.get_field("content"))
+    from_db = Article.from_db.__func__
+
+    # Django 6.1 passes fetch_mode
+    def tracking_from_db(cls, db, field_names, values, **kwargs):
+        instance = from_db(cls, db, field_names, values, **kwargs)
+        loaded = _loaded.get()
+        if loaded is not None and "content" in field_names and not _fetching.get():
+            loaded.append(instance)
+        return instance
+
+    Article.from_db = classmethod(tracking_from_db)
+
+
+class ContentGuardMiddleware:
+    """Warn about views loading article texts without reading them, only with ``DEBUG`` on"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        _install()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _loaded.set([])
+        try:
+            response = self.get_response(request)
+            self.check(request, response, _loaded.get())
+        finally:
+            _loaded.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token = _loaded.set([])
+        try:
+            response = await self.get_response(request)
+            self.check(request, response, _loaded.get())
+        finally:
+            _loaded.reset(token)
+        return response
+
+    def check(self, request, response, loaded: list):
+        if getattr(response, "streaming", False):
+            return
+        unread = [article for article in loaded if not article.__dict__.get("_content_read")]
+        if not unread:
+            return
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or "unresolved"
+        size = sum(len(article.__dict__.get("content") or "") for article in unread)
+        logger.warning(
+            "%s loaded the content of %d articles (%d characters) without reading it, "
+            "query them with listing() or with_excerpt()",
+            view,
+            len(unread),
+            size,
+        )
+        response["X-Unread-Content"] = str(len(unread))
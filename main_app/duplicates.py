@@ -0,0 +1,156 @@
+"""
+Near-duplicate detection of articles with MinHash and locality sensitive hashing.
+
+Every article gets a MinHash signature of its word shingles when it is saved
+or imported: the estimated Jaccard similarity of two articles is the share of
+equal signature values. The signature is cut into bands, and every band is
+hashed into a bucket stored in `MinHashBand`. Two articles that are similar
+enough share at least one bucket with high probability, so the candidates of a
+new article are found with a few indexed lookups instead of comparing it with
+the whole corpus, and only those candidates are compared.
+
+With 16 bands of 8 values, pairs above ~0.8 similarity are candidates with
+probability > 0.9, pairs below ~0.5 almost never are.
+"""
+
+import random
+from array import array
+from collections import defaultdict
+from hashlib import blake2b
+
+from django.conf import settings
+from django.utils.html import strip_tags
+
+from main_app.tokenizers import index_tokenize
+
+SHINGLE_SIZE = 3
+BANDS = 16
+ROWS = 8
+NUM_PERM = BANDS * ROWS
+PRIME = (1 << 61) - 1
+
+# fixed seed: signatures stored in the database must stay comparable
+_random = random.Random(20240601)
+PERMUTATIONS = [(_random.randrange(1, PRIME), _random.randrange(PRIME)) for _ in range(NUM_PERM)]
+
+
+def shingles(content: str) -> set[str]:
+    """Overlapping word n-grams of the text, its words if it is shorter than one n-gram"""
+    words = index_tokenize(strip_tags(content))
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {" ".join(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _hash(value: bytes | str) -> int:
+    if isinstance(value, str):
+        value = value.encode()
+    return int.from_bytes(blake2b(value, digest_size=8).digest())
+
+
+def minhash(content: str) -> bytes | None:
+    """
+    MinHash signature of the text packed as unsigned 64 bit integers, None
+    for texts without words
+    """
+    hashes = [_hash(shingle) & PRIME for shingle in shingles(content)]
+    if not hashes:
+        return None
+    return array("Q", [min((a * h + b) % PRIME for h in hashes) for a, b in PERMUTATIONS]).tobytes()
+
+
+def unpack(signature) -> array:
+    values = array("Q")
+    values.frombytes(bytes(signature))
+    return values
+
+
+def similarity(a, b) -> float:
+    """Estimated Jaccard similarity of the texts of two signatures"""
+    a, b = unpack(a), unpack(b)
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def band_buckets(signature) -> list[int]:
+    """Bucket of every band of the signature, as signed 64 bit integers"""
+    signature = bytes(signature)
+    size = ROWS * 8
+    return [
+        int.from_bytes(blake2b(signature[i * size : (i + 1) * size], digest_size=8).digest(), signed=True)
+        for i in range(BANDS)
+    ]
+
+
+class LSHIndex:
+    """In-memory buckets of signatures, keyed by (band, bucket)"""
+
+    def __init__(self):
+        self.buckets: dict[tuple[int, int], list] = defaultdict(list)
+        self.signatures = {}
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for band, bucket in enumerate(band_buckets(signature)):
+            self.buckets[(band, bucket)].append(key)
+
+    def nearest(self, signature, threshold: float):
+        """The most similar key sharing a bucket with the signature, if similar enough"""
+        candidates = {
+            key for band, bucket in enumerate(band_buckets(signature)) for key in self.buckets.get((band, bucket), ())
+        }
+        best, best_similarity = None, threshold
+        for key in candidates:
+            score = similarity(signature, self.signatures[key])
+            if score >= best_similarity:
+                best, best_similarity = key, score
+        return best
+
+
+def find_duplicates(articles: list, threshold: float | None = None) -> list:
+    """
+    For every unsaved article with a signature, the stored article or the
+    earlier article of the list it nearly duplicates, or None
+    """
+    from main_app.models import Article, MinHashBand
+
+    threshold = threshold or settings.DUPLICATE_THRESHOLD
+    buckets = [band_buckets(article.minhash) for article in articles if article.minhash]
+    candidate_ids = set()
+    for band in range(BANDS):
+        values = sorted({article_buckets[band] for article_buckets in buckets})
+        for start in range(0, len(values), 1000):
+            candidate_ids.update(
+                MinHashBand.objects.filter(band=band, bucket__in=values[start : start + 1000]).values_list(
+                    "article_id", flat=True
+                )
+            )
+    # unsaved articles are not hashable, the index holds positions in `known`
+    known = list(Article.objects.filter(pk__in=candidate_ids).defer("content"))
+    index = LSHIndex()
+    for i, stored in enumerate(known):
+        index.add(i, stored.minhash)
+
+    originals = []
+    for article in articles:
+        original = index.nearest(article.minhash, threshold) if article.minhash else None
+        originals.append(None if original is None else known[original])
+        if article.minhash and original is None:
+            index.add(len(known), article.minhash)
+            known.append(article)
+    return originals
+
+
+def store_bands(articles: list):
+    """Replace the LSH buckets of the given saved articles"""
+    from main_app.models import MinHashBand
+
+    MinHashBand.objects.filter(article__in=[article.pk for article in articles]).delete()
+    MinHashBand.objects.bulk_create(
+        (
+            MinHashBand(article_id=article.pk, band=band, bucket=bucket)
+            for article in articles
+            if article.minhash
+            for band, bucket in enumerate(band_buckets(article.minhash))
+        ),
+        batch_size=5000,
+    )
@@ -0,0 +1,75 @@
+"""
+Bounded worker pools for the CPU heavy parts (tokenizing, counting) of the
+async views.
+
+Every endpoint class gets its own pool, sized by ``settings.CPU_POOL_WORKERS``.
+The pool size is the concurrency limit of that class: extra requests wait in
+the pool's queue while the event loop keeps serving cheap pages. With
+``CPU_POOL_KIND = "process"`` the work runs in separate processes and is not
+held back by the GIL, "thread" trades that for cheaper startup.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+from main_app.instrumentation import timed
+
+SEARCH = "search"
+STATISTICS = "statistics"
+
+# Server-Timing span the time spent in each pool is reported under
+SPANS = {SEARCH: "search", STATISTICS: "count"}
+
+_pools: dict[str, Executor] = {}
+_lock = threading.Lock()
+_background: ThreadPoolExecutor | None = None
+
+
+def get_pool(name: str) -> Executor:
+    pool = _pools.get(name)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(name)
+            if pool is None:
+                workers = settings.CPU_POOL_WORKERS[name]
+                if settings.CPU_POOL_KIND == "process":
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+                _pools[name] = pool
+    return pool
+
+
+async def run_in_pool(name: str, func, *args, **kwargs):
+    """
+    Run `func(*args, **kwargs)` in the pool of endpoint class `name` and
+    report the wait in the request timings
+    """
+    loop = asyncio.get_running_loop()
+    with timed(SPANS[name]):
+        return await loop.run_in_executor(get_pool(name), partial(func, *args, **kwargs))
+
+
+def _close_connections(func, *args):
+    try:
+        func(*args)
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args):
+    """
+    Run `func(*args)` in the background thread of this worker, for work whose
+    result is stored instead of awaited (materializing saved subcorpora, similar
+    articles of uploads)
+    """
+    global _background
+    with _lock:
+        if _background is None:
+            _background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background")
+    return _background.submit(_close_connections, func, *args)
@@ -0,0 +1,133 @@
+"""
+Bulk export of the frequency lists of every year and language.
+
+The archive is built from the stored frequency vectors of the corpus slices
+(see `main_app.slices`) in one pass over them, ordered by language, year and
+newspaper, and streamed as a ZIP while it is written:
+
+- ``<language>/<year>.csv``, the frequency list of the year, like
+  ``year_archive_download``
+- ``<language>/<year>/<newspaper id>-<title>.csv`` for every newspaper, when
+  asked for
+- ``frequencies.csv``, all of them in long format: language, year, newspaper
+  (empty for the whole year), word, frequency and frequency per million words
+
+Articles without a publication year and flagged duplicates are left out, as
+in the slices.
+"""
+
+import csv
+import io
+import tempfile
+import zipfile
+from itertools import groupby
+from typing import Iterator
+
+import numpy as np
+from django.utils.text import slugify
+
+# bytes of the long-format file kept in memory before it spills to disk
+SPOOL_SIZE = 8 * 1024 * 1024
+LANGUAGES = {1: "english", 2: "uzbek"}
+
+
+class _Output:
+    """Write-only file collecting what `zipfile` writes until it is drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _csv(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _frequency_rows(ids: np.ndarray, counts: np.ndarray, words: dict[int, str]) -> list[tuple[int, str]]:
+    """(frequency, word) of the terms, most frequent first"""
+    order = np.argsort(-counts, kind="stable")
+    return [(count, words.get(term_id, "")) for term_id, count in zip(ids[order].tolist(), counts[order].tolist())]
+
+
+def _per_million(rows: list[tuple[int, str]], tokens: int) -> list[float]:
+    return [round(count / tokens * 1_000_000, 3) if tokens else 0.0 for count, _ in rows]
+
+
+def frequency_archive(
+    language: int | None = None,
+    year_from: int | None = None,
+    year_to: int | None = None,
+    newspapers: bool = False,
+) -> Iterator[bytes]:
+    """The ZIP archive of the frequency lists of every language and year in the range, in chunks"""
+    from main_app.models import CorpusSlice, Term
+
+    slices = CorpusSlice.objects.exclude(year=0)
+    if language:
+        slices = slices.filter(language=language)
+    if year_from:
+        slices = slices.filter(year__gte=year_from)
+    if year_to:
+        slices = slices.filter(year__lte=year_to)
+    rows = (
+        slices.order_by("language", "year", "newspaper_id")
+        .values_list("language", "year", "newspaper_id", "newspaper__title", "term_ids", "counts", "token_count")
+        .iterator(chunk_size=50)
+    )
+
+    output, words, words_language = _Output(), {}, None
+    with (
+        tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as long_format,
+        zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive,
+    ):
+        long_format.write(_csv([["language", "year", "newspaper", "word", "frequency", "per_million"]]))
+        for (slice_language, year), group in groupby(rows, key=lambda row: row[:2]):
+            if slice_language != words_language:
+                words = dict(Term.objects.filter(language=slice_language).values_list("pk", "word").iterator(20000))
+                words_language = slice_language
+            name = LANGUAGES.get(slice_language, str(slice_language))
+            ids, counts, tokens = [np.zeros(0, dtype=np.uint32)], [np.zeros(0, dtype=np.uint32)], 0
+            for _, _, newspaper_id, title, term_ids, term_counts, token_count in group:
+                ids.append(np.frombuffer(term_ids, dtype=np.uint32))
+                counts.append(np.frombuffer(term_counts, dtype=np.uint32))
+                tokens += token_count
+                if newspapers:
+                    frequency = _frequency_rows(ids[-1], counts[-1].astype(np.int64), words)
+                    path = f"{name}/{year}/{newspaper_id}-{slugify(title)}.csv"
+                    archive.writestr(path, _csv([["frequency", "word"], *frequency]))
+                    long_format.write(
+                        _csv(
+                            (name, year, title, word, count, per_million)
+                            for (count, word), per_million in zip(frequency, _per_million(frequency, token_count))
+                        )
+                    )
+            vector = np.bincount(np.concatenate(ids), weights=np.concatenate(counts)).astype(np.int64)
+            year_ids = np.flatnonzero(vector)
+            frequency = _frequency_rows(year_ids, vector[year_ids], words)
+            archive.writestr(f"{name}/{year}.csv", _csv([["frequency", "word"], *frequency]))
+            long_format.write(
+                _csv(
+                    (name, year, "", word, count, per_million)
+                    for (count, word), per_million in zip(frequency, _per_million(frequency, tokens))
+                )
+            )
+            yield output.drain()
+
+        long_format.seek(0)
+        with archive.open("frequencies.csv", "w", force_zip64=True) as file:
+            while chunk := long_format.read(1024 * 1024):
+                file.write(chunk)
+                yield output.drain()
+    yield output.drain()
@@ -0,0 +1,82 @@
+"""
+HyperLogLog sketches of the distinct words of articles and corpus slices.
+
+A sketch is 2^PRECISION one-byte registers. Every index term id is hashed to
+64 bits: the low PRECISION bits pick a register, which keeps the largest
+position of the lowest set bit among the remaining bits. The number of
+distinct terms is estimated from the registers with a standard error of
+1.04 / sqrt(2^PRECISION), about 2.3%. Sketches of disjoint or overlapping sets
+merge into the sketch of their union with an elementwise maximum, so the
+unique word count of any union of articles or slices costs one pass over a
+few kilobytes instead of building its vocabulary.
+"""
+
+import math
+
+import numpy as np
+
+from main_app.types import UniqueWords
+
+PRECISION = 11
+REGISTERS = 1 << PRECISION
+STANDARD_ERROR = 1.04 / math.sqrt(REGISTERS)
+# a register value when every remaining bit of the hash is zero
+MAX_RANK = 64 - PRECISION + 1
+
+
+def _hash(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, spreads consecutive term ids over 64 bits"""
+    x = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def sketch(term_ids) -> bytes:
+    """Sketch of a set of term ids"""
+    hashes = _hash(np.asarray(term_ids, dtype=np.uint64))
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    if len(hashes):
+        index = (hashes & np.uint64(REGISTERS - 1)).astype(np.intp)
+        rest = hashes >> np.uint64(PRECISION)
+        # the lowest set bit is a power of two, exact as a float
+        lowest = rest & (~rest + np.uint64(1))
+        with np.errstate(divide="ignore"):
+            rank = np.where(rest > 0, np.log2(lowest.astype(np.float64)) + 1, MAX_RANK).astype(np.uint8)
+        np.maximum.at(registers, index, rank)
+    return registers.tobytes()
+
+
+def merge(sketches) -> np.ndarray:
+    """Registers of the union of the sketches"""
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    for data in sketches:
+        if data:
+            np.maximum(registers, np.frombuffer(data, dtype=np.uint8), out=registers)
+    return registers
+
+
+def estimate(registers: np.ndarray) -> int:
+    """Estimated number of distinct terms counted by the registers"""
+    alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+    raw = alpha * REGISTERS**2 / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+    zeros = int(np.count_nonzero(registers == 0))
+    # linear counting is more accurate while many registers are still empty
+    if raw <= 2.5 * REGISTERS and zeros:
+        return round(REGISTERS * math.log(REGISTERS / zeros))
+    return round(raw)
+
+
+def unique_words(sketches) -> UniqueWords:
+    """Estimated unique word count of the union of the sketches"""
+    return UniqueWords(count=estimate(merge(sketches)), exact=False, error=round(STANDARD_ERROR, 4))
+
+
+def article_unique_words(articles, exact: bool = False) -> UniqueWords:
+    """Unique words of the articles (a queryset), recounted from their postings when `exact`"""
+    from main_app.models import Posting
+
+    if exact:
+        count = Posting.objects.filter(article__in=articles).values("term_id").distinct().count()
+        return UniqueWords(count=count, exact=True, error=0.0)
+    return unique_words(articles.values_list("word_sketch", flat=True).iterator(chunk_size=500))
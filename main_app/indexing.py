@@ -0,0 +1,124 @@
+"""
+Inverted index of the corpus.
+
+Articles are tokenized once, when they are saved or imported: every distinct
+word becomes a `Term` (per language) and every (term, article) pair a `Posting`
+holding the token positions. Vocabulary lookups, corpus statistics and term
+queries read the index instead of scanning `Article.content`.
+"""
+from array import array
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils.html import strip_tags
+
+from main_app.hyperloglog import sketch
+from main_app.orthography import normalize_term
+from main_app.tokenizers import index_tokenize
+
+MAX_WORD_LENGTH = 100
+BATCH_SIZE = 5000
+
+
+def pack_positions(positions: list[int]) -> bytes:
+    return array("I", positions).tobytes()
+
+
+def unpack_positions(data) -> array:
+    positions = array("I")
+    positions.frombytes(bytes(data))
+    return positions
+
+
+def article_postings(content: str | list[str]) -> dict[str, list[int]]:
+    """
+    Token positions of every word of the text, or of the chunks of a long
+    text numbered across them. Takes plain strings so that it can run in a
+    worker process.
+    """
+    positions: dict[str, list[int]] = {}
+    offset = 0
+    for text in [content] if isinstance(content, str) else content:
+        words = index_tokenize(strip_tags(text))
+        for i, word in enumerate(words, start=offset):
+            if len(word) <= MAX_WORD_LENGTH:
+                positions.setdefault(word, []).append(i)
+        offset += len(words)
+    return positions
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def term_ids(keys: set[tuple[int, str]]) -> dict[tuple[int, str], int]:
+    """Ids of the (language, word) terms, creating the missing ones"""
+    from main_app.models import Term
+
+    Term.objects.bulk_create(
+        [Term(language=language, word=word, normalized=normalize_term(word)) for language, word in keys],
+        ignore_conflicts=True,
+        batch_size=BATCH_SIZE,
+    )
+    ids = {}
+    for language in {language for language, _ in keys}:
+        words = [word for lang, word in keys if lang == language]
+        for chunk in _chunks(words):
+            for pk, word in Term.objects.filter(language=language, word__in=chunk).values_list("pk", "word"):
+                ids[(language, word)] = pk
+    return ids
+
+
+def refresh_term_counts(ids):
+    """Recompute the corpus and document frequency of the given terms from their postings"""
+    from main_app.models import Posting, Term
+
+    postings = Posting.objects.filter(term=OuterRef("pk")).values("term")
+    for chunk in _chunks(sorted(ids)):
+        Term.objects.filter(pk__in=chunk).update(
+            frequency=Coalesce(Subquery(postings.annotate(total=Sum("frequency")).values("total")), 0),
+            document_frequency=Coalesce(Subquery(postings.annotate(articles=Count("pk")).values("articles")), 0),
+        )
+
+
+@transaction.atomic
+def index_articles(articles: list, postings: list[dict[str, list[int]]] | None = None):
+    """
+    (Re)build the postings of the given saved articles and update the counts
+    of every term they used to or now contain, and their word sketches.
+    `postings` may hold precomputed `article_postings` results in the same
+    order as `articles`.
+    """
+    from main_app.models import Article, Posting
+
+    if not articles:
+        return
+    if postings is None:
+        postings = [article_postings(article.texts()) for article in articles]
+    article_ids = [article.pk for article in articles]
+    old = Posting.objects.filter(article_id__in=article_ids)
+    touched = set(old.values_list("term_id", flat=True))
+    old.delete()
+
+    ids = term_ids({(article.language, word) for article, words in zip(articles, postings) for word in words})
+    Posting.objects.bulk_create(
+        (
+            Posting(
+                term_id=ids[(article.language, word)],
+                article_id=article.pk,
+                frequency=len(positions),
+                positions=pack_positions(positions),
+            )
+            for article, words in zip(articles, postings)
+            for word, positions in words.items()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    refresh_term_counts(touched | set(ids.values()))
+    for article, words in zip(articles, postings):
+        article.word_sketch = sketch([ids[(article.language, word)] for word in words])
+    Article.objects.bulk_update(articles, ["word_sketch"], batch_size=500)
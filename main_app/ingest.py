@@ -0,0 +1,143 @@
+"""
+Streaming readers of the original corpus sources, used by the ``ingest`` command.
+
+Workbooks are read row by row with openpyxl in read-only mode and `.docx`
+files are parsed straight from their zip archive with an incremental XML
+parser, so a source is never fully loaded in memory. Every row gets a stable
+key (newspaper, year, issue and title, numbered when repeated) and a digest of
+its values; `SourceRecord` remembers both, so ingesting a source again only
+writes the rows that are new or changed.
+
+`analyze_text` is the CPU heavy part (splitting, counting, MinHash, postings)
+and takes and returns plain values so that it runs in a process pool.
+"""
+
+import datetime
+import hashlib
+import zipfile
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, TypedDict
+from xml.etree.ElementTree import iterparse
+
+from main_app.chunks import split_text
+from main_app.duplicates import minhash
+from main_app.indexing import article_postings
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+COLUMNS = ("title", "author", "newspaper", "language", "content", "published_year", "issue_number")
+# header names used by the workbooks for the same columns
+ALIASES = {"text_content": "content", "text": "content", "year": "published_year", "issue": "issue_number"}
+
+
+class SourceRow(TypedDict):
+    key: str
+    digest: str
+    title: str
+    author: str | None
+    newspaper: str
+    language: int
+    content: str
+    published_year: datetime.date | None
+    issue_number: int | None
+
+
+class AnalyzedText(TypedDict):
+    texts: list[str]
+    word_count_total: int
+    word_count_unique: int
+    minhash: bytes | None
+    postings: dict[str, list[int]]
+
+
+def _clean(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _language(value: str) -> int:
+    from main_app.models import Article
+
+    return Article.ENGLISH if value.lower() in ("english", "en", "eng", "ingliz") else Article.UZBEK
+
+
+def _year(value: str) -> datetime.date | None:
+    digits = value[:4]
+    return datetime.date(int(digits), 1, 1) if len(digits) == 4 and digits.isdigit() else None
+
+
+def source_rows(values: Iterator[dict[str, str]]) -> Iterator[SourceRow]:
+    """Article rows with their key and digest from raw column -> value rows"""
+    seen = Counter()
+    for row in values:
+        content = row.get("content", "")
+        if not content or not row.get("title"):
+            continue
+        identity = "\x1f".join(
+            (row.get("newspaper", ""), row.get("published_year", ""), row.get("issue_number", ""), row["title"])
+        )
+        seen[identity] += 1
+        issue = row.get("issue_number", "")
+        yield SourceRow(
+            key=hashlib.sha1(f"{identity}\x1f{seen[identity]}".encode()).hexdigest(),
+            digest=hashlib.sha1("\x1f".join(row.get(column, "") for column in COLUMNS).encode()).hexdigest(),
+            title=row["title"][:500],
+            author=row.get("author") or None,
+            newspaper=row.get("newspaper", "")[:200],
+            language=_language(row.get("language", "")),
+            content=content,
+            published_year=_year(row.get("published_year", "")),
+            issue_number=int(issue) if issue.isdigit() else None,
+        )
+
+
+def xlsx_values(path: Path, sheet: str = "Articles") -> Iterator[dict[str, str]]:
+    """Rows of the articles sheet (or the first sheet) as header -> value, read in streaming mode"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet in workbook.sheetnames else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = [ALIASES.get(_clean(name).lower(), _clean(name).lower()) for name in next(rows, ())]
+        for row in rows:
+            yield {name: _clean(value) for name, value in zip(header, row) if name}
+    finally:
+        workbook.close()
+
+
+def docx_text(path: Path) -> str:
+    """Paragraphs of a .docx document (table cells included) separated by blank lines"""
+    paragraphs, parts = [], []
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as document:
+        for event, element in iterparse(document, events=("end",)):
+            if element.tag == WORD_NAMESPACE + "t":
+                parts.append(element.text or "")
+            elif element.tag == WORD_NAMESPACE + "tab":
+                parts.append("\t")
+            elif element.tag == WORD_NAMESPACE + "p":
+                paragraph = "".join(parts).strip()
+                if paragraph:
+                    paragraphs.append(paragraph)
+                parts = []
+                element.clear()
+    return "\n\n".join(paragraphs)
+
+
+def analyze_text(content: str, chunk_threshold: int, chunk_size: int) -> AnalyzedText:
+    """
+    Chunks, word counts, MinHash signature and index postings of a text, the
+    same values `Article.save` and `index_articles` would compute
+    """
+    texts = split_text(content, chunk_size) if len(content) > chunk_threshold else [content]
+    words = content.split()
+    return AnalyzedText(
+        texts=texts,
+        word_count_total=len(words),
+        word_count_unique=len(set(words)),
+        minhash=minhash(texts[0]),
+        postings=article_postings(texts),
+    )
@@ -0,0 +1,366 @@
+"""
+Per-request performance instrumentation.
+
+Timings for the phases of a request (SQL, corpus counting, search, template
+rendering) are collected into a ``RequestTimings`` object kept in a context
+variable. ``TimingMiddleware`` emits them as a ``Server-Timing`` header and
+folds them into per-URL-name histograms, exported in the Prometheus text
+format by ``registry.render()``.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+# histogram buckets in seconds, same defaults as the official prometheus client
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class RequestTimings:
+    """Timings collected while serving a single request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: dict[str, list] = {}  # name -> [seconds, calls]
+        self.queries: list[tuple[str, tuple, float]] = []  # (sql, params, seconds)
+        self._active: set[str] = set()
+
+    def add(self, name: str, duration: float):
+        span = self.spans.setdefault(name, [0.0, 0])
+        span[0] += duration
+        span[1] += 1
+
+    def add_query(self, sql: str, params, duration: float):
+        self.queries.append((sql, params, duration))
+        self.add("db", duration)
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Format the collected spans as a ``Server-Timing`` header value"""
+        parts = []
+        for name, (duration, calls) in self.spans.items():
+            desc = f"{calls} queries" if name == "db" else f"{calls} calls"
+            parts.append(f'{name};dur={duration * 1000:.1f};desc="{desc}"')
+        parts.append(f"total;dur={self.total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def current_timings() -> RequestTimings | None:
+    return _current.get()
+
+
+@contextmanager
+def timed(name: str):
+    """
+    Time the enclosed block as span `name` of the current request.
+    Nested blocks with the same name are only counted once.
+    """
+    timings = _current.get()
+    if timings is None or name in timings._active:
+        yield
+        return
+    timings._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._active.discard(name)
+        timings.add(name, time.perf_counter() - start)
+
+
+def track(name: str):
+    """Decorator version of `timed`"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.add_query(sql, params, time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    """
+    Time queries on every connection, including the ones the async ORM uses
+    from its worker threads. Outside of `collect_timings` the wrapper only
+    checks a context variable.
+    """
+    if _query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_wrapper)
+
+
+@contextmanager
+def collect_timings():
+    """Collect timings (including every SQL query) for the enclosed block"""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend that times every top level template render"""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed("template"):
+            return self.template.render(context, request)
+
+
+class Histogram:
+    """Cumulative histogram in the shape prometheus expects"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self) -> dict:
+        return {"counts": self.counts, "count": self.count, "sum": self.sum}
+
+    def merge(self, data: dict):
+        self.counts = [a + b for a, b in zip(self.counts, data["counts"])]
+        self.count += data["count"]
+        self.sum += data["sum"]
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self, buckets=None):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def to_dict(self) -> dict:
+        return {"value": self.value}
+
+    def merge(self, data: dict):
+        self.value += data["value"]
+
+
+class MetricsRegistry:
+    """
+    Process local metric store. When ``settings.METRICS_DIR`` is set every
+    worker periodically dumps its metrics there so that whichever gunicorn
+    worker answers ``/metrics`` can export the sum over all workers.
+    Gauges are evaluated on export and describe the answering worker only.
+    """
+
+    DUMP_INTERVAL = 5  # seconds
+    KINDS = {"histogram": Histogram, "counter": Counter}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> (type, help, buckets)
+        self.metrics: dict[str, tuple[str, str, tuple | None]] = {}
+        self.values: dict[tuple, Histogram | Counter] = {}
+        self.gauges: dict[str, tuple[str, callable]] = {}
+        self.last_dump = 0.0
+
+    def register(self, name: str, kind: str, help_text: str, buckets: tuple | None = None):
+        self.metrics[name] = (kind, help_text, buckets)
+
+    def _get(self, metric: str, labels: dict):
+        key = (metric, tuple(sorted(labels.items())))
+        value = self.values.get(key)
+        if value is None:
+            kind, _, buckets = self.metrics[metric]
+            value = self.values[key] = self.KINDS[kind](buckets)
+        return value
+
+    def observe(self, metric: str, labels: dict, value: float):
+        with self.lock:
+            self._get(metric, labels).observe(value)
+
+    def inc(self, metric: str, labels: dict, amount: float = 1):
+        with self.lock:
+            self._get(metric, labels).inc(amount)
+
+    def register_gauge(self, name: str, help_text: str, func):
+        """Register a callable returning ``{labels_tuple: value}`` evaluated on export"""
+        self.gauges[name] = (help_text, func)
+
+    def record_request(self, view: str, method: str, timings: RequestTimings):
+        labels = {"view": view, "method": method}
+        self.observe("corpus_request_duration_seconds", labels, timings.total)
+        self.observe("corpus_request_db_queries", labels, len(timings.queries))
+        for phase, (duration, _) in timings.spans.items():
+            self.observe("corpus_request_phase_seconds", {"view": view, "phase": phase}, duration)
+        self.maybe_dump()
+
+    def _serialize(self) -> list:
+        with self.lock:
+            return [[metric, list(labels), v.to_dict()] for (metric, labels), v in self.values.items()]
+
+    def maybe_dump(self):
+        directory = getattr(settings, "METRICS_DIR", None)
+        now = time.monotonic()
+        if not directory or now - self.last_dump < self.DUMP_INTERVAL:
+            return
+        self.last_dump = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self._serialize(), f)
+        os.replace(f"{path}.tmp", path)
+
+    def _collect(self) -> dict[tuple, Histogram | Counter]:
+        directory = getattr(settings, "METRICS_DIR", None)
+        if not directory or not os.path.isdir(directory):
+            with self.lock:
+                return dict(self.values)
+        merged: dict[tuple, Histogram | Counter] = {}
+        own = f"{os.getpid()}.json"
+        entries = self._serialize()
+        for filename in os.listdir(directory):
+            if filename == own or not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    entries.extend(json.load(f))
+            except (OSError, ValueError):
+                continue
+        for metric, labels, data in entries:
+            if metric not in self.metrics:
+                continue
+            key = (metric, tuple(tuple(pair) for pair in labels))
+            value = merged.get(key)
+            if value is None:
+                kind, _, buckets = self.metrics[metric]
+                value = merged[key] = self.KINDS[kind](buckets)
+            value.merge(data)
+        return merged
+
+    def render(self) -> str:
+        """Render all metrics in the prometheus text exposition format"""
+        values = self._collect()
+        lines = []
+        for metric, (kind, help_text, _) in self.metrics.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for (name, labels), value in sorted(values.items(), key=lambda item: item[0]):
+                if name != metric:
+                    continue
+                if kind == "counter":
+                    lines.append(f"{metric}{_labels(labels)} {value.value}")
+                    continue
+                for bound, count in zip(value.buckets, value.counts):
+                    lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {value.count}")
+                lines.append(f"{metric}_sum{_labels(labels)} {value.sum}")
+                lines.append(f"{metric}_count{_labels(labels)} {value.count}")
+        for name, (help_text, func) in self.gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in func().items():
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+registry = MetricsRegistry()
+registry.register(
+    "corpus_request_duration_seconds", "histogram", "Request duration by url name", DURATION_BUCKETS
+)
+registry.register(
+    "corpus_request_phase_seconds", "histogram", "Time spent per request phase by url name", DURATION_BUCKETS
+)
+registry.register(
+    "corpus_request_db_queries", "histogram", "SQL queries per request by url name", QUERY_COUNT_BUCKETS
+)
+
+
+class TimingMiddleware:
+    """
+    Time every request, add a ``Server-Timing`` header and record the
+    request in the metrics registry under its url name
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with collect_timings() as timings:
+            response = self.get_response(request)
+            self.record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        with collect_timings() as timings:
+            response = await self.get_response(request)
+            self.record(request, response, timings)
+        return response
+
+    def record(self, request, response, timings: RequestTimings):
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or "unresolved"
+        if getattr(settings, "SERVER_TIMING_HEADER", True):
+            response["Server-Timing"] = timings.server_timing()
+        registry.record_request(view, request.method, timings)
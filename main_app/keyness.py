@@ -0,0 +1,101 @@
+"""
+Keyness: the words whose frequencies differ most between two subcorpora.
+
+The frequency vectors of both subcorpora are summed from the precomputed
+slices (see `main_app.slices`) and every statistic is computed for the whole
+vocabulary at once:
+
+- log-likelihood (G2), how significant the difference is, 3.84 is p < 0.05
+- %DIFF, the difference of the normalized frequencies in percent of the
+  frequency in the second subcorpus, infinite for words missing from it
+- log ratio, the binary log of the ratio of the relative frequencies with
+  zero frequencies counted as 0.5, positive for words key in the first one
+"""
+
+from typing import Iterator, Literal, NamedTuple
+
+import numpy as np
+
+from main_app.types import KeynessRow
+
+# lookups of words by term id while streaming rows
+WORD_BATCH_SIZE = 1000
+
+
+class Keyness(NamedTuple):
+    term_ids: np.ndarray
+    frequency_a: np.ndarray
+    frequency_b: np.ndarray
+    log_likelihood: np.ndarray
+    percent_diff: np.ndarray
+    log_ratio: np.ndarray
+    tokens_a: int
+    tokens_b: int
+
+
+def keyness_scores(
+    vector_a: np.ndarray, tokens_a: int, vector_b: np.ndarray, tokens_b: int, min_frequency: int = 5
+) -> Keyness:
+    """
+    Keyness of every term occurring at least `min_frequency` times in both
+    subcorpora together, sorted by log-likelihood
+    """
+    if not tokens_a or not tokens_b:
+        raise ValueError("Both subcorpora must contain articles")
+    size = max(len(vector_a), len(vector_b))
+    a = np.pad(vector_a, (0, size - len(vector_a)))
+    b = np.pad(vector_b, (0, size - len(vector_b)))
+    term_ids = np.flatnonzero(a + b >= max(min_frequency, 1))
+    a, b = a[term_ids], b[term_ids]
+
+    expected_a = tokens_a * (a + b) / (tokens_a + tokens_b)
+    expected_b = tokens_b * (a + b) / (tokens_a + tokens_b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_likelihood = 2 * (
+            np.where(a > 0, a * np.log(a / expected_a), 0) + np.where(b > 0, b * np.log(b / expected_b), 0)
+        )
+        relative_a, relative_b = a / tokens_a, b / tokens_b
+        percent_diff = np.where(b > 0, (relative_a - relative_b) * 100 / relative_b, np.inf)
+    log_ratio = np.log2((np.where(a > 0, a, 0.5) / tokens_a) / (np.where(b > 0, b, 0.5) / tokens_b))
+
+    order = np.argsort(-log_likelihood, kind="stable")
+    return Keyness(
+        term_ids[order],
+        a[order],
+        b[order],
+        log_likelihood[order],
+        percent_diff[order],
+        log_ratio[order],
+        tokens_a,
+        tokens_b,
+    )
+
+
+def top_keywords(result: Keyness, k: int, side: Literal["a", "b"]) -> np.ndarray:
+    """Positions of the `k` strongest keywords of one subcorpus (over-represented in it)"""
+    key = result.log_ratio > 0 if side == "a" else result.log_ratio < 0
+    return np.flatnonzero(key)[:k]
+
+
+def keyness_rows(result: Keyness, positions: np.ndarray | None = None) -> Iterator[KeynessRow]:
+    """Rows of the keyness table at `positions`, or of all of it, with their words"""
+    from main_app.models import Term
+
+    if positions is None:
+        positions = np.arange(len(result.term_ids))
+    for start in range(0, len(positions), WORD_BATCH_SIZE):
+        batch = positions[start : start + WORD_BATCH_SIZE]
+        words = dict(Term.objects.filter(pk__in=result.term_ids[batch].tolist()).values_list("pk", "word"))
+        for i in batch.tolist():
+            percent_diff = float(result.percent_diff[i])
+            yield KeynessRow(
+                word=words.get(int(result.term_ids[i]), ""),
+                frequency_a=int(result.frequency_a[i]),
+                frequency_b=int(result.frequency_b[i]),
+                per_million_a=round(float(result.frequency_a[i]) * 1_000_000 / result.tokens_a, 2),
+                per_million_b=round(float(result.frequency_b[i]) * 1_000_000 / result.tokens_b, 2),
+                log_likelihood=round(float(result.log_likelihood[i]), 3),
+                percent_diff=round(percent_diff, 2) if np.isfinite(percent_diff) else None,
+                log_ratio=round(float(result.log_ratio[i]), 3),
+                key_for="a" if result.log_ratio[i] > 0 else "b",
+            )
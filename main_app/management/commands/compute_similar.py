@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import Article
+from main_app.similarity import compute_similar
+
+
+class Command(BaseCommand):
+    help = "Precompute the TF-IDF nearest neighbors (similar articles) of every article"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--language", type=int, choices=[Article.ENGLISH, Article.UZBEK])
+        parser.add_argument("-k", type=int, help="Neighbors per article, settings.SIMILAR_ARTICLES by default")
+
+    def handle(self, *args, **options):
+        languages = [options["language"]] if options["language"] else [Article.ENGLISH, Article.UZBEK]
+        for language in languages:
+            count = compute_similar(language, options["k"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Computed similar articles of {count} articles in language {language}")
+            )
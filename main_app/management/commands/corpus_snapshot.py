@@ -0,0 +1,27 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.snapshot import CorpusSnapshot, write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the memory-mapped corpus snapshot of the current corpus generation and link it as the current one"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=None, help="Snapshot directory, settings.CORPUS_SNAPSHOT_DIR by default")
+
+    def handle(self, *args, **options):
+        directory = options["dir"] or settings.CORPUS_SNAPSHOT_DIR
+        if not directory:
+            raise CommandError("Set CORPUS_SNAPSHOT_DIR or pass --dir")
+        path = write_snapshot(directory)
+        snapshot = CorpusSnapshot(path)
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote snapshot of generation {snapshot.generation} to {path}: {len(snapshot)} articles, "
+                f"{len(snapshot.tokens)} tokens, {len(snapshot.term_frequency)} term ids, {size / 2**20:.1f} MiB"
+            )
+        )
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Case, TextField, Value, When
+
+from main_app.duplicates import BANDS, LSHIndex, band_buckets, minhash
+from main_app.models import Article, MinHashBand
+from main_app.slices import refresh_slices
+from main_app.subcorpora import materialize_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Find near-duplicate articles in one pass over the corpus: compute missing MinHash signatures, "
+        "rebuild the LSH buckets and flag (or delete) every article that nearly duplicates an earlier one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=float, default=settings.DUPLICATE_THRESHOLD)
+        parser.add_argument("--delete", action="store_true", help="Delete the duplicates instead of flagging them")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        # the content is only read for articles without a signature
+        rows = (
+            Article.objects.order_by("pk")
+            .annotate(
+                text=Case(When(minhash__isnull=True, then="content"), default=Value(""), output_field=TextField())
+            )
+            .values_list("pk", "minhash", "text")
+        )
+        index = LSHIndex()
+        signatures, bands, duplicates = [], [], {}
+        seen = 0
+        MinHashBand.objects.all().delete()
+        for pk, signature, text in rows.iterator(chunk_size=batch_size):
+            seen += 1
+            if signature is None:
+                signature = minhash(text)
+                if signature is None:
+                    continue
+                signatures.append(Article(pk=pk, minhash=signature))
+            bands.extend(
+                MinHashBand(article_id=pk, band=band, bucket=bucket)
+                for band, bucket in enumerate(band_buckets(signature))
+            )
+            original = index.nearest(signature, options["threshold"])
+            if original is None:
+                index.add(pk, signature)
+            else:
+                duplicates[pk] = original
+            if len(signatures) >= batch_size:
+                Article.objects.bulk_update(signatures, ["minhash"])
+                signatures = []
+            if len(bands) >= batch_size * BANDS:
+                MinHashBand.objects.bulk_create(bands)
+                bands = []
+        Article.objects.bulk_update(signatures, ["minhash"], batch_size=batch_size)
+        MinHashBand.objects.bulk_create(bands, batch_size=5000)
+
+        if options["delete"]:
+            ids = sorted(duplicates)
+            for start in range(0, len(ids), batch_size):
+                Article.objects.filter(pk__in=ids[start : start + batch_size]).delete()
+            self.stdout.write(self.style.SUCCESS(f"Checked {seen} articles, deleted {len(duplicates)} duplicates"))
+            return
+        Article.objects.exclude(duplicate_of=None).exclude(pk__in=duplicates).update(duplicate_of=None)
+        Article.objects.bulk_update(
+            [Article(pk=pk, duplicate_of_id=original) for pk, original in duplicates.items()],
+            ["duplicate_of"],
+            batch_size=batch_size,
+        )
+        # flagged duplicates are left out of the slice and subcorpus counts
+        refresh_slices()
+        materialize_all()
+        self.stdout.write(self.style.SUCCESS(f"Checked {seen} articles, flagged {len(duplicates)} duplicates"))
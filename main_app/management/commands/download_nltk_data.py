@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Download the NLTK punkt tokenizer data into settings.NLTK_DATA (run once, not at startup)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--resource", default="punkt_tab", help="NLTK resource to download")
+
+    def handle(self, *args, **options):
+        import nltk
+
+        path = str(settings.NLTK_DATA)
+        if not nltk.download(options["resource"], download_dir=path, quiet=True):
+            raise CommandError(f"Could not download {options['resource']} into {path}")
+        self.stdout.write(self.style.SUCCESS(f"Downloaded {options['resource']} into {path}"))
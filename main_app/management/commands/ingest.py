@@ -0,0 +1,145 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.ingest import analyze_text, docx_text, source_rows, xlsx_values
+from main_app.models import Article, Newspaper, SourceRecord
+from main_app.similarity import add_similar
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingest the .xlsx workbooks (articles sheet) and .docx documents of the corpus sources. "
+        "Rows are streamed, analyzed in a process pool and imported in batches; "
+        "ingesting a source again only writes new or changed rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", type=Path, help="Source files, the workbooks in docs/ by default")
+        parser.add_argument("--workers", type=int, default=None, help="Processes analyzing the texts")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--duplicates", choices=["skip", "flag", "keep"], default=None)
+        # a .docx file is one document, its metadata comes from the options
+        parser.add_argument("--newspaper", help="Newspaper of .docx documents")
+        parser.add_argument("--language", choices=["uzbek", "english"], default="uzbek")
+        parser.add_argument("--year", default="", help="Publication year of .docx documents")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or sorted(Path(settings.BASE_DIR, "docs").glob("*.xlsx"))
+        # ids of the created and changed articles, their similar articles are computed once at the end
+        self.refreshed = []
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            for path in paths:
+                if path.suffix == ".xlsx":
+                    values = xlsx_values(path)
+                elif path.suffix == ".docx":
+                    if not options["newspaper"]:
+                        raise CommandError(f"--newspaper is required to ingest {path.name}")
+                    values = iter(
+                        [
+                            {
+                                "title": path.stem,
+                                "newspaper": options["newspaper"],
+                                "language": options["language"],
+                                "published_year": options["year"],
+                                "content": docx_text(path),
+                            }
+                        ]
+                    )
+                else:
+                    raise CommandError(f"Unsupported source {path}, expected .xlsx or .docx")
+                counts = self.ingest(path.name, source_rows(values), pool, options)
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{path.name}: {counts['created']} created, {counts['updated']} updated, "
+                        f"{counts['skipped']} skipped as duplicates, {counts['unchanged']} unchanged"
+                    )
+                )
+        if self.refreshed:
+            add_similar(list(Article.objects.filter(pk__in=self.refreshed).only("language")))
+
+    def ingest(self, source: str, rows, pool, options) -> dict[str, int]:
+        counts = {"created": 0, "updated": 0, "skipped": 0, "unchanged": 0}
+        newspapers = {}
+        while batch := list(islice(rows, options["batch_size"])):
+            records = {
+                record.key: record
+                for record in SourceRecord.objects.filter(source=source, key__in=[row["key"] for row in batch])
+            }
+            new, changed = [], []
+            for row in batch:
+                record = records.get(row["key"])
+                if record is None:
+                    new.append(row)
+                elif record.digest != row["digest"]:
+                    changed.append((record, row))
+                else:
+                    counts["unchanged"] += 1
+            for row in new + [row for _, row in changed]:
+                if row["newspaper"] not in newspapers:
+                    newspapers[row["newspaper"]], _ = Newspaper.objects.get_or_create(title=row["newspaper"])
+
+            texts = [row["content"] for row in new] + [row["content"] for _, row in changed]
+            analyzed = list(
+                pool.map(
+                    analyze_text,
+                    texts,
+                    [settings.ARTICLE_CHUNK_THRESHOLD] * len(texts),
+                    [settings.ARTICLE_CHUNK_SIZE] * len(texts),
+                    chunksize=8,
+                )
+            )
+
+            # changed rows are rare, saving them reindexes them through the post_save signal
+            for (record, row), result in zip(changed, analyzed[len(new) :]):
+                if record.article_id:
+                    article = Article.objects.get(pk=record.article_id)
+                    self.assign(article, row, newspapers)
+                    # all of the new text, the old chunks are replaced
+                    article.content = result["texts"][0]
+                    article._chunks = result["texts"][1:]
+                    article.chunk_count = len(article._chunks)
+                    article.save()
+                    self.refreshed.append(article.pk)
+                record.digest = row["digest"]
+                record.save()
+                counts["updated"] += 1
+
+            articles, postings = [], []
+            for row, result in zip(new, analyzed):
+                article = Article(
+                    content=result["texts"][0],
+                    chunk_count=len(result["texts"]) - 1,
+                    word_count_total=result["word_count_total"],
+                    word_count_unique=result["word_count_unique"],
+                    minhash=result["minhash"],
+                )
+                self.assign(article, row, newspapers)
+                if article.chunk_count:
+                    article._chunks = result["texts"][1:]
+                articles.append(article)
+                postings.append(result["postings"])
+            if articles:
+                Article.objects.import_articles(articles, postings, duplicates=options["duplicates"], similar=False)
+                self.refreshed.extend(article.pk for article in articles if article.pk is not None)
+            SourceRecord.objects.bulk_create(
+                [
+                    SourceRecord(source=source, key=row["key"], digest=row["digest"], article_id=article.pk)
+                    for row, article in zip(new, articles)
+                ]
+            )
+            created = sum(article.pk is not None for article in articles)
+            counts["created"] += created
+            counts["skipped"] += len(articles) - created
+        return counts
+
+    def assign(self, article: Article, row, newspapers):
+        article.title = row["title"]
+        article.author = row["author"]
+        article.newspaper = newspapers[row["newspaper"]]
+        article.language = row["language"]
+        article.published_year = row["published_year"]
+        article.issue_number = row["issue_number"]
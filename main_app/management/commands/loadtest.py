@@ -0,0 +1,173 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from itertools import accumulate
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import ExtractYear
+from django.urls import reverse
+
+from main_app.models import Article, Term
+
+# share of the requests going to every url name, roughly what a launch-day
+# visitor does: the home page and searches, reading a few articles, a year
+# archive now and then and rarely a CSV download
+MIX = {
+    "index": 25,
+    "search": 35,
+    "article_detail": 25,
+    "year_archive": 10,
+    "word_frequency_data": 2,
+    "year_archive_download": 3,
+}
+# the most frequent words searched for, drawn by their number of occurrences
+QUERY_WORDS = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a launch-peak mix of page views, searches and downloads against a running server "
+        "and report throughput and latency percentiles per url name"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base url of the server")
+        parser.add_argument("-u", "--users", type=int, default=150, help="Concurrent virtual users")
+        parser.add_argument("-d", "--duration", type=float, default=60, help="Seconds to run after the ramp-up")
+        parser.add_argument("--ramp-up", type=float, default=10, help="Seconds over which the users start")
+        parser.add_argument("--think-time", type=float, default=2, help="Mean pause of a user between requests")
+        parser.add_argument("--timeout", type=float, default=60, help="Seconds before a request counts as failed")
+        parser.add_argument("--seed", type=int, default=None, help="Seed of the random choices")
+        parser.add_argument("--json", help="Also write the report to this file")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("Only plain http://host[:port] urls are supported")
+        self.rng = random.Random(options["seed"])
+        self.prepare()
+        results = asyncio.run(self.run(url.hostname, url.port or 80, options))
+        report = self.report(results, options["duration"])
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def prepare(self):
+        """Load the words, articles and years requests are drawn from"""
+        terms = list(
+            Term.objects.filter(frequency__gt=0)
+            .order_by("-frequency")
+            .values_list("word", "language", "frequency")[:QUERY_WORDS]
+        )
+        self.article_ids = list(Article.objects.values_list("pk", flat=True))
+        self.years = sorted(
+            set(
+                Article.objects.exclude(published_year=None)
+                .annotate(year=ExtractYear("published_year"))
+                .values_list("year", flat=True)
+            )
+        )
+        if not terms or not self.article_ids or not self.years:
+            raise CommandError("The corpus is empty, import articles first")
+        self.queries = [(word, language) for word, language, _ in terms]
+        self.query_weights = list(accumulate(frequency for _, _, frequency in terms))
+        self.names, self.name_weights = list(MIX), list(MIX.values())
+
+    def next_request(self) -> tuple[str, str]:
+        """A url name and path drawn from the mix"""
+        name = self.rng.choices(self.names, self.name_weights)[0]
+        if name == "search":
+            word, language = self.rng.choices(self.queries, cum_weights=self.query_weights)[0]
+            return name, f"{reverse(name)}?{urlencode({'q': word, 'language': language})}"
+        if name == "article_detail":
+            return name, reverse(name, kwargs={"article_id": self.rng.choice(self.article_ids)})
+        if name == "year_archive":
+            return name, reverse(name, kwargs={"year": self.rng.choice(self.years)})
+        if name == "year_archive_download":
+            kwargs = {
+                "year": self.rng.choice(self.years),
+                "language": self.rng.choice([Article.ENGLISH, Article.UZBEK]),
+            }
+            return name, reverse(name, kwargs=kwargs)
+        if name == "word_frequency_data":
+            language = self.rng.choice(["english", "uzbek"])
+            return name, f"{reverse(name)}?{urlencode({'full': 1, 'language': language})}"
+        return name, reverse(name)
+
+    async def fetch(self, host: str, port: int, path: str) -> int:
+        """GET `path` over a new connection and read the whole response, its status code"""
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: corpus-loadtest\r\nConnection: close\r\n\r\n"
+            writer.write(request.encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            while await reader.read(65536):
+                pass
+            return status
+        finally:
+            writer.close()
+
+    async def user(self, host: str, port: int, options: dict, start: float, deadline: float, results: list):
+        await asyncio.sleep(self.rng.uniform(0, options["ramp_up"]))
+        while time.perf_counter() < deadline:
+            name, path = self.next_request()
+            sent = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(self.fetch(host, port, path), options["timeout"])
+            # timeouts are OSErrors, malformed status lines Value- and IndexErrors
+            except (OSError, ValueError, IndexError):
+                status = 0
+            done = time.perf_counter()
+            # requests started during the ramp-up don't count
+            if sent >= start:
+                results.append((name, status, done - sent))
+            await asyncio.sleep(self.rng.expovariate(1 / options["think_time"]) if options["think_time"] else 0)
+
+    async def run(self, host: str, port: int, options: dict) -> list:
+        results = []
+        start = time.perf_counter() + options["ramp_up"]
+        deadline = start + options["duration"]
+        self.stdout.write(
+            f"{options['users']} users against {host}:{port}, "
+            f"{options['ramp_up']:.0f}s ramp-up then {options['duration']:.0f}s measured"
+        )
+        await asyncio.gather(
+            *(self.user(host, port, options, start, deadline, results) for _ in range(options["users"]))
+        )
+        return results
+
+    def report(self, results: list, duration: float) -> dict:
+        by_name = defaultdict(list)
+        for name, status, seconds in results:
+            by_name[name].append((status, seconds))
+        by_name["all"] = [(status, seconds) for _, status, seconds in results]
+        report = {}
+        self.stdout.write(
+            f"{'url name':<24}{'requests':>9}{'req/s':>8}{'errors':>8}{'429':>6}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        )
+        for name, rows in sorted(by_name.items(), key=lambda item: item[0] == "all"):
+            statuses = np.array([status for status, _ in rows])
+            latencies = np.array([seconds for _, seconds in rows]) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(rows) else (0, 0, 0)
+            report[name] = {
+                "requests": len(rows),
+                "throughput": len(rows) / duration,
+                "errors": int(np.count_nonzero((statuses == 0) | (statuses >= 500))),
+                "rejected": int(np.count_nonzero(statuses == 429)),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(latencies.max()) if len(rows) else 0.0,
+            }
+            row = report[name]
+            self.stdout.write(
+                f"{name:<24}{row['requests']:>9}{row['throughput']:>8.1f}{row['errors']:>8}{row['rejected']:>6}"
+                f"{row['p50']:>9.0f}{row['p95']:>9.0f}{row['p99']:>9.0f}{row['max']:>9.0f}"
+            )
+        return report
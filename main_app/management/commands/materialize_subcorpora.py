@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import Subcorpus
+from main_app.subcorpora import materialize
+
+
+class Command(BaseCommand):
+    help = "Recompute the members and statistics of saved subcorpora, the pending ones or all of them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="Subcorpora to recompute")
+        parser.add_argument("--all", action="store_true", help="Recompute every subcorpus")
+
+    def handle(self, *args, **options):
+        subcorpora = Subcorpus.objects.all()
+        if options["ids"]:
+            subcorpora = subcorpora.filter(pk__in=options["ids"])
+        elif not options["all"]:
+            subcorpora = subcorpora.filter(materialized=None)
+        for subcorpus_id, name in subcorpora.values_list("pk", "name"):
+            materialize(subcorpus_id)
+            self.stdout.write(self.style.SUCCESS(f"Materialized subcorpus {subcorpus_id} {name}"))
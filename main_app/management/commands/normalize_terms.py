@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import CorpusState, Term
+from main_app.orthography import normalize_term
+
+
+class Command(BaseCommand):
+    help = "Recompute the spelling-variant keys of the vocabulary, e.g. after changing TRANSLITERATE_CYRILLIC"
+
+    def handle(self, *args, **options):
+        changed = []
+        for term in Term.objects.only("id", "word", "normalized").iterator(chunk_size=5000):
+            normalized = normalize_term(term.word)
+            if term.normalized != normalized:
+                term.normalized = normalized
+                changed.append(term)
+        Term.objects.bulk_update(changed, ["normalized"], batch_size=5000)
+        CorpusState.bump()
+        self.stdout.write(self.style.SUCCESS(f"Updated {len(changed)} terms"))
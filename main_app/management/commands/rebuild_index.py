@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from main_app.indexing import index_articles
+from main_app.models import Article, CorpusState
+from main_app.slices import refresh_slices
+from main_app.subcorpora import materialize_all
+
+
+class Command(BaseCommand):
+    help = "Build the search index (terms and postings) of every article and the corpus slices counted from it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch = []
+        done = 0
+        articles = Article.objects.only("id", "language", "content", "chunk_count").order_by("pk")
+        for article in articles.iterator(chunk_size=options["batch_size"]):
+            batch.append(article)
+            if len(batch) == options["batch_size"]:
+                index_articles(batch)
+                done += len(batch)
+                batch = []
+                self.stdout.write(f"indexed {done} articles")
+        index_articles(batch)
+        done += len(batch)
+        refresh_slices()
+        materialize_all()
+        CorpusState.bump()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {done} articles"))
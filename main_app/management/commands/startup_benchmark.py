@@ -0,0 +1,39 @@
+import statistics
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+# executed in a fresh interpreter so module caches of this process don't count
+BOOT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from uzAnalytica.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+import main_app.views, main_app.admin
+print(time.perf_counter() - start, "nltk" in sys.modules)
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure how long a fresh worker takes to boot the WSGI application"
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        timings = []
+        nltk_imported = False
+        for _ in range(options["runs"]):
+            output = subprocess.run(
+                [sys.executable, "-c", BOOT_SCRIPT], capture_output=True, text=True, check=True
+            ).stdout.split()
+            timings.append(float(output[-2]))
+            nltk_imported |= output[-1] == "True"
+        self.stdout.write(
+            f"worker boot over {len(timings)} runs: "
+            f"min {min(timings) * 1000:.0f}ms, median {statistics.median(timings) * 1000:.0f}ms, "
+            f"max {max(timings) * 1000:.0f}ms"
+        )
+        self.stdout.write(f"nltk imported at boot: {'yes' if nltk_imported else 'no'}")
@@ -0,0 +1,28 @@
+# Generated by Django 6.1.2 on 2026-10-19 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0011_requestprofile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CorpusState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("generation", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
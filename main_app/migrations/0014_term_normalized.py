@@ -0,0 +1,29 @@
+# Generated by Django 6.1.2 on 2026-10-19 09:39
+
+from django.db import migrations, models
+
+
+def normalize_terms(apps, schema_editor):
+    from main_app.orthography import normalize_term
+
+    Term = apps.get_model("main_app", "Term")
+    terms = list(Term.objects.only("id", "word"))
+    for term in terms:
+        term.normalized = normalize_term(term.word)
+    Term.objects.bulk_update(terms, ["normalized"], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0013_term_posting"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="term",
+            name="normalized",
+            field=models.CharField(db_index=True, default="", max_length=200),
+        ),
+        migrations.RunPython(normalize_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.1.2 on 2026-10-19 09:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0014_term_normalized"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="duplicate_of",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="duplicates",
+                to="main_app.article",
+            ),
+        ),
+        migrations.AddField(
+            model_name="article",
+            name="minhash",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.CreateModel(
+            name="MinHashBand",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("band", models.PositiveSmallIntegerField()),
+                ("bucket", models.BigIntegerField()),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="bands",
+                        to="main_app.article",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["band", "bucket"], name="minhash_band_bucket")],
+            },
+        ),
+    ]
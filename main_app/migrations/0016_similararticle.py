@@ -0,0 +1,50 @@
+# Generated by Django 6.1.2 on 2026-10-19 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0015_article_minhash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarArticle",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar",
+                        to="main_app.article",
+                    ),
+                ),
+                (
+                    "neighbor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main_app.article",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["rank"],
+                "indexes": [models.Index(fields=["article", "rank"], name="similar_article_rank")],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.1.2 on 2026-10-19 09:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0016_similararticle"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="chunk_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="ArticleChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField()),
+                ("start", models.PositiveBigIntegerField()),
+                ("start_token", models.PositiveBigIntegerField()),
+                ("content", models.TextField()),
+                ("word_count", models.PositiveIntegerField()),
+                ("word_freq", models.JSONField()),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="main_app.article",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["number"],
+                "constraints": [models.UniqueConstraint(fields=("article", "number"), name="unique_chunk_number")],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.1.2 on 2026-10-19 09:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0018_sourcerecord"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CorpusSlice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "language",
+                    models.PositiveSmallIntegerField(choices=[(1, "English"), (2, "Uzbek")]),
+                ),
+                ("year", models.PositiveSmallIntegerField(default=0)),
+                ("article_count", models.PositiveIntegerField(default=0)),
+                ("token_count", models.PositiveBigIntegerField(default=0)),
+                ("term_ids", models.BinaryField()),
+                ("counts", models.BinaryField()),
+                (
+                    "newspaper",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main_app.newspaper",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("language", "year", "newspaper"),
+                        name="unique_corpus_slice",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.1.2 on 2026-10-19 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0019_corpusslice"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="word_sketch",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name="corpusslice",
+            name="word_sketch",
+            field=models.BinaryField(default=b""),
+        ),
+    ]
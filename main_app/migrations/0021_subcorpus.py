@@ -0,0 +1,75 @@
+# Generated by Django 6.1.2 on 2026-10-19 10:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0020_word_sketches"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Subcorpus",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=200)),
+                (
+                    "language",
+                    models.PositiveSmallIntegerField(choices=[(1, "English"), (2, "Uzbek")]),
+                ),
+                ("year_from", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("year_to", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("article_count", models.PositiveIntegerField(default=0)),
+                ("token_count", models.PositiveBigIntegerField(default=0)),
+                ("term_ids", models.BinaryField(default=b"")),
+                ("counts", models.BinaryField(default=b"")),
+                ("bigram_keys", models.BinaryField(default=b"")),
+                ("bigram_counts", models.BinaryField(default=b"")),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "materialized",
+                    models.DateTimeField(blank=True, editable=False, null=True),
+                ),
+                (
+                    "articles",
+                    models.ManyToManyField(
+                        blank=True,
+                        editable=False,
+                        related_name="subcorpora",
+                        to="main_app.article",
+                    ),
+                ),
+                (
+                    "newspapers",
+                    models.ManyToManyField(blank=True, related_name="+", to="main_app.newspaper"),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="subcorpora",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "subcorpora",
+                "ordering": ["name"],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.1.2 on 2026-10-19 10:06
+
+from django.db import migrations, models
+
+
+def count_words(apps, schema_editor):
+    """Articles imported in bulk from CSV were saved without their word counts"""
+    Article = apps.get_model("main_app", "Article")
+    ArticleChunk = apps.get_model("main_app", "ArticleChunk")
+    articles = []
+    for article in Article.objects.filter(word_count_total=None).only("id", "content", "chunk_count").iterator():
+        texts = [article.content]
+        if article.chunk_count:
+            texts += ArticleChunk.objects.filter(article=article).order_by("number").values_list("content", flat=True)
+        words = "".join(texts).split()
+        # only the counts are kept, not the content
+        articles.append(Article(pk=article.pk, word_count_total=len(words), word_count_unique=len(set(words))))
+        if len(articles) == 1000:
+            Article.objects.bulk_update(articles, ["word_count_total", "word_count_unique"])
+            articles = []
+    Article.objects.bulk_update(articles, ["word_count_total", "word_count_unique"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main_app", "0021_subcorpus"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="subcorpus",
+            name="seed",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="subcorpus",
+            name="tolerance",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="subcorpus",
+            name="words_per_year",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(count_words, migrations.RunPython.noop),
+    ]
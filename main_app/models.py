@@ -1,16 +1,34 @@
 from io import TextIOWrapper
-from typing import List
-from django.db import models
+from typing import Iterator, List
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import models, transaction
 from django.http import HttpResponse
-from main_app.types import SearchResult, SearchResultItem
-from main_app.utils import RegexpReplace, frequency_stats, search_word
+from main_app.chunks import matching_chunks, split_article, store_chunks
+from main_app.duplicates import find_duplicates, minhash, store_bands
+from main_app.executors import SEARCH, run_in_background, run_in_pool
+from main_app.indexing import index_articles
+from main_app.slices import article_slices, refresh_slices
+from main_app.subcorpora import add_articles
+from main_app.instrumentation import track
+from main_app.types import ConcordanceLine, FrequencyStats, SearchResult, SearchResultItem
+from main_app.utils import (
+    RegexpReplace,
+    concordance_lines,
+    frequency_stats,
+    merge_search_results,
+    search_contents,
+    search_terms_contents,
+    search_word,
+)
+from main_app.vocabulary import get_vocabulary, parse_pattern
 from django.core.files.uploadedfile import UploadedFile
 
 from main_app.validators import max_word_count, min_word_count
 from django.db.models import Count
 from django.db.models.query import QuerySet
 from django.db.models import Func, IntegerField
-from django.db.models.functions import Replace
+from django.db.models.functions import Replace, Substr
 from django.db.models import Count, Q, Sum, F
 
 
@@ -33,6 +51,12 @@ class Newspaper(models.Model):
         return self.title
 
 
+# columns shown in article lists
+LISTING_FIELDS = ("title", "author", "language", "published_year", "newspaper__title")
+# characters of the content fetched for the excerpts of article lists, enough for 80 words
+EXCERPT_LENGTH = 1000
+
+
 class ArticleQuerySet(QuerySet):
     # def search(self, query: str) -> List[SearchResultItem]:
     def search(self, query: str, language: int, year: str | None = None) -> QuerySet:
@@ -49,9 +73,38 @@ class ArticleQuerySet(QuerySet):
         """
         # queryset = self.filter(content__icontains=query)
         # return [SearchResultItem(article=article, frequency=article.frequency(query)) for article in queryset]
+        # the text of long articles continues in their chunks
+        matches = Q(content__icontains=query) | Q(
+            pk__in=ArticleChunk.objects.filter(content__icontains=query).values("article_id")
+        )
+        if year is None:
+            return self.filter(matches, language=language)
+        return self.filter(matches, language=language, published_year__year=year)
+
+    def with_terms(self, words: list[str], language: int, year: str | None = None) -> QuerySet:
+        """
+        Articles containing any of the given vocabulary words, found through
+        the postings of the search index instead of scanning the content
+        """
+        postings = Posting.objects.filter(term__language=language, term__word__in=words).values("article_id")
+        queryset = self.filter(pk__in=postings, language=language)
         if year is None:
-            return self.filter(content__icontains=query, language=language)
-        return self.filter(content__icontains=query, language=language, published_year__year=year)
+            return queryset
+        return queryset.filter(published_year__year=year)
+
+    def in_subcorpus(self, subcorpus: int | None) -> QuerySet:
+        """Articles of the saved subcorpus, all of them when `subcorpus` is None"""
+        if subcorpus is None:
+            return self
+        return self.filter(subcorpora=subcorpus)
+
+    def listing(self) -> QuerySet:
+        """Articles for lists of links: the listed columns and the newspaper title, never the content"""
+        return self.select_related("newspaper").only(*LISTING_FIELDS)
+
+    def with_excerpt(self, length: int = EXCERPT_LENGTH) -> QuerySet:
+        """`listing` with the first `length` characters of the content as `excerpt`"""
+        return self.listing().annotate(excerpt=Substr("content", 1, length))
 
 
 class ArticleManager(models.Manager):
@@ -61,7 +114,16 @@ class ArticleManager(models.Manager):
         """
         return ArticleQuerySet(self.model, using=self._db)
 
-    def search(self, query: str, language: int, year: str | None = None) -> SearchResult:
+    @track("search")
+    def search(
+        self,
+        query: str,
+        language: int,
+        year: str | None = None,
+        variants: bool = False,
+        fuzzy: int = 0,
+        subcorpus: int | None = None,
+    ) -> SearchResult:
         """
         Search articles for the given query string and return a dictionary of search results,
         where the dictionary contains the query string, a list of SearchResultItem objects,
@@ -69,12 +131,31 @@ class ArticleManager(models.Manager):
 
         Args:
             query (str): The search query string.
+            variants (bool): Match every spelling variant of the query word
+                (apostrophes, case, Cyrillic) instead of substrings.
+            fuzzy (int): Also match vocabulary words within this many edits.
+            subcorpus (int): Only search the articles of this saved subcorpus.
+
+        Wildcard (`kitob*`, `*lar`, `o?qituvchi`) and `/regex/` queries are
+        matched against the vocabulary, see `parse_pattern`, and every
+        matching word (at most ``settings.TERM_EXPANSION_LIMIT``) is an exact match.
 
         Returns:
             SearchResult: A dictionary of search results.
+
+        Raises:
+            ValueError: if the query is an invalid pattern.
         """
         query = query.strip()
-        queryset = self.get_queryset().search(query, language, year)
+        pattern = parse_pattern(query)
+        if pattern or variants or fuzzy:
+            words, exact = self._expand(get_vocabulary(language), query, pattern, fuzzy)
+            articles = list(self.get_queryset().with_terms(words, language, year).in_subcorpus(subcorpus))
+            contents, owners = self._texts(articles, matching_chunks(articles, words=words))
+            found = search_terms_contents(contents, words, exact, padding=10)
+            return self._search_result(query, articles, merge_search_results(len(articles), owners, found))
+
+        queryset = self.get_queryset().search(query, language, year).in_subcorpus(subcorpus)
 
         # total_frequency = sum([article.frequency(query) for article in queryset])
         # results = [SearchResultItem(article=article, frequency=article.frequency(query)) for article in queryset]
@@ -82,11 +163,122 @@ class ArticleManager(models.Manager):
 
         # total_frequency = sum([search_word(article.content, query)['count'] for article in queryset])
         # queryset
+        articles = list(queryset)
+        contents, owners = self._texts(articles, matching_chunks(articles, query=query))
+        found = [search_word(content, query, padding=10) for content in contents]
+        return self._search_result(query, articles, merge_search_results(len(articles), owners, found))
+
+    async def asearch(
+        self,
+        query: str,
+        language: int,
+        year: str | None = None,
+        variants: bool = False,
+        fuzzy: int = 0,
+        subcorpus: int | None = None,
+    ) -> SearchResult:
+        """
+        Async version of `search`, articles are fetched with the async ORM and
+        tokenized in the search worker pool
+        """
+        query = query.strip()
+        pattern = parse_pattern(query)
+        if pattern or variants or fuzzy:
+            vocabulary = await sync_to_async(get_vocabulary)(language)
+            words, exact = await sync_to_async(self._expand, thread_sensitive=False)(vocabulary, query, pattern, fuzzy)
+            queryset = self.get_queryset().with_terms(words, language, year)
+            func, args, chunk_filter = search_terms_contents, (words, exact), {"words": words}
+        else:
+            queryset = self.get_queryset().search(query, language, year)
+            func, args, chunk_filter = search_contents, (query,), {"query": query}
+        articles = [article async for article in queryset.in_subcorpus(subcorpus).select_related("newspaper")]
+        chunks = await sync_to_async(matching_chunks)(articles, **chunk_filter)
+        contents, owners = self._texts(articles, chunks)
+        found = await run_in_pool(SEARCH, func, contents, *args, padding=10)
+        return self._search_result(query, articles, merge_search_results(len(articles), owners, found))
+
+    def concordance(
+        self,
+        query: str,
+        language: int,
+        year_from: int | None = None,
+        year_to: int | None = None,
+        variants: bool = False,
+        padding: int = 10,
+        subcorpus: int | None = None,
+    ) -> Iterator[ConcordanceLine]:
+        """
+        Every occurrence of the query word (or of the words matching a
+        wildcard or regex query, or its spelling variants) with its context.
+        The terms are resolved right away, so an invalid pattern raises
+        ValueError here; the lines are generated lazily, reading the matching
+        articles through a server-side cursor.
+        """
+        query = query.strip()
+        pattern = parse_pattern(query)
+        if pattern or variants:
+            words, _ = self._expand(get_vocabulary(language), query, pattern, 0)
+        else:
+            words = [query.lower()]
+        queryset = self.get_queryset().with_terms(words, language).in_subcorpus(subcorpus)
+        if year_from:
+            queryset = queryset.filter(published_year__year__gte=year_from)
+        if year_to:
+            queryset = queryset.filter(published_year__year__lte=year_to)
+        queryset = (
+            queryset.select_related("newspaper")
+            .only("published_year", "content", "chunk_count", "newspaper__title")
+            .order_by("published_year", "pk")
+        )
+        return self._concordance(queryset, set(words), padding)
+
+    def _concordance(self, queryset, words: set[str], padding: int) -> Iterator[ConcordanceLine]:
+        for article in queryset.iterator(chunk_size=100):
+            texts = [article.content, *matching_chunks([article], words=list(words)).get(article.pk, ())]
+            year = article.published_year.year if article.published_year else None
+            for text in texts:
+                for left, keyword, right in concordance_lines(text, words, padding):
+                    yield ConcordanceLine(
+                        article_id=article.pk,
+                        newspaper=article.newspaper.title,
+                        year=year,
+                        left=left,
+                        keyword=keyword,
+                        right=right,
+                    )
+
+    def search_words(self, query: str, language: int, variants: bool = False, fuzzy: int = 0) -> list[str] | None:
+        """
+        Vocabulary words a `search` matches whole, to highlight them in the
+        results, None when it matches substrings of the query
+        """
+        query = query.strip()
+        pattern = parse_pattern(query)
+        if pattern or variants or fuzzy:
+            return self._expand(get_vocabulary(language), query, pattern, fuzzy)[0]
+        return None
+
+    def _expand(self, vocabulary, query: str, pattern, fuzzy: int) -> tuple[list[str], list[str]]:
+        """Vocabulary words the query stands for and those of them that are exact matches"""
+        if pattern:
+            words = vocabulary.match(pattern)
+            return words, words
+        return vocabulary.expand(query, fuzzy), [query.lower()]
+
+    def _texts(self, articles: list, chunks: dict[int, list[str]]) -> tuple[list[str], list[int]]:
+        """Texts to search, the content of every article and the matching chunks of long ones, and their article"""
+        contents, owners = [], []
+        for i, article in enumerate(articles):
+            for content in [article.content, *chunks.get(article.pk, ())]:
+                contents.append(content)
+                owners.append(i)
+        return contents, owners
+
+    def _search_result(self, query: str, articles: list, found: list) -> SearchResult:
         total_frequency = 0
         results = []
 
-        for article in queryset:
-            search_result = search_word(article.content, query, padding=10)
+        for article, search_result in zip(articles, found):
             results.append(
                 SearchResultItem(
                     article=article, frequency=search_result["frequency"], locations=search_result["locations"]
@@ -131,10 +323,14 @@ class ArticleManager(models.Manager):
     #             return []
     #     return Article.objects.bulk_create(articles)
 
-    def create_from_csv(self, csv_file: UploadedFile):
+    def create_from_csv(self, csv_file: UploadedFile, duplicates: str | None = None):
         """
-        Create articles from csv file
+        Create articles from csv file, see `import_articles` for `duplicates`.
+        Their similar articles are found in the background, rebuilding the
+        TF-IDF matrix takes too long for the upload request.
         """
+        from main_app.similarity import add_similar
+
         # read csv file
         import csv
         # Use a TextIOWrapper to handle newlines within cells
@@ -157,11 +353,68 @@ class ArticleManager(models.Manager):
                         # issue_number=row["issue_number"],
                     )
                 )
+                words = row["content"].split()
+                articles[-1].word_count_total = len(words)
+                articles[-1].word_count_unique = len(set(words))
+                # the signature is computed from the first chunk of long texts
+                split_article(articles[-1])
+                articles[-1].minhash = minhash(articles[-1].content)
             except Exception as e:
                 print(row)
                 print(e)
                 return []
-        return Article.objects.bulk_create(articles)
+        articles = self.import_articles(articles, duplicates=duplicates, similar=False)
+        if articles:
+            run_in_background(add_similar, articles)
+        return articles
+
+    def import_articles(
+        self,
+        articles: list,
+        postings: list[dict[str, list[int]]] | None = None,
+        duplicates: str | None = None,
+        similar: bool = True,
+    ) -> list:
+        """
+        Save new articles in bulk and index them. Near-duplicates of stored
+        articles or of earlier ones are skipped (left unsaved) or flagged
+        (`duplicate_of`) depending on `duplicates`, "skip", "flag" or "keep",
+        ``settings.DUPLICATE_POLICY`` by default. `postings` may hold
+        precomputed `article_postings` results in the same order as `articles`.
+        `add_similar` rebuilds the TF-IDF matrix: batches of one import pass
+        ``similar=False`` and call it once with all their articles, uploads
+        call it in the background.
+        """
+        # numpy and scipy load on the first import, not when workers boot
+        from main_app.similarity import add_similar
+
+        policy = duplicates or settings.DUPLICATE_POLICY
+        originals = find_duplicates(articles) if policy != "keep" else [None] * len(articles)
+        if postings is None:
+            postings = [None] * len(articles)
+        if policy == "skip":
+            kept = [i for i, original in enumerate(originals) if original is None]
+            articles, postings = [articles[i] for i in kept], [postings[i] for i in kept]
+        articles = Article.objects.bulk_create(articles)
+        if policy == "flag":
+            flagged = []
+            for article, original in zip(articles, originals):
+                if original is not None:
+                    article.duplicate_of_id = original.pk
+                    flagged.append(article)
+            Article.objects.bulk_update(flagged, ["duplicate_of"])
+        # bulk_create sends no post_save signals
+        if None in postings:
+            postings = None
+        index_articles(articles, postings)
+        store_chunks(articles)
+        store_bands(articles)
+        if similar:
+            add_similar(articles)
+        refresh_slices(article_slices([article.pk for article in articles]))
+        add_articles([article.pk for article in articles])
+        CorpusState.bump()
+        return articles
         
     def to_csv(self) -> HttpResponse:
         """
@@ -173,13 +426,13 @@ class ArticleManager(models.Manager):
         response["Content-Disposition"] = 'attachment; filename="articles.csv"'
         writer = csv.writer(response)
         writer.writerow(["title", "author", "newspaper", "content", "published_year", "language", "issue_number"])
-        for article in self.all():
+        for article in self.select_related("newspaper").iterator(chunk_size=500):
             writer.writerow(
                 [
                     article.title,
                     article.author,
                     article.newspaper.title,
-                    article.content,
+                    article.full_text(),
                     article.published_year,
                     article.language,
                     article.issue_number,
@@ -209,7 +462,7 @@ class ArticleManager(models.Manager):
         """
         Return 3 random newspapers
         """
-        return self.order_by("?")[:4]
+        return self.get_queryset().with_excerpt().order_by("?")[:4]
 
     def year_list(self):
         """
@@ -241,6 +494,18 @@ class Article(models.Model):
     
     word_count_total = models.IntegerField(null=True, blank=True, default=None)
     word_count_unique = models.IntegerField(null=True, blank=True, default=None)
+
+    # number of `ArticleChunk` rows the text continues in, see `main_app.chunks`
+    chunk_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # MinHash signature of the content and the article it nearly duplicates, see `main_app.duplicates`
+    minhash = models.BinaryField(null=True, editable=False)
+    duplicate_of = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="duplicates"
+    )
+
+    # HyperLogLog sketch of the index terms, see `main_app.hyperloglog`
+    word_sketch = models.BinaryField(null=True, editable=False)
     
     objects = ArticleManager()
 
@@ -248,20 +513,43 @@ class Article(models.Model):
         return self.title
 
     def save(self, *args, **kwargs):
+        # long texts keep only their first chunk in content
+        split_article(self)
+        text = self.full_text()
+
         # Calculate word_count_total
-        self.word_count_total = len(self.content.split())
+        self.word_count_total = len(text.split())
 
         # Calculate word_count_unique
-        unique_words = set(self.content.split())
+        unique_words = set(text.split())
         self.word_count_unique = len(unique_words)
 
-        super(Article, self).save(*args, **kwargs)
+        self.minhash = minhash(self.content)
+
+        # the post_save signal moves the counts of the article between the saved
+        # subcorpora and reindexes it, all of it commits with the row
+        with transaction.atomic():
+            super(Article, self).save(*args, **kwargs)
+
+    def texts(self) -> list[str]:
+        """
+        The content followed by the chunks of long texts
+        """
+        pending = getattr(self, "_chunks", None)
+        if pending is not None:
+            return [self.content, *pending]
+        if not self.chunk_count:
+            return [self.content]
+        return [self.content, *self.chunks.values_list("content", flat=True)]
+
+    def full_text(self) -> str:
+        return "".join(self.texts())
 
     def frequency(self, word: str):
         """
         Get word frequency of the article
         """
-        return self.content.lower().count(word.lower())
+        return self.full_text().lower().count(word.lower())
         # freq = get_word_frequency(word, self.content)
         # return freq
 
@@ -269,6 +557,251 @@ class Article(models.Model):
         ordering = ["-published_year", "newspaper"]
 
 
+class ArticleChunk(models.Model):
+    """
+    DB model for the continuation of a long text, see `main_app.chunks`:
+    ArticleChunk:
+        - article
+        - number, the article content is chunk 0
+        - character and token offsets of the chunk in the whole text
+        - text of the chunk
+        - word count and word frequencies as counted by `WordCounter`
+    """
+
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="chunks")
+    number = models.PositiveIntegerField()
+    start = models.PositiveBigIntegerField()
+    start_token = models.PositiveBigIntegerField()
+    content = models.TextField()
+    word_count = models.PositiveIntegerField()
+    word_freq = models.JSONField()
+
+    class Meta:
+        ordering = ["number"]
+        constraints = [models.UniqueConstraint(fields=["article", "number"], name="unique_chunk_number")]
+
+
+class Term(models.Model):
+    """
+    DB model for the vocabulary of the search index:
+    Term:
+        - lowercased word as tokenized by `index_tokenize`
+        - spelling-variant key of the word, see `normalize_term`
+        - language
+        - total number of occurrences in the corpus
+        - number of articles containing the word
+    """
+
+    word = models.CharField(max_length=100)
+    normalized = models.CharField(max_length=200, db_index=True, default="")
+    language = models.PositiveSmallIntegerField(choices=((Article.ENGLISH, "English"), (Article.UZBEK, "Uzbek")))
+    frequency = models.PositiveIntegerField(default=0)
+    document_frequency = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.word
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["language", "word"], name="unique_term_per_language")]
+
+
+class Posting(models.Model):
+    """
+    DB model for the occurrences of a term in an article:
+    Posting:
+        - term
+        - article
+        - number of occurrences
+        - token positions, packed as unsigned 32 bit integers (see `main_app.indexing`)
+    """
+
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name="postings")
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="postings")
+    frequency = models.PositiveIntegerField()
+    positions = models.BinaryField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["term", "article"], name="unique_posting")]
+
+
+class MinHashBand(models.Model):
+    """
+    DB model for the locality sensitive hashing buckets of article signatures:
+    MinHashBand:
+        - article
+        - band number of the signature
+        - hash of the band values
+    """
+
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="bands")
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["band", "bucket"], name="minhash_band_bucket")]
+
+
+class SimilarArticle(models.Model):
+    """
+    DB model for the precomputed "more like this" neighbors of an article:
+    SimilarArticle:
+        - article
+        - neighbor article of the same language
+        - TF-IDF cosine similarity
+        - rank of the neighbor, 1 is the most similar
+    """
+
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="similar")
+    neighbor = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["rank"]
+        indexes = [models.Index(fields=["article", "rank"], name="similar_article_rank")]
+
+
+class SourceRecord(models.Model):
+    """
+    DB model for the rows ingested from source files, see `main_app.ingest`:
+    SourceRecord:
+        - source file name
+        - key of the row in the source
+        - digest of the row values when it was ingested
+        - article created from the row, empty if it was skipped as a duplicate
+    """
+
+    source = models.CharField(max_length=255)
+    key = models.CharField(max_length=40)
+    digest = models.CharField(max_length=40)
+    article = models.ForeignKey(Article, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["source", "key"], name="unique_source_row")]
+
+
+class CorpusSlice(models.Model):
+    """
+    DB model for the precomputed term frequencies of the articles sharing a
+    language, year and newspaper, see `main_app.slices`:
+    CorpusSlice:
+        - language
+        - publication year, 0 when unknown
+        - newspaper
+        - number of articles and of tokens
+        - ids of the terms occurring in the slice and their frequencies, packed as unsigned 32 bit integers
+        - HyperLogLog sketch of the terms
+    """
+
+    language = models.PositiveSmallIntegerField(choices=((Article.ENGLISH, "English"), (Article.UZBEK, "Uzbek")))
+    year = models.PositiveSmallIntegerField(default=0)
+    newspaper = models.ForeignKey(Newspaper, on_delete=models.CASCADE, related_name="+")
+    article_count = models.PositiveIntegerField(default=0)
+    token_count = models.PositiveBigIntegerField(default=0)
+    term_ids = models.BinaryField()
+    counts = models.BinaryField()
+    word_sketch = models.BinaryField(default=b"")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["language", "year", "newspaper"], name="unique_corpus_slice")]
+
+
+class Subcorpus(models.Model):
+    """
+    DB model for a saved subcorpus and its materialized statistics, see `main_app.subcorpora`:
+    Subcorpus:
+        - name and owner
+        - filter definition: language, year range and newspapers (all when empty)
+        - seed, words per year and tolerance of a balanced sample, see `main_app.sampling`
+        - member articles, fixed for a sample
+        - number of articles and of tokens
+        - term and bigram counts, packed like `CorpusSlice`
+        - when the statistics were computed, empty while they are pending
+    """
+
+    name = models.CharField(max_length=200)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="subcorpora"
+    )
+    language = models.PositiveSmallIntegerField(choices=((Article.ENGLISH, "English"), (Article.UZBEK, "Uzbek")))
+    year_from = models.PositiveSmallIntegerField(null=True, blank=True)
+    year_to = models.PositiveSmallIntegerField(null=True, blank=True)
+    newspapers = models.ManyToManyField(Newspaper, blank=True, related_name="+")
+    seed = models.PositiveIntegerField(null=True, blank=True)
+    words_per_year = models.PositiveIntegerField(null=True, blank=True)
+    tolerance = models.FloatField(null=True, blank=True)
+    articles = models.ManyToManyField(Article, blank=True, editable=False, related_name="subcorpora")
+    article_count = models.PositiveIntegerField(default=0)
+    token_count = models.PositiveBigIntegerField(default=0)
+    term_ids = models.BinaryField(default=b"")
+    counts = models.BinaryField(default=b"")
+    bigram_keys = models.BinaryField(default=b"")
+    bigram_counts = models.BinaryField(default=b"")
+    created = models.DateTimeField(auto_now_add=True)
+    materialized = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name_plural = "subcorpora"
+
+    def __str__(self):
+        return self.name
+
+
+class CorpusState(models.Model):
+    """
+    Single row holding the corpus generation: a counter bumped whenever
+    articles are created, changed or deleted. Caches of derived data (search
+    results, vocabularies) include it in their keys to stay valid.
+    """
+
+    generation = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls) -> int:
+        return cls.objects.filter(pk=1).values_list("generation", flat=True).first() or 0
+
+    @classmethod
+    async def acurrent(cls) -> int:
+        return await cls.objects.filter(pk=1).values_list("generation", flat=True).afirst() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(generation=F("generation") + 1):
+            cls.objects.get_or_create(pk=1, defaults={"generation": 1})
+
+
+class RequestProfile(models.Model):
+    """
+    DB model for storing a sampled profile of a single request:
+    RequestProfile:
+        - request method, path and resolved view name
+        - wall clock duration and sampling interval in seconds
+        - call tree and top functions built from the stack samples
+        - SQL statements with durations and EXPLAIN for the slowest ones
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=1000)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration = models.FloatField()
+    interval = models.FloatField()
+    sample_count = models.PositiveIntegerField()
+    call_tree = models.JSONField()
+    top_functions = models.JSONField()
+    queries = models.JSONField()
+
+    def __str__(self):
+        return f"{self.method} {self.path}"
+
+    class Meta:
+        ordering = ["-created"]
+
+
 # class ArticleWordFrequency(models.Model):
 #     """
 #     DB model for storing article word frequency info:
@@ -290,13 +823,16 @@ class Article(models.Model):
 
 
 def create_frequency_csv(articles: QuerySet[Article], filename="frequency.csv"):
+    return frequency_csv_response(frequency_stats(articles), filename)
+
+
+def frequency_csv_response(frequency: FrequencyStats, filename="frequency.csv") -> HttpResponse:
     import csv
 
     response = HttpResponse(content_type="text/csv")
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
     writer = csv.writer(response)
     writer.writerow(["frequency", "word"])
-    frequency = frequency_stats(articles)
     for stat in frequency:
         writer.writerow([stat["count"], stat["word"]])
     return response
@@ -0,0 +1,130 @@
+"""
+Uzbek spelling normalization and fuzzy matching of vocabulary terms.
+
+The corpus mixes o‘/o'/o`/oʻ (and the same for g‘), upper and lower case and
+older Cyrillic spellings. `normalize_term` folds all of them into one key that
+is stored with every `Term` at index time, so spelling variants are found with
+one indexed lookup. `BKTree` finds keys within a small edit distance.
+"""
+from django.conf import settings
+
+APOSTROPHES = "'`‘’ʻʼ"
+_FOLD_APOSTROPHES = str.maketrans({char: "'" for char in APOSTROPHES})
+
+VOWELS = set("аеёиоуўэюяaeiou")
+
+# official Uzbek Cyrillic to Latin mapping, е is handled in `transliterate`
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "ғ": "g'", "д": "d", "ё": "yo", "ж": "j",
+    "з": "z", "и": "i", "й": "y", "к": "k", "қ": "q", "л": "l", "м": "m", "н": "n",
+    "о": "o", "ў": "o'", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f",
+    "х": "x", "ҳ": "h", "ц": "s", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "'", "ь": "",
+    "ы": "i", "э": "e", "ю": "yu", "я": "ya",
+}
+
+
+def transliterate(word: str) -> str:
+    """Uzbek Cyrillic to Latin, `е` is `ye` at the start of a word and after vowels"""
+    letters = []
+    for i, char in enumerate(word):
+        if char == "е":
+            letters.append("ye" if i == 0 or word[i - 1] in VOWELS else "e")
+        else:
+            letters.append(CYRILLIC_TO_LATIN.get(char, char))
+    return "".join(letters)
+
+
+def normalize_term(word: str) -> str:
+    """
+    Spelling-variant key of a word: case folded, every apostrophe-like sign
+    replaced by ', optionally transliterated from Cyrillic
+    """
+    word = word.casefold()
+    if settings.TRANSLITERATE_CYRILLIC:
+        word = transliterate(word)
+    return word.translate(_FOLD_APOSTROPHES)
+
+
+class EditDistance:
+    """
+    Levenshtein distance from a fixed word, computed with the bit-parallel
+    algorithm of Myers and Hyyrö: one pass over the other word with a few
+    integer operations per character instead of a full DP matrix
+    """
+
+    def __init__(self, word: str):
+        self.word = word
+        self.length = len(word)
+        self.peq: dict[str, int] = {}
+        for i, char in enumerate(word):
+            self.peq[char] = self.peq.get(char, 0) | (1 << i)
+        self.mask = (1 << self.length) - 1
+        self.last = 1 << (self.length - 1) if self.length else 0
+
+    def to(self, other: str) -> int:
+        if not self.length:
+            return len(other)
+        peq, mask, last = self.peq, self.mask, self.last
+        pv, mv, score = mask, 0, self.length
+        for char in other:
+            eq = peq.get(char, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = (ph << 1) | 1
+            mh <<= 1
+            pv = (mh | ~(xv | ph)) & mask
+            mv = ph & xv & mask
+        return score
+
+
+def levenshtein(a: str, b: str) -> int:
+    return EditDistance(a).to(b)
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over edit distance, a query only visits the subtrees
+    whose distance to their parent can still be within the tolerance
+    """
+
+    def __init__(self, words=()):
+        self.root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        distance_from = EditDistance(word)
+        node = self.root
+        while True:
+            distance = distance_from.to(node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word: str, tolerance: int) -> list[tuple[int, str]]:
+        """(distance, word) of every word within `tolerance` edits of `word`"""
+        distance_from = EditDistance(word)
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_word, children = stack.pop()
+            distance = distance_from.to(node_word)
+            if distance <= tolerance:
+                found.append((distance, node_word))
+            for child_distance, child in children.items():
+                if distance - tolerance <= child_distance <= distance + tolerance:
+                    stack.append(child)
+        return sorted(found)
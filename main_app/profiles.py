@@ -0,0 +1,273 @@
+"""
+Word profiles assembled from the search index.
+
+The profile of a word shows, per language it occurs in, its frequency per
+million tokens overall and by year and newspaper, its collocates and a few
+concordance lines. The counts are one grouped query over the postings of the
+term divided by the token counts of the corpus slices. The occurrences are
+the positions stored in the postings of the term, and the tokens around them
+are read at those offsets from the token column of the corpus snapshot when
+it is current, and otherwise from the tokens of the articles containing the
+word rebuilt from their postings, of at most ``COLLOCATE_ARTICLES`` articles
+where it occurs most often. Both give the same collocates and lines for words
+in fewer articles. No text is tokenized at request time. Flagged duplicates
+are left out.
+"""
+
+import numpy as np
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, ExtractYear
+
+from main_app.snapshot import get_snapshot
+from main_app.types import Collocate, ProfileCount, ProfileLine, WordProfile
+
+# tokens on either side of the word counted as its collocates
+COLLOCATE_WINDOW = 4
+COLLOCATES = 20
+# co-occurrences a collocate needs
+MIN_COLLOCATE_COUNT = 2
+# articles whose tokens are rebuilt from their postings without a current
+# snapshot, and how many of them are read at once
+COLLOCATE_ARTICLES = 2000
+ARTICLE_BATCH_SIZE = 500
+SAMPLE_LINES = 5
+# tokens on either side of the word in the sample lines
+LINE_CONTEXT = 10
+
+
+def _per_million(count: int, tokens: int) -> float:
+    return count / tokens * 1_000_000 if tokens else 0.0
+
+
+def _distribution(term) -> tuple[list[ProfileCount], list[ProfileCount], int, int, int]:
+    """Occurrences of the term by year and by newspaper, its total, articles and the tokens of its language"""
+    from main_app.models import CorpusSlice, Posting
+
+    slices = CorpusSlice.objects.filter(language=term.language)
+    year_tokens = dict(slices.values("year").annotate(tokens=Sum("token_count")).values_list("year", "tokens"))
+    newspaper_tokens = {
+        (newspaper_id, title): tokens
+        for newspaper_id, title, tokens in slices.values("newspaper_id", "newspaper__title")
+        .annotate(tokens=Sum("token_count"))
+        .values_list("newspaper_id", "newspaper__title", "tokens")
+    }
+    rows = (
+        Posting.objects.filter(term=term, article__duplicate_of=None)
+        .annotate(year=Coalesce(ExtractYear("article__published_year"), 0), newspaper_id=F("article__newspaper_id"))
+        .values("year", "newspaper_id")
+        .annotate(count=Sum("frequency"), articles=Count("article_id"))
+        .values_list("year", "newspaper_id", "count", "articles")
+        .order_by()
+    )
+    by_year, by_newspaper, articles = {}, {}, 0
+    for year, newspaper_id, count, article_count in rows:
+        by_year[year] = by_year.get(year, 0) + count
+        by_newspaper[newspaper_id] = by_newspaper.get(newspaper_id, 0) + count
+        articles += article_count
+    years = [
+        ProfileCount(
+            key=year, count=by_year.get(year, 0), tokens=tokens, per_million=_per_million(by_year.get(year, 0), tokens)
+        )
+        for year, tokens in sorted(year_tokens.items())
+        if year
+    ]
+    newspapers = [
+        ProfileCount(
+            key=title,
+            count=by_newspaper.get(newspaper_id, 0),
+            tokens=tokens,
+            per_million=_per_million(by_newspaper.get(newspaper_id, 0), tokens),
+        )
+        for (newspaper_id, title), tokens in newspaper_tokens.items()
+    ]
+    newspapers.sort(key=lambda row: -row["per_million"])
+    return years, newspapers, sum(by_year.values()), articles, sum(year_tokens.values())
+
+
+def _postings(term) -> tuple[np.ndarray, np.ndarray]:
+    """Article id and position of every occurrence of the term, ordered by article and position"""
+    from main_app.models import Posting
+
+    article_ids, positions = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for article_id, packed in (
+        Posting.objects.filter(term=term, article__duplicate_of=None)
+        .order_by("article_id")
+        .values_list("article_id", "positions")
+        .iterator(chunk_size=2000)
+    ):
+        found = np.sort(np.frombuffer(packed, dtype=np.uint32)).astype(np.int64)
+        positions.append(found)
+        article_ids.append(np.full(len(found), article_id, dtype=np.int64))
+    return np.concatenate(article_ids), np.concatenate(positions)
+
+
+def _windows(tokens, starts, ends, found) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Tokens up to `LINE_CONTEXT` before and after the occurrences at indexes
+    `found` of the column, one row per occurrence, and the mask of the ones
+    inside the article of the occurrence (0 outside it)
+    """
+    index = found[:, None] + np.arange(-LINE_CONTEXT, LINE_CONTEXT + 1)
+    inside = (index >= starts[:, None]) & (index < ends[:, None])
+    windows = np.asarray(tokens[np.where(inside, index, found[:, None])], dtype=np.uint32)
+    windows[~inside] = 0
+    return windows, inside
+
+
+def _posting_windows(article_ids, positions) -> tuple[np.ndarray, np.ndarray]:
+    """`_windows` of the occurrences in the tokens of their articles rebuilt from the postings"""
+    from main_app.models import Posting
+
+    ids = np.unique(article_ids)
+    windows = [np.zeros((0, 2 * LINE_CONTEXT + 1), dtype=np.uint32)]
+    inside = [np.zeros((0, 2 * LINE_CONTEXT + 1), dtype=bool)]
+    for start in range(0, len(ids), ARTICLE_BATCH_SIZE):
+        batch = ids[start : start + ARTICLE_BATCH_SIZE]
+        texts = {}
+        for article_id, term_id, packed in Posting.objects.filter(article_id__in=batch.tolist()).values_list(
+            "article_id", "term_id", "positions"
+        ):
+            texts.setdefault(article_id, []).append((term_id, np.frombuffer(packed, dtype=np.uint32)))
+        tokens, offsets = [np.zeros(0, dtype=np.uint32)], [0]
+        for article_id in batch.tolist():
+            text = np.zeros(max(int(found.max()) for _, found in texts[article_id]) + 1, dtype=np.uint32)
+            for term_id, found in texts[article_id]:
+                text[found] = term_id
+            tokens.append(text)
+            offsets.append(offsets[-1] + len(text))
+        offsets = np.array(offsets, dtype=np.int64)
+        first, last = np.searchsorted(article_ids, batch[0]), np.searchsorted(article_ids, batch[-1], side="right")
+        rows = np.searchsorted(batch, article_ids[first:last])
+        batch_windows, batch_inside = _windows(
+            np.concatenate(tokens), offsets[rows], offsets[rows + 1], offsets[rows] + positions[first:last]
+        )
+        windows.append(batch_windows)
+        inside.append(batch_inside)
+    return np.concatenate(windows), np.concatenate(inside)
+
+
+def _sample(article_ids, positions) -> tuple[np.ndarray, np.ndarray]:
+    """The occurrences in the `COLLOCATE_ARTICLES` articles where the term occurs most often"""
+    ids, counts = np.unique(article_ids, return_counts=True)
+    if len(ids) <= COLLOCATE_ARTICLES:
+        return article_ids, positions
+    kept = np.isin(article_ids, ids[np.argsort(-counts, kind="stable")[:COLLOCATE_ARTICLES]])
+    return article_ids[kept], positions[kept]
+
+
+def _snapshot_rows(snapshot, article_ids) -> np.ndarray | None:
+    """
+    Rows of the articles in the snapshot, None when it no longer matches the
+    corpus: `get_snapshot` answers from a cache and articles saved since have
+    no row or other tokens
+    """
+    from main_app.models import CorpusState
+
+    if not len(snapshot) or snapshot.generation != CorpusState.current():
+        return None
+    rows = np.minimum(np.searchsorted(snapshot.article_ids, article_ids), len(snapshot) - 1)
+    if not np.array_equal(snapshot.article_ids[rows], article_ids):
+        return None
+    return rows
+
+
+def _occurrences(term) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Article id of every occurrence of the term and the `_windows` around them"""
+    article_ids, positions = _postings(term)
+    snapshot = get_snapshot()
+    rows = None if snapshot is None else _snapshot_rows(snapshot, article_ids)
+    if rows is None:
+        article_ids, positions = _sample(article_ids, positions)
+        return article_ids, *_posting_windows(article_ids, positions)
+    # only the rows of the snapshot are read, not the whole offsets column
+    starts = snapshot.token_offsets[rows].astype(np.int64)
+    ends = snapshot.token_offsets[rows + 1].astype(np.int64)
+    return article_ids, *_windows(snapshot.tokens, starts, ends, starts + positions)
+
+
+def _collocates(term, windows, inside) -> tuple[np.ndarray, np.ndarray]:
+    """Term ids within the window of the occurrences and their numbers of co-occurrences"""
+    columns = [LINE_CONTEXT + shift for shift in range(-COLLOCATE_WINDOW, COLLOCATE_WINDOW + 1) if shift]
+    neighbours = windows[:, columns][inside[:, columns]]
+    neighbours = neighbours[(neighbours != 0) & (neighbours != term.pk)]
+    term_ids, counts = np.unique(neighbours, return_counts=True)
+    kept = counts >= MIN_COLLOCATE_COUNT
+    return term_ids[kept], counts[kept]
+
+
+def _lines(article_ids, windows, inside) -> list[tuple[int, np.ndarray, np.ndarray]]:
+    """Article id and the tokens left and right of occurrences in up to `SAMPLE_LINES` articles"""
+    _, first = np.unique(article_ids, return_index=True)
+    if not len(first):
+        return []
+    picked = first[np.unique(np.linspace(0, len(first) - 1, min(SAMPLE_LINES, len(first))).round().astype(int))]
+    left, right = slice(None, LINE_CONTEXT), slice(LINE_CONTEXT + 1, None)
+    return [
+        (int(article_ids[row]), windows[row, left][inside[row, left]], windows[row, right][inside[row, right]])
+        for row in picked.tolist()
+    ]
+
+
+def _profile(term) -> WordProfile:
+    from main_app.models import Article, Term
+
+    years, newspapers, total, articles, language_tokens = _distribution(term)
+    article_ids, windows, inside = _occurrences(term)
+    collocate_ids, co_counts = _collocates(term, windows, inside)
+    # score the most frequent co-occurrences only
+    best = np.argsort(-co_counts, kind="stable")[: COLLOCATES * 10]
+    collocate_ids, co_counts = collocate_ids[best], co_counts[best]
+    lines = _lines(article_ids, windows, inside)
+    wanted = set(collocate_ids.tolist()) | {int(token) for line in lines for part in line[1:] for token in part}
+    terms = {
+        pk: (word, frequency)
+        for pk, word, frequency in Term.objects.filter(pk__in=wanted).values_list("pk", "word", "frequency")
+    }
+    collocates = []
+    for term_id, count in zip(collocate_ids.tolist(), co_counts.tolist()):
+        word, frequency = terms.get(term_id, ("", 0))
+        # logDice, 14 at most, independent of the corpus size
+        log_dice = 14 + np.log2(2 * count / (term.frequency + frequency)) if term.frequency + frequency else 0.0
+        collocates.append(Collocate(word=word, count=count, frequency=frequency, log_dice=round(float(log_dice), 2)))
+    collocates = sorted(collocates, key=lambda collocate: -collocate["log_dice"])[:COLLOCATES]
+    titles = {
+        pk: (title, year.year if year else None)
+        for pk, title, year in Article.objects.filter(pk__in=[line[0] for line in lines]).values_list(
+            "pk", "title", "published_year"
+        )
+    }
+
+    def words(part) -> str:
+        return " ".join(terms.get(int(token), ("…", 0))[0] if token else "…" for token in part)
+
+    return WordProfile(
+        word=term.word,
+        language=term.language,
+        frequency=total,
+        articles=articles,
+        per_million=_per_million(total, language_tokens),
+        years=years,
+        newspapers=newspapers,
+        collocates=collocates,
+        lines=[
+            ProfileLine(
+                article_id=article_id,
+                title=titles.get(article_id, ("", None))[0],
+                year=titles.get(article_id, ("", None))[1],
+                left=words(left),
+                word=term.word,
+                right=words(right),
+            )
+            for article_id, left, right in lines
+        ],
+    )
+
+
+def word_profiles(word: str, language: int | None = None) -> list[WordProfile]:
+    """Profiles of the word in every language it occurs in, or in `language` only"""
+    from main_app.models import Term
+
+    terms = Term.objects.filter(word=word.strip().lower(), frequency__gt=0).order_by("language")
+    if language:
+        terms = terms.filter(language=language)
+    return [_profile(term) for term in terms]
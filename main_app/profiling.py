@@ -0,0 +1,194 @@
+"""
+On-demand sampling profiler for single requests.
+
+Staff users can add ``?_profile=1`` (or an ``X-Profile: 1`` header) to any
+request. The request then runs while a background thread samples the request
+thread's stack every ``PROFILER_INTERVAL`` seconds, which keeps the overhead
+low enough to use on the live server. The call tree, the hottest functions and
+the request's SQL (with EXPLAIN output for the slowest queries) are stored as
+a ``RequestProfile`` that can be browsed and downloaded from the admin.
+"""
+import sys
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from main_app.instrumentation import current_timings
+
+EXPLAIN_SLOWEST = 5
+TOP_FUNCTIONS = 30
+MAX_TREE_DEPTH = 80
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    """Periodically record the stack of the thread `thread_id`"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: list[tuple[str, ...]] = []
+        self._stop_event = threading.Event()
+        self.started = time.perf_counter()
+        self.stopped = None
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples.append(tuple(reversed(stack)))
+
+    def stop(self):
+        self.stopped = time.perf_counter()
+        self._stop_event.set()
+        self.join()
+
+
+def build_call_tree(samples: list[tuple[str, ...]]) -> dict:
+    """Merge stack samples into a tree of ``{name, samples, children}``"""
+    root = {"name": "<request>", "samples": len(samples), "children": {}}
+    for stack in samples:
+        node = root
+        for name in stack[:MAX_TREE_DEPTH]:
+            child = node["children"].get(name)
+            if child is None:
+                child = node["children"][name] = {"name": name, "samples": 0, "children": {}}
+            child["samples"] += 1
+            node = child
+
+    def freeze(node):
+        children = sorted(node["children"].values(), key=lambda c: -c["samples"])
+        return {"name": node["name"], "samples": node["samples"], "children": [freeze(c) for c in children]}
+
+    return freeze(root)
+
+
+def top_functions(samples: list[tuple[str, ...]], interval: float) -> list[dict]:
+    """Functions ordered by self time, with their cumulative time"""
+    own: dict[str, int] = {}
+    cumulative: dict[str, int] = {}
+    for stack in samples:
+        own[stack[-1]] = own.get(stack[-1], 0) + 1
+        for name in set(stack):
+            cumulative[name] = cumulative.get(name, 0) + 1
+    ranked = sorted(own, key=lambda name: (-own[name], -cumulative[name]))[:TOP_FUNCTIONS]
+    return [
+        {
+            "function": name,
+            "self_ms": round(own[name] * interval * 1000, 1),
+            "cumulative_ms": round(cumulative[name] * interval * 1000, 1),
+        }
+        for name in ranked
+    ]
+
+
+def explain(sql: str, params) -> str:
+    """EXPLAIN output for a SELECT statement"""
+    if not sql.lstrip().upper().startswith("SELECT"):
+        return ""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+
+
+def format_queries(queries: list[tuple[str, tuple, float]]) -> list[dict]:
+    """Serialize the captured SQL and EXPLAIN the slowest statements"""
+    slowest = set(sorted(range(len(queries)), key=lambda i: -queries[i][2])[:EXPLAIN_SLOWEST])
+    result = []
+    for i, (sql, params, duration) in enumerate(queries):
+        result.append(
+            {
+                "sql": sql,
+                "params": [str(p) for p in params or ()],
+                "duration_ms": round(duration * 1000, 2),
+                "explain": explain(sql, params) if i in slowest else "",
+            }
+        )
+    return result
+
+
+def wants_profile(request, user) -> bool:
+    flag = request.GET.get(settings.PROFILER_PARAM) or request.headers.get("X-Profile")
+    return bool(flag) and user is not None and user.is_staff
+
+
+class ProfilerMiddleware:
+    """
+    Profile the request when a staff user asks for it and store the result,
+    the id of the stored profile is returned in the ``X-Profile-Id`` header.
+    For async views the event loop thread is sampled, work handed off to
+    worker pools shows up as time spent waiting.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not wants_profile(request, getattr(request, "user", None)):
+            return self.get_response(request)
+        sampler, first_query = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        return self.save(request, response, sampler, first_query)
+
+    async def __acall__(self, request):
+        user = await request.auser() if hasattr(request, "auser") else None
+        if not wants_profile(request, user):
+            return await self.get_response(request)
+        sampler, first_query = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        return await sync_to_async(self.save)(request, response, sampler, first_query)
+
+    def start(self) -> tuple[Sampler, int]:
+        timings = current_timings()
+        sampler = Sampler(threading.get_ident(), settings.PROFILER_INTERVAL)
+        sampler.start()
+        return sampler, len(timings.queries) if timings else 0
+
+    def save(self, request, response, sampler: Sampler, first_query: int):
+        from main_app.models import RequestProfile
+
+        timings = current_timings()
+        match = getattr(request, "resolver_match", None)
+        profile = RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:1000],
+            view_name=(match.view_name if match else "") or "",
+            user=request.user,
+            status_code=response.status_code,
+            duration=sampler.stopped - sampler.started,
+            interval=sampler.interval,
+            sample_count=len(sampler.samples),
+            call_tree=build_call_tree(sampler.samples),
+            top_functions=top_functions(sampler.samples, sampler.interval),
+            queries=format_queries(timings.queries[first_query:]) if timings else [],
+        )
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
@@ -0,0 +1,219 @@
+"""
+Routing of the read-only analytics queries to a separate database.
+
+Views doing expensive reads (search, frequencies, keyness, exports) are
+decorated with `analytics_reads`: while they run, and while their streamed
+responses are produced, reads go to the "analytics" database alias, a replica
+or a copy of the corpus, so they don't compete with logins and the admin for
+the primary. Writes, reads inside transactions and every other view stay on
+"default". The analytics database is checked with ``SELECT 1`` at most every
+``ANALYTICS_HEALTH_CHECK_SECONDS`` and reads fall back to the primary while it
+fails. A view whose query fails in between is checked again right away and,
+when the analytics database is down, run once more on the primary; streamed
+responses only while none of their content was sent.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from main_app.instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS = "analytics"
+
+_reading = contextvars.ContextVar("analytics_reads", default=False)
+_health = {"up": True, "checked": float("-inf")}
+_check_lock = threading.Lock()
+
+
+def _check() -> bool:
+    connection = connections[ANALYTICS]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return True
+    except DatabaseError:
+        connection.close()
+        return False
+
+
+def analytics_available() -> bool:
+    """Whether the analytics database is configured and passed its last health check"""
+    if ANALYTICS not in settings.DATABASES:
+        return False
+    if time.monotonic() - _health["checked"] < settings.ANALYTICS_HEALTH_CHECK_SECONDS:
+        return _health["up"]
+    # one thread checks, the others go on with the last known state
+    if not _check_lock.acquire(blocking=False):
+        return _health["up"]
+    try:
+        up = _check()
+        if up != _health["up"]:
+            log = logger.info if up else logger.warning
+            log("Analytics database is %s", "back up" if up else "down, reading from the primary")
+        _health.update(up=up, checked=time.monotonic())
+        return up
+    finally:
+        _check_lock.release()
+
+
+@contextmanager
+def reading_analytics():
+    """Send the reads of the enclosed block to the analytics database"""
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def _failed_over() -> bool:
+    """
+    After a failed query, whether the analytics database is down. It is then
+    marked down, so reads go to the primary until the next health check.
+    """
+    if ANALYTICS not in settings.DATABASES:
+        return False
+    with _check_lock:
+        if _check():
+            return False
+        if _health["up"]:
+            logger.warning("Analytics database is down, reading from the primary")
+        _health.update(up=False, checked=time.monotonic())
+    return True
+
+
+def _stream(iterator, restart):
+    iterator, sent = iter(iterator), False
+    while True:
+        # chunks may be produced in different contexts, set the flag for each one
+        with reading_analytics():
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            except DatabaseError:
+                # nothing was sent yet, the view streams again from the primary
+                if sent or restart is None or not _failed_over():
+                    raise
+                iterator, restart = iter(restart().streaming_content), None
+                continue
+        sent = True
+        yield chunk
+
+
+async def _astream(iterator, restart):
+    iterator, sent = aiter(iterator), False
+    try:
+        while True:
+            with reading_analytics():
+                try:
+                    chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                except DatabaseError:
+                    if sent or restart is None or not await sync_to_async(_failed_over)():
+                        raise
+                    iterator, restart = aiter((await restart()).streaming_content), None
+                    continue
+            sent = True
+            yield chunk
+    finally:
+        if aclose := getattr(iterator, "aclose", None):
+            await aclose()
+
+
+def _route_stream(response, again):
+    """Reads of the streamed content to the analytics database, `again` runs the view once more"""
+    if not getattr(response, "streaming", False):
+        return response
+    if response.is_async:
+        restart = again if iscoroutinefunction(again) else sync_to_async(again)
+        response.streaming_content = _astream(response.streaming_content, restart)
+    else:
+        # no event loop to run an async view again from the thread producing the chunks
+        restart = None if iscoroutinefunction(again) else again
+        response.streaming_content = _stream(response.streaming_content, restart)
+    return response
+
+
+def analytics_reads(view):
+    """
+    Decorator routing the reads of a (sync or async) view to the analytics
+    database. The views only read, when a query fails because the analytics
+    database went down since its last health check the view runs again on
+    the primary.
+    """
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            again = partial(view, *args, **kwargs)
+            with reading_analytics():
+                try:
+                    response = await again()
+                except DatabaseError:
+                    if not await sync_to_async(_failed_over)():
+                        raise
+                    response = await again()
+            return _route_stream(response, again)
+
+    else:
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            again = partial(view, *args, **kwargs)
+            with reading_analytics():
+                try:
+                    response = again()
+                except DatabaseError:
+                    if not _failed_over():
+                        raise
+                    response = again()
+            return _route_stream(response, again)
+
+    return wrapper
+
+
+class AnalyticsRouter:
+    """Reads of `analytics_reads` views to the analytics database, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if not _reading.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if analytics_available():
+            return ANALYTICS
+        if ANALYTICS in settings.DATABASES:
+            registry.inc("corpus_analytics_fallbacks_total", {"model": model._meta.label})
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # also for instances read from the analytics database
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both databases hold the same rows
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ANALYTICS}:
+            return True
+        return None
+
+
+registry.register(
+    "corpus_analytics_fallbacks_total",
+    "counter",
+    "Analytics reads sent to the primary while the analytics database is down",
+)
+registry.register_gauge(
+    "corpus_analytics_database_up",
+    "Whether the analytics database passed its last health check in the answering worker",
+    lambda: {(): int(_health["up"])} if ANALYTICS in settings.DATABASES else {},
+)
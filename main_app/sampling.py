@@ -0,0 +1,72 @@
+"""
+Word balance of the corpus per year and balanced samples.
+
+Totals are summed from the stored `Article.word_count_total`, no text is read.
+A balanced sample draws, for every language and year, articles in a random
+order seeded by (seed, language, year) and keeps the shortest prefix whose
+cumulative word count is closest to the target, so the same seed always
+gives the same sample and changing one year does not reshuffle the others.
+"""
+
+import numpy as np
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractYear
+
+from main_app.types import SampleYear, YearTotal
+
+
+def year_totals(articles) -> list[YearTotal]:
+    """Articles and words of every language and year of the articles (a queryset)"""
+    rows = (
+        articles.annotate(year=ExtractYear("published_year"))
+        .values("language", "year")
+        .annotate(articles=Count("pk"), words=Sum("word_count_total"))
+        .order_by("year", "language")
+    )
+    return [
+        YearTotal(language=row["language"], year=row["year"], articles=row["articles"], words=row["words"] or 0)
+        for row in rows
+    ]
+
+
+def balanced_sample(articles, words_per_year: int, tolerance: float, seed: int) -> tuple[list[int], list[SampleYear]]:
+    """
+    Ids of a seeded sample of the articles (a queryset) with about
+    `words_per_year` words in every language and year, and how close every
+    year got: within `tolerance` (a fraction of the target) or short of words
+    """
+    rows = np.array(
+        list(
+            articles.exclude(word_count_total=None)
+            .exclude(published_year=None)
+            .annotate(year=ExtractYear("published_year"))
+            .order_by("pk")
+            .values_list("pk", "language", "year", "word_count_total")
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    sample, report = [], []
+    groups = np.unique(rows[:, 1:3], axis=0)
+    for language, year in groups.tolist():
+        group = rows[(rows[:, 1] == language) & (rows[:, 2] == year)]
+        rng = np.random.default_rng([seed, language, year])
+        group = group[rng.permutation(len(group))]
+        cumulative = np.cumsum(group[:, 3])
+        # the prefix ending at or just past the target, whichever is closer
+        size = int(np.searchsorted(cumulative, words_per_year, side="right"))
+        if size < len(group) and (
+            size == 0 or cumulative[size] - words_per_year < words_per_year - cumulative[size - 1]
+        ):
+            size += 1
+        words = int(cumulative[size - 1]) if size else 0
+        sample.extend(group[:size, 0].tolist())
+        report.append(
+            SampleYear(
+                language=language,
+                year=year,
+                articles=size,
+                words=words,
+                within=abs(words - words_per_year) <= tolerance * words_per_year,
+            )
+        )
+    return sorted(sample), report
@@ -0,0 +1,161 @@
+"""
+LRU cache of search results.
+
+Queries are heavily repeated (every word in the frequency lists links to a
+search), so results are cached per worker, keyed by the normalized query,
+the search options (language, year, match type, variants, fuzziness, saved
+subcorpus) and the corpus generation. Entries are compact:
+article ids with their match contexts, never model instances or article text,
+and the cache evicts the least recently used entries once the stored contexts
+exceed ``settings.SEARCH_CACHE_MAX_BYTES``.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from main_app.instrumentation import registry
+from main_app.types import Context, SearchResult, SearchResultItem
+from main_app.utils import filter_by_match_type
+
+# (article id, frequency, ((count, type, context), ...))
+CompactItem = tuple[int, int, tuple[tuple[int, str, str], ...]]
+
+registry.register("corpus_search_cache_requests_total", "counter", "Search cache lookups by result")
+registry.register("corpus_search_cache_evictions_total", "counter", "Search cache LRU evictions")
+
+
+def normalize_query(query: str) -> str:
+    """Searches are case insensitive, so are the cache keys"""
+    return " ".join(query.split()).lower()
+
+
+def _size(items: tuple[CompactItem, ...]) -> int:
+    size = sys.getsizeof(items)
+    for _, _, locations in items:
+        size += 64 + sum(100 + len(context) for _, _, context in locations)
+    return size
+
+
+class SearchCache:
+    """Thread safe LRU mapping bounded by the approximate size of its values"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple, tuple[tuple[CompactItem, ...], int]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[CompactItem, ...] | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+        registry.inc("corpus_search_cache_requests_total", {"result": "miss" if entry is None else "hit"})
+        return None if entry is None else entry[0]
+
+    def put(self, key: tuple, items: tuple[CompactItem, ...]):
+        size = _size(items)
+        if size > self.max_bytes:
+            return
+        evicted = 0
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (items, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.size -= old_size
+                evicted += 1
+        if evicted:
+            registry.inc("corpus_search_cache_evictions_total", {}, evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+cache = SearchCache(settings.SEARCH_CACHE_MAX_BYTES)
+
+registry.register_gauge(
+    "corpus_search_cache",
+    "Search cache size and hit rate of the answering worker",
+    lambda: {(("stat", name),): value for name, value in cache.stats().items()},
+)
+
+
+def compact(results: SearchResult) -> tuple[CompactItem, ...]:
+    return tuple(
+        (
+            item["article"].pk,
+            item["frequency"],
+            tuple((location["count"], location["type"], location["context"]) for location in item["locations"]),
+        )
+        for item in results["results"]
+    )
+
+
+async def expand(query: str, items: tuple[CompactItem, ...]) -> SearchResult:
+    """Rebuild a SearchResult from cached ids, loading articles without their text"""
+    from main_app.models import Article
+
+    queryset = Article.objects.filter(pk__in=[item[0] for item in items]).select_related("newspaper").defer("content")
+    articles = {article.pk: article async for article in queryset}
+    results = []
+    for article_id, frequency, locations in items:
+        if article_id not in articles:
+            continue
+        results.append(
+            SearchResultItem(
+                article=articles[article_id],
+                frequency=frequency,
+                locations=[Context(count=count, type=kind, context=context) for count, kind, context in locations],
+            )
+        )
+    return SearchResult(query=query, results=results, total_frequency=sum(item["frequency"] for item in results))
+
+
+async def cached_search(
+    query: str,
+    language: int,
+    year: str | None,
+    match_type: int,
+    variants: bool = False,
+    fuzzy: int = 0,
+    subcorpus: int | None = None,
+) -> SearchResult:
+    """
+    `ArticleManager.asearch` followed by `filter_by_match_type`, served from
+    the cache when the same search already ran on the current corpus
+    """
+    from main_app.models import Article, CorpusState
+
+    query = query.strip()
+    generation = await CorpusState.acurrent()
+    key = (normalize_query(query), language, year or None, match_type, variants, fuzzy, subcorpus, generation)
+    items = cache.get(key)
+    if items is not None:
+        return await expand(query, items)
+    results = await Article.objects.asearch(query, language, year, variants=variants, fuzzy=fuzzy, subcorpus=subcorpus)
+    if match_type != 0:
+        results = filter_by_match_type(results, match_type)
+    cache.put(key, compact(results))
+    return results
@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from main_app.chunks import store_chunks
+from main_app.duplicates import store_bands
+from main_app.indexing import index_articles, refresh_term_counts
+from main_app.models import Article, CorpusState
+from main_app.slices import article_slices, refresh_slices
+from main_app.subcorpora import add_articles, lock_subcorpora, remove_articles
+
+
+@receiver(pre_save, sender=Article)
+def remember_article_slice(sender, instance: Article, **kwargs):
+    # a changed year, newspaper or language moves the article to another slice
+    instance._slices = article_slices([instance.pk]) if instance.pk else set()
+
+
+@receiver(post_save, sender=Article)
+def index_article(sender, instance: Article, update_fields=None, **kwargs):
+    """
+    Reindex a saved article, then invalidate caches keyed by the corpus generation
+    """
+    # in the transaction of `Article.save`: the saved subcorpora are locked once,
+    # its old counts leave them before its postings change and the new ones join
+    with transaction.atomic():
+        subcorpora = lock_subcorpora([instance.pk])
+        remove_articles([instance.pk], subcorpora=subcorpora)
+        if update_fields is None or {"content", "language"} & set(update_fields):
+            index_articles([instance])
+            store_chunks([instance])
+            store_bands([instance])
+        refresh_slices(getattr(instance, "_slices", set()) | article_slices([instance.pk]))
+        add_articles([instance.pk], subcorpora=subcorpora)
+        CorpusState.bump()
+
+
+@receiver(pre_delete, sender=Article)
+def remember_article_terms(sender, instance: Article, **kwargs):
+    instance._indexed_terms = set(instance.postings.values_list("term_id", flat=True))
+    instance._slices = article_slices([instance.pk])
+    remove_articles([instance.pk], deleted=True)
+
+
+@receiver(post_delete, sender=Article)
+def unindex_article(sender, instance: Article, **kwargs):
+    """
+    Postings are deleted with the article, the counts of its terms have to follow
+    """
+    refresh_term_counts(getattr(instance, "_indexed_terms", ()))
+    refresh_slices(getattr(instance, "_slices", set()))
+    CorpusState.bump()
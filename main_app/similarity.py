@@ -0,0 +1,139 @@
+"""
+"More like this" recommendations from precomputed TF-IDF neighbors.
+
+The TF-IDF vectors of the articles of one language are built from the
+postings of the search index (no text is tokenized again) as a sparse matrix
+with L2 normalized rows, so the cosine similarities of a block of articles to
+every other article are one sparse matrix product. The `k` most similar
+articles of each article are stored in `SimilarArticle`, serving them is one
+indexed lookup.
+
+`compute_similar` rebuilds every list; `add_similar` handles new imports: the
+new articles get their own lists and replace weaker neighbors in the lists of
+the existing ones. Scores of old pairs are not recomputed with the changed IDF
+weights until the next full rebuild.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+BLOCK_SIZE = 256
+
+
+def tfidf_matrix(language: int) -> tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    Sublinear TF-IDF matrix (one L2 normalized row per article) of the
+    language and the article id of every row. Flagged duplicates are left out.
+    """
+    from main_app.models import Posting
+
+    postings = (
+        Posting.objects.filter(term__language=language, article__duplicate_of=None)
+        .order_by()
+        .values_list("article_id", "term_id", "frequency")
+    )
+    rows = np.array(list(postings.iterator(chunk_size=20000)), dtype=np.int64).reshape(-1, 3)
+    article_ids, row = np.unique(rows[:, 0], return_inverse=True)
+    _, column = np.unique(rows[:, 1], return_inverse=True)
+    tf = 1 + np.log(rows[:, 2].astype(np.float32))
+    matrix = sparse.csr_matrix((tf, (row, column)), shape=(len(article_ids), column.max(initial=-1) + 1))
+
+    document_frequency = np.bincount(column, minlength=matrix.shape[1])
+    idf = np.log((1 + len(article_ids)) / (1 + document_frequency)) + 1
+    matrix = matrix @ sparse.diags(idf.astype(np.float32))
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32), article_ids
+
+
+def nearest_neighbors(matrix: sparse.csr_matrix, rows: np.ndarray, k: int):
+    """
+    (row, neighbor row, cosine similarity) of the `k` most similar rows of
+    every row in `rows`, computed in blocks so that at most BLOCK_SIZE dense
+    rows of similarities are in memory
+    """
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start : start + BLOCK_SIZE]
+        scores = (matrix[block] @ matrix.T).toarray()
+        scores[np.arange(len(block)), block] = 0
+        top = min(k, scores.shape[1] - 1)
+        if top <= 0:
+            return
+        best = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        for i, row in enumerate(block):
+            for neighbor in best[i][np.argsort(-scores[i, best[i]])]:
+                if scores[i, neighbor] > 0:
+                    yield int(row), int(neighbor), float(scores[i, neighbor])
+
+
+def _similar_rows(article_ids: np.ndarray, neighbors) -> list:
+    from main_app.models import SimilarArticle
+
+    similar, ranks = [], {}
+    for row, neighbor, score in neighbors:
+        rank = ranks[row] = ranks.get(row, 0) + 1
+        similar.append(
+            SimilarArticle(
+                article_id=int(article_ids[row]), neighbor_id=int(article_ids[neighbor]), score=score, rank=rank
+            )
+        )
+    return similar
+
+
+@transaction.atomic
+def compute_similar(language: int, k: int | None = None) -> int:
+    """Recompute the similar articles of every article of the language"""
+    from main_app.models import SimilarArticle
+
+    k = k or settings.SIMILAR_ARTICLES
+    matrix, article_ids = tfidf_matrix(language)
+    SimilarArticle.objects.filter(article__language=language).delete()
+    similar = _similar_rows(article_ids, nearest_neighbors(matrix, np.arange(len(article_ids)), k))
+    SimilarArticle.objects.bulk_create(similar, batch_size=5000)
+    return len(article_ids)
+
+
+@transaction.atomic
+def add_similar(articles: list, k: int | None = None):
+    """
+    Similar articles of newly imported articles, which also replace the
+    weakest neighbors of the existing articles they are more similar to
+    """
+    from main_app.models import SimilarArticle
+
+    k = k or settings.SIMILAR_ARTICLES
+    for language in {article.language for article in articles}:
+        matrix, article_ids = tfidf_matrix(language)
+        new = np.flatnonzero(np.isin(article_ids, [article.pk for article in articles if article.language == language]))
+        if not len(new):
+            continue
+        row_of = {article_id: row for row, article_id in enumerate(article_ids.tolist())}
+        # an existing article only changes if a new one beats its k-th neighbor
+        threshold = np.zeros(len(article_ids), dtype=np.float32)
+        stored: dict[int, list[tuple[int, int, float]]] = {}
+        for article_id, neighbor_id, score in SimilarArticle.objects.filter(article__language=language).values_list(
+            "article_id", "neighbor_id", "score"
+        ):
+            if article_id in row_of and neighbor_id in row_of:
+                stored.setdefault(row_of[article_id], []).append((row_of[article_id], row_of[neighbor_id], score))
+        for row, neighbors in stored.items():
+            if len(neighbors) >= k:
+                threshold[row] = min(score for _, _, score in neighbors)
+        threshold[new] = np.inf
+
+        candidates: dict[int, list[tuple[int, int, float]]] = {}
+        for start in range(0, len(new), BLOCK_SIZE):
+            block = new[start : start + BLOCK_SIZE]
+            scores = (matrix[block] @ matrix.T).toarray()
+            for i, row in np.argwhere(scores > threshold):
+                candidates.setdefault(int(row), []).append((int(row), int(block[i]), float(scores[i, row])))
+
+        similar = list(nearest_neighbors(matrix, new, k))
+        for row, neighbors in candidates.items():
+            merged = sorted(stored.get(row, []) + neighbors, key=lambda neighbor: -neighbor[2])
+            similar.extend(merged[:k])
+        changed = article_ids[np.concatenate([new, list(candidates)]).astype(np.int64)].tolist()
+        SimilarArticle.objects.filter(article_id__in=changed).delete()
+        SimilarArticle.objects.bulk_create(_similar_rows(article_ids, similar), batch_size=5000)
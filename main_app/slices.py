@@ -0,0 +1,169 @@
+"""
+Precomputed term frequencies of corpus slices.
+
+A slice is the set of articles sharing a language, a publication year and a
+newspaper. `CorpusSlice` stores the article and token counts of every slice
+and its frequency vector: the ids of the index terms occurring in it and their
+numbers of occurrences, packed as unsigned 32 bit integers. Any subcorpus
+filtered by language, year range and newspaper is a union of slices, so its
+frequency vector is the sum of a few stored vectors instead of a scan over the
+postings, and its unique word count is estimated by merging the slices'
+HyperLogLog sketches. Flagged duplicates are left out.
+
+Slices are recounted from the postings of their articles whenever articles are
+imported, saved or deleted; ``rebuild_index`` recounts all of them.
+"""
+
+from array import array
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, ExtractYear
+
+from main_app.hyperloglog import sketch, unique_words
+from main_app.types import FrequencyStats, UniqueWords
+
+# (language, year, newspaper id), year 0 for articles without a publication year
+SliceKey = tuple[int, int, int]
+
+
+def _key_condition(keys: set[SliceKey], prefix: str = "") -> Q:
+    condition = Q(pk__in=[])
+    for language, year, newspaper_id in keys:
+        year_condition = (
+            Q(**{f"{prefix}published_year__year": year}) if year else Q(**{f"{prefix}published_year": None})
+        )
+        condition |= Q(**{f"{prefix}language": language, f"{prefix}newspaper_id": newspaper_id}) & year_condition
+    return condition
+
+
+def article_slices(article_ids: list[int]) -> set[SliceKey]:
+    """Slices the stored articles belong to"""
+    from main_app.models import Article
+
+    return set(
+        Article.objects.filter(pk__in=article_ids)
+        .annotate(year=Coalesce(ExtractYear("published_year"), 0))
+        .values_list("language", "year", "newspaper_id")
+        .distinct()
+    )
+
+
+@transaction.atomic
+def refresh_slices(keys: set[SliceKey] | None = None):
+    """Recount the given slices, or every slice"""
+    from main_app.models import Article, CorpusSlice, Posting
+
+    articles = Article.objects.filter(duplicate_of=None)
+    postings = Posting.objects.filter(article__duplicate_of=None)
+    stale = CorpusSlice.objects.all()
+    if keys is not None:
+        if not keys:
+            return
+        articles = articles.filter(_key_condition(keys))
+        postings = postings.filter(_key_condition(keys, "article__"))
+        condition = Q(pk__in=[])
+        for language, year, newspaper_id in keys:
+            condition |= Q(language=language, year=year, newspaper_id=newspaper_id)
+        stale = stale.filter(condition)
+
+    slices = {}
+    for language, year, newspaper_id, count in (
+        articles.annotate(year=Coalesce(ExtractYear("published_year"), 0))
+        .values("language", "year", "newspaper_id")
+        .annotate(count=Count("pk"))
+        .values_list("language", "year", "newspaper_id", "count")
+        .order_by()
+    ):
+        slices[language, year, newspaper_id] = CorpusSlice(
+            language=language, year=year, newspaper_id=newspaper_id, article_count=count
+        )
+    vectors: dict[SliceKey, tuple[array, array]] = {}
+    rows = (
+        postings.annotate(
+            language=F("article__language"),
+            year=Coalesce(ExtractYear("article__published_year"), 0),
+            newspaper_id=F("article__newspaper_id"),
+        )
+        .values("language", "year", "newspaper_id", "term_id")
+        .annotate(total=Sum("frequency"))
+        .values_list("language", "year", "newspaper_id", "term_id", "total")
+        .order_by()
+    )
+    for language, year, newspaper_id, term_id, total in rows.iterator(chunk_size=20000):
+        ids, counts = vectors.setdefault((language, year, newspaper_id), (array("I"), array("I")))
+        ids.append(term_id)
+        counts.append(total)
+    for key, corpus_slice in slices.items():
+        ids, counts = vectors.get(key, (array("I"), array("I")))
+        corpus_slice.term_ids = ids.tobytes()
+        corpus_slice.counts = counts.tobytes()
+        corpus_slice.token_count = sum(counts)
+        corpus_slice.word_sketch = sketch(np.frombuffer(corpus_slice.term_ids, dtype=np.uint32))
+    stale.delete()
+    CorpusSlice.objects.bulk_create(slices.values(), batch_size=100)
+
+
+def subcorpus_slices(language: int | None, year_from: int | None = None, year_to: int | None = None, newspaper=None):
+    """Slices of the articles of a language (or of both), optionally within years and of one newspaper"""
+    from main_app.models import CorpusSlice
+
+    slices = CorpusSlice.objects.all()
+    if language:
+        slices = slices.filter(language=language)
+    if year_from or year_to:
+        slices = slices.exclude(year=0)
+    if year_from:
+        slices = slices.filter(year__gte=year_from)
+    if year_to:
+        slices = slices.filter(year__lte=year_to)
+    if newspaper:
+        slices = slices.filter(newspaper_id=newspaper)
+    return slices
+
+
+def frequency_vector(slices) -> tuple[np.ndarray, int, int]:
+    """Summed frequency vector of the slices indexed by term id, their number of tokens and of articles"""
+    ids, counts = [np.zeros(0, dtype=np.uint32)], [np.zeros(0, dtype=np.uint32)]
+    tokens = articles = 0
+    for term_ids, term_counts, token_count, article_count in slices.values_list(
+        "term_ids", "counts", "token_count", "article_count"
+    ):
+        ids.append(np.frombuffer(term_ids, dtype=np.uint32))
+        counts.append(np.frombuffer(term_counts, dtype=np.uint32))
+        tokens += token_count
+        articles += article_count
+    vector = np.bincount(np.concatenate(ids), weights=np.concatenate(counts))
+    return vector, tokens, articles
+
+
+def slice_frequency(
+    limit: int | None = None,
+    language: int | None = None,
+    year_from: int | None = None,
+    year_to: int | None = None,
+    newspaper: int | None = None,
+) -> tuple[FrequencyStats, int]:
+    """
+    Frequency list and total word count of the slices matching the filters,
+    in the order and with the counts of `CorpusSnapshot.frequency`
+    """
+    from main_app.models import Term
+
+    vector, tokens, _ = frequency_vector(subcorpus_slices(language, year_from, year_to, newspaper))
+    term_ids = np.flatnonzero(vector)
+    order = term_ids[np.argsort(-vector[term_ids], kind="stable")][:limit].tolist()
+    words = {}
+    for start in range(0, len(order), 5000):
+        words.update(Term.objects.filter(pk__in=order[start : start + 5000]).values_list("pk", "word"))
+    return [{"word": words.get(term_id, ""), "count": int(vector[term_id])} for term_id in order], tokens
+
+
+def slice_unique_words(slices, exact: bool = False) -> UniqueWords:
+    """Unique words of the union of the slices, recounted from their frequency vectors when `exact`"""
+    if exact:
+        ids = [np.frombuffer(term_ids, dtype=np.uint32) for term_ids in slices.values_list("term_ids", flat=True)]
+        count = len(np.unique(np.concatenate(ids))) if ids else 0
+        return UniqueWords(count=count, exact=True, error=0.0)
+    return unique_words(slices.values_list("word_sketch", flat=True))
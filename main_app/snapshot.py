@@ -0,0 +1,330 @@
+"""
+Memory-mapped columnar snapshot of the corpus.
+
+The snapshot is a directory of raw little-endian arrays described by
+``meta.json``:
+
+- the vocabulary indexed by term id: offsets into one UTF-8 blob of all the
+  words, their language and corpus frequency
+- one row per article, sorted by id: language, year (0 when unknown),
+  newspaper id, whether it is a flagged duplicate and the offset of its tokens
+- the tokens of every article as term ids in text order, 0 for positions the
+  index has no term for
+
+Workers open it read-only with `numpy.memmap`, so the OS page cache holds one
+copy for all of them instead of a private copy of the vocabulary and counts
+per process. Frequency lists of any selection of articles are one
+``bincount`` over their token slices, and the occurrences of terms are found
+with a scan of the token column, without reading texts or postings.
+
+``settings.CORPUS_SNAPSHOT_DIR`` holds the snapshots and a ``current`` symlink
+to the newest one. A snapshot is written to a temporary directory, renamed
+and then linked with an atomic rename of the symlink, so readers always see a
+complete snapshot. Replaced snapshots are kept for one refresh interval. It is only used while it matches the corpus generation;
+when the generation changes one worker of the host rebuilds it in the
+background (guarded by a lock file) and the others count from the database
+until the new snapshot is linked.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Coalesce, ExtractYear
+
+from main_app.types import FrequencyStats
+
+# articles whose postings are read at once while writing
+ARTICLE_BATCH_SIZE = 500
+
+COLUMNS = {
+    "word_offsets": "<u8",
+    "words": "u1",
+    "term_language": "u1",
+    "term_frequency": "<u4",
+    "article_ids": "<i8",
+    "language": "u1",
+    "year": "<u2",
+    "newspaper": "<i8",
+    "duplicate": "?",
+    "token_offsets": "<u8",
+    "tokens": "<u4",
+}
+
+
+def _write_vocabulary(path: str) -> int:
+    from main_app.models import Term
+
+    last = Term.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+    offsets = np.zeros(last + 2, dtype=np.uint64)
+    languages = np.zeros(last + 1, dtype=np.uint8)
+    frequencies = np.zeros(last + 1, dtype=np.uint32)
+    with open(os.path.join(path, "words"), "wb") as words:
+        position, previous = 0, 0
+        for term_id, word, language, frequency in (
+            Term.objects.order_by("pk").values_list("pk", "word", "language", "frequency").iterator(chunk_size=20000)
+        ):
+            data = word.encode()
+            words.write(data)
+            offsets[previous + 1 : term_id + 1] = position
+            position += len(data)
+            offsets[term_id + 1] = position
+            languages[term_id], frequencies[term_id] = language, frequency
+            previous = term_id
+        offsets[previous + 1 :] = position
+    offsets.tofile(os.path.join(path, "word_offsets"))
+    languages.tofile(os.path.join(path, "term_language"))
+    frequencies.tofile(os.path.join(path, "term_frequency"))
+    return last + 1
+
+
+def _write_articles(path: str) -> tuple[int, int]:
+    from main_app.models import Article, Posting
+
+    rows = np.array(
+        list(
+            Article.objects.annotate(year=Coalesce(ExtractYear("published_year"), 0))
+            .order_by("pk")
+            .values_list("pk", "language", "year", "newspaper_id", "duplicate_of_id")
+        ),
+        dtype=object,
+    ).reshape(-1, 5)
+    ids = rows[:, 0].astype(np.int64)
+    ids.tofile(os.path.join(path, "article_ids"))
+    rows[:, 1].astype(np.uint8).tofile(os.path.join(path, "language"))
+    rows[:, 2].astype(np.uint16).tofile(os.path.join(path, "year"))
+    np.array([newspaper or 0 for newspaper in rows[:, 3]], dtype=np.int64).tofile(os.path.join(path, "newspaper"))
+    np.array([duplicate is not None for duplicate in rows[:, 4]], dtype=bool).tofile(os.path.join(path, "duplicate"))
+
+    lengths = np.zeros(len(ids), dtype=np.uint64)
+    with open(os.path.join(path, "tokens"), "wb") as tokens:
+        for start in range(0, len(ids), ARTICLE_BATCH_SIZE):
+            batch = ids[start : start + ARTICLE_BATCH_SIZE]
+            articles, terms, positions = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.uint32)], []
+            for article_id, term_id, packed in Posting.objects.filter(article_id__in=batch.tolist()).values_list(
+                "article_id", "term_id", "positions"
+            ):
+                found = np.frombuffer(packed, dtype=np.uint32)
+                positions.append(found)
+                terms.append(np.full(len(found), term_id, dtype=np.uint32))
+                articles.append(np.full(len(found), article_id, dtype=np.int64))
+            positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.uint32)
+            local = np.searchsorted(batch, np.concatenate(articles))
+            batch_lengths = np.zeros(len(batch), dtype=np.uint64)
+            np.maximum.at(batch_lengths, local, positions.astype(np.uint64) + 1)
+            starts = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(batch_lengths)[:-1]])
+            batch_tokens = np.zeros(int(batch_lengths.sum()), dtype=np.uint32)
+            batch_tokens[starts[local] + positions] = np.concatenate(terms)
+            batch_tokens.tofile(tokens)
+            lengths[start : start + len(batch)] = batch_lengths
+    np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(lengths)]).tofile(os.path.join(path, "token_offsets"))
+    return len(ids), int(lengths.sum())
+
+
+def write_snapshot(directory: str | None = None) -> str:
+    """Write a snapshot of the current corpus and link it as the current one, its path"""
+    from main_app.models import CorpusState
+
+    directory = directory or settings.CORPUS_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    # read first: a change while writing leaves the snapshot stale, not wrong
+    generation = CorpusState.current()
+    name = f"generation-{generation}-{time.time_ns()}"
+    temporary = os.path.join(directory, f".{name}")
+    os.makedirs(temporary)
+    try:
+        terms = _write_vocabulary(temporary)
+        articles, tokens = _write_articles(temporary)
+        with open(os.path.join(temporary, "meta.json"), "w") as f:
+            json.dump(
+                {"generation": generation, "terms": terms, "articles": articles, "tokens": tokens, "columns": COLUMNS},
+                f,
+            )
+        os.rename(temporary, os.path.join(directory, name))
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+    link = os.path.join(directory, f".current-{name}")
+    os.symlink(name, link)
+    os.replace(link, os.path.join(directory, "current"))
+    _remove_replaced(directory)
+    return os.path.join(directory, name)
+
+
+def _remove_replaced(directory: str):
+    """
+    Remove the snapshots replaced more than ``settings.VOCABULARY_REFRESH_SECONDS``
+    ago. Workers keep using the path of the snapshot they last checked until
+    their next check, and pass it to the pool, so a snapshot that was just
+    replaced stays on disk for them. Readers that still miss it count from the
+    slices.
+    """
+    written = sorted(
+        (int(entry.rsplit("-", 1)[1]), entry)
+        for entry in os.listdir(directory)
+        if entry.startswith("generation-") and entry.rsplit("-", 1)[1].isdigit()
+    )
+    now = time.time_ns()
+    # a snapshot is replaced when the next one is written
+    for (_, entry), (replaced, _) in zip(written, written[1:]):
+        if now - replaced > settings.VOCABULARY_REFRESH_SECONDS * 1e9:
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+
+class CorpusSnapshot:
+    """Read-only memory-mapped columns of a snapshot directory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.generation = meta["generation"]
+        for column, dtype in meta["columns"].items():
+            file = os.path.join(path, column)
+            # numpy can't map empty files
+            data = np.memmap(file, dtype=dtype, mode="r") if os.path.getsize(file) else np.zeros(0, dtype=dtype)
+            setattr(self, column, data)
+
+    def __len__(self):
+        return len(self.article_ids)
+
+    def rows(
+        self,
+        language: int | None = None,
+        year_from: int | None = None,
+        year_to: int | None = None,
+        newspaper: int | None = None,
+        article_ids=None,
+        duplicates: bool = True,
+    ) -> np.ndarray:
+        """Row indexes of the articles matching all of the given filters"""
+        mask = np.ones(len(self), dtype=bool)
+        if language:
+            mask &= self.language == language
+        if year_from:
+            mask &= self.year >= year_from
+        if year_to:
+            mask &= (self.year <= year_to) & (self.year > 0)
+        if newspaper:
+            mask &= self.newspaper == newspaper
+        if article_ids is not None:
+            mask &= np.isin(self.article_ids, np.asarray(article_ids, dtype=np.int64))
+        if not duplicates:
+            mask &= ~self.duplicate
+        return np.flatnonzero(mask)
+
+    def _token_mask(self, rows: np.ndarray) -> np.ndarray:
+        """Mask of the token column selecting the tokens of the rows"""
+        change = np.zeros(len(self.tokens) + 1, dtype=np.int8)
+        np.add.at(change, self.token_offsets[rows].astype(np.intp), 1)
+        np.add.at(change, self.token_offsets[rows + 1].astype(np.intp), -1)
+        return np.cumsum(change[:-1], dtype=np.int8).astype(bool)
+
+    def counts(self, rows: np.ndarray) -> np.ndarray:
+        """Occurrences of every term id in the articles of the rows"""
+        if len(rows) == len(self):
+            tokens = self.tokens
+        else:
+            tokens = self.tokens[self._token_mask(rows)]
+        counts = np.bincount(tokens, minlength=len(self.term_frequency))
+        # positions without a term
+        counts[0] = 0
+        return counts
+
+    def word(self, term_id: int) -> str:
+        return bytes(self.words[self.word_offsets[term_id] : self.word_offsets[term_id + 1]]).decode()
+
+    def frequency(self, rows: np.ndarray, limit: int | None = None) -> tuple[FrequencyStats, int]:
+        """Frequency list and total word count of the articles of the rows, like `utils.content_stats`"""
+        counts = self.counts(rows)
+        term_ids = np.flatnonzero(counts)
+        order = term_ids[np.argsort(-counts[term_ids], kind="stable")][:limit]
+        stats = [{"word": self.word(term_id), "count": int(counts[term_id])} for term_id in order.tolist()]
+        return stats, int(counts.sum())
+
+    def occurrences(self, term_ids, rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Row indexes and token positions of every occurrence of the term ids, in text order"""
+        found = np.flatnonzero(np.isin(self.tokens, np.asarray(term_ids, dtype=np.uint32)))
+        found_rows = np.searchsorted(self.token_offsets, found, side="right") - 1
+        if rows is not None:
+            kept = np.isin(found_rows, rows)
+            found, found_rows = found[kept], found_rows[kept]
+        return found_rows, found - self.token_offsets[found_rows].astype(np.int64)
+
+    def tokens_of(self, row: int) -> np.ndarray:
+        return self.tokens[self.token_offsets[row] : self.token_offsets[row + 1]]
+
+
+_snapshots: dict[str, CorpusSnapshot] = {}
+_state = {"checked": float("-inf"), "current": None, "building": False}
+_lock = threading.Lock()
+
+
+def open_snapshot(path: str) -> CorpusSnapshot:
+    """The snapshot at `path`, mapped once per process, the mappings of replaced snapshots are dropped"""
+    snapshot = _snapshots.get(path)
+    if snapshot is None:
+        _snapshots.clear()
+        snapshot = _snapshots[path] = CorpusSnapshot(path)
+    return snapshot
+
+
+def rebuild_snapshot():
+    """Write a new snapshot unless another worker of the host is already writing one"""
+    directory = settings.CORPUS_SNAPSHOT_DIR
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "snapshot.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            write_snapshot(directory)
+    finally:
+        _state["building"] = False
+
+
+def get_snapshot() -> CorpusSnapshot | None:
+    """
+    The current snapshot if it matches the corpus generation, checked at most
+    every ``settings.VOCABULARY_REFRESH_SECONDS``. A stale or missing one is
+    rebuilt in the background and None returned meanwhile.
+    """
+    from main_app.executors import run_in_background
+    from main_app.models import CorpusState
+
+    if not settings.CORPUS_SNAPSHOT_DIR:
+        return None
+    if time.monotonic() - _state["checked"] < settings.VOCABULARY_REFRESH_SECONDS:
+        return _state["current"]
+    with _lock:
+        generation = CorpusState.current()
+        link = os.path.join(settings.CORPUS_SNAPSHOT_DIR, "current")
+        current = None
+        try:
+            snapshot = open_snapshot(os.path.realpath(link, strict=True))
+            if snapshot.generation == generation:
+                current = snapshot
+        except (OSError, ValueError):
+            pass
+        if current is None and not _state["building"]:
+            _state["building"] = True
+            run_in_background(rebuild_snapshot)
+        _state.update(checked=time.monotonic(), current=current)
+    return current
+
+
+def snapshot_frequency(path: str, limit: int | None = None, **filters) -> tuple[FrequencyStats, int]:
+    """
+    Frequency list and total word count of the articles of the snapshot at
+    `path` matching the filters of `CorpusSnapshot.rows`, flagged duplicates
+    left out like in the slices. Takes plain values so that it can run in a
+    worker process
+    """
+    snapshot = open_snapshot(path)
+    return snapshot.frequency(snapshot.rows(**filters, duplicates=False), limit)
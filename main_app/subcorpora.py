@@ -0,0 +1,272 @@
+"""
+Saved subcorpora and their materialized statistics.
+
+A `Subcorpus` is a filter definition (language, year range, newspapers) with
+its member articles stored as a many-to-many relation, so search, concordance
+and keyness restrict to it with a join. Its term frequencies, token count and
+bigram counts are computed once from the postings of its members, in the
+background when it is created, and stored packed like the corpus slices.
+
+When articles change the statistics are updated incrementally: once an
+article is saved its counts, from its postings before it is reindexed, are
+subtracted from the subcorpora it belonged to and its new counts added to the
+ones it matches, under one lock of the subcorpora taken in a fixed order. A
+deleted article's counts are subtracted before it goes. Only the postings of
+the changed articles are read. The members of a balanced
+sample (see `main_app.sampling`) are fixed when it is drawn: its articles
+only leave it when they are deleted and new articles never join it.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main_app.types import FrequencyStats
+
+# articles whose postings are read at once
+ARTICLE_BATCH_SIZE = 200
+
+
+class Counts(NamedTuple):
+    term_ids: np.ndarray
+    term_counts: np.ndarray
+    # (first term id << 32) | second term id of adjacent tokens
+    bigram_keys: np.ndarray
+    bigram_counts: np.ndarray
+
+
+EMPTY = Counts(
+    np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+)
+
+
+def _merge(keys_a: np.ndarray, counts_a: np.ndarray, keys_b: np.ndarray, counts_b: np.ndarray, sign: int = 1):
+    """Sorted keys and summed counts of two count vectors, `sign` -1 subtracts the second"""
+    keys, inverse = np.unique(np.concatenate([keys_a, keys_b]), return_inverse=True)
+    counts = np.zeros(len(keys), dtype=np.int64)
+    np.add.at(counts, inverse, np.concatenate([counts_a, sign * counts_b.astype(np.int64)]))
+    kept = counts > 0
+    return keys[kept], counts[kept]
+
+
+def merge_counts(a: Counts, b: Counts, sign: int = 1) -> Counts:
+    return Counts(
+        *_merge(a.term_ids, a.term_counts, b.term_ids, b.term_counts, sign),
+        *_merge(a.bigram_keys, a.bigram_counts, b.bigram_keys, b.bigram_counts, sign),
+    )
+
+
+def article_counts(article_ids) -> Counts:
+    """Term and bigram counts of the articles, rebuilt from the positions of their postings"""
+    from main_app.models import Posting
+
+    articles, terms, positions = [], [], []
+    for article_id, term_id, packed in Posting.objects.filter(article_id__in=article_ids).values_list(
+        "article_id", "term_id", "positions"
+    ):
+        found = np.frombuffer(packed, dtype=np.uint32)
+        positions.append(found)
+        terms.append(np.full(len(found), term_id, dtype=np.uint64))
+        articles.append(np.full(len(found), article_id, dtype=np.int64))
+    if not positions:
+        return EMPTY
+    articles, terms, positions = np.concatenate(articles), np.concatenate(terms), np.concatenate(positions)
+    term_ids, term_counts = np.unique(terms, return_counts=True)
+
+    order = np.lexsort((positions, articles))
+    articles, terms, positions = articles[order], terms[order], positions[order]
+    adjacent = (articles[1:] == articles[:-1]) & (positions[1:] == positions[:-1] + 1)
+    keys = (terms[:-1][adjacent] << np.uint64(32)) | terms[1:][adjacent]
+    bigram_keys, bigram_counts = np.unique(keys, return_counts=True)
+    return Counts(term_ids.astype(np.uint32), term_counts.astype(np.int64), bigram_keys, bigram_counts.astype(np.int64))
+
+
+def stored_counts(subcorpus) -> Counts:
+    return Counts(
+        np.frombuffer(subcorpus.term_ids, dtype=np.uint32),
+        np.frombuffer(subcorpus.counts, dtype=np.uint32).astype(np.int64),
+        np.frombuffer(subcorpus.bigram_keys, dtype=np.uint64),
+        np.frombuffer(subcorpus.bigram_counts, dtype=np.uint32).astype(np.int64),
+    )
+
+
+def _store(subcorpus, counts: Counts):
+    subcorpus.term_ids = counts.term_ids.astype(np.uint32).tobytes()
+    subcorpus.counts = counts.term_counts.astype(np.uint32).tobytes()
+    subcorpus.bigram_keys = counts.bigram_keys.astype(np.uint64).tobytes()
+    subcorpus.bigram_counts = counts.bigram_counts.astype(np.uint32).tobytes()
+    subcorpus.token_count = int(counts.term_counts.sum())
+    subcorpus.article_count = subcorpus.articles.count()
+    subcorpus.save(
+        update_fields=[
+            "term_ids",
+            "counts",
+            "bigram_keys",
+            "bigram_counts",
+            "token_count",
+            "article_count",
+            "materialized",
+        ]
+    )
+
+
+def members(subcorpus):
+    """Articles matching the filter definition of the subcorpus, flagged duplicates left out"""
+    from main_app.models import Article
+
+    articles = Article.objects.filter(language=subcorpus.language, duplicate_of=None)
+    if subcorpus.year_from:
+        articles = articles.filter(published_year__year__gte=subcorpus.year_from)
+    if subcorpus.year_to:
+        articles = articles.filter(published_year__year__lte=subcorpus.year_to)
+    newspapers = list(subcorpus.newspapers.values_list("pk", flat=True))
+    if newspapers:
+        articles = articles.filter(newspaper_id__in=newspapers)
+    return articles
+
+
+def _compute(subcorpus) -> tuple[list[int], Counts]:
+    """Members and statistics of the subcorpus, from its filters or the stored members of a sample"""
+    if subcorpus.seed is None:
+        ids = list(members(subcorpus).order_by("pk").values_list("pk", flat=True))
+    else:
+        ids = list(subcorpus.articles.order_by("pk").values_list("pk", flat=True))
+    counts = EMPTY
+    for start in range(0, len(ids), ARTICLE_BATCH_SIZE):
+        counts = merge_counts(counts, article_counts(ids[start : start + ARTICLE_BATCH_SIZE]))
+    return ids, counts
+
+
+def materialize(subcorpus_id: int, attempts: int = 3):
+    """
+    Store the members and compute the statistics of the subcorpus from
+    scratch. Article changes wait for the row lock of the subcorpus, so they
+    are computed without it and only stored under it, when no article changed
+    in between; otherwise they are computed again, under the lock the last
+    time.
+    """
+    from main_app.models import CorpusState, Subcorpus
+
+    for attempt in range(attempts):
+        locked = attempt == attempts - 1
+        with transaction.atomic():
+            subcorpus = Subcorpus.objects.select_for_update() if locked else Subcorpus.objects
+            subcorpus = subcorpus.get(pk=subcorpus_id)
+            generation = CorpusState.current()
+            ids, counts = _compute(subcorpus)
+            if not locked:
+                subcorpus = Subcorpus.objects.select_for_update().get(pk=subcorpus_id)
+                if CorpusState.current() != generation:
+                    continue
+            if subcorpus.seed is None:
+                subcorpus.articles.set(ids)
+            subcorpus.materialized = timezone.now()
+            _store(subcorpus, counts)
+            return
+
+
+def materialize_all():
+    from main_app.models import Subcorpus
+
+    for subcorpus_id in Subcorpus.objects.values_list("pk", flat=True):
+        materialize(subcorpus_id)
+
+
+def lock_subcorpora(article_ids: list[int], matching: bool = True) -> list:
+    """
+    The subcorpora containing the articles and, with `matching`, every
+    materialized one they may join, locked in primary key order. Article
+    changes lock them once, all in the same order, so they can't deadlock.
+    """
+    from main_app.models import Subcorpus
+
+    memberships = Subcorpus.articles.through.objects.filter(article_id__in=article_ids).values("subcorpus_id")
+    condition = Q(pk__in=memberships) | Q(materialized__isnull=False) if matching else Q(pk__in=memberships)
+    return list(Subcorpus.objects.select_for_update().filter(condition).order_by("pk"))
+
+
+@transaction.atomic
+def add_articles(article_ids: list[int], subcorpora: list | None = None):
+    """
+    Add the saved articles to the materialized subcorpora they match, or
+    their counts back to their samples, of `subcorpora` when already locked
+    """
+    if subcorpora is None:
+        subcorpora = lock_subcorpora(article_ids)
+    for subcorpus in subcorpora:
+        if subcorpus.materialized is None:
+            continue
+        if subcorpus.seed is None:
+            ids = list(
+                members(subcorpus).filter(pk__in=article_ids).exclude(subcorpora=subcorpus).values_list("pk", flat=True)
+            )
+            subcorpus.articles.add(*ids)
+        else:
+            ids = list(subcorpus.articles.filter(pk__in=article_ids).values_list("pk", flat=True))
+        if ids:
+            _store(subcorpus, merge_counts(stored_counts(subcorpus), article_counts(ids)))
+
+
+@transaction.atomic
+def remove_articles(article_ids: list[int], deleted: bool = False, subcorpora: list | None = None):
+    """
+    Subtract the counts of the articles, with their current postings, from
+    the subcorpora they belong to, of `subcorpora` when already locked. They
+    stay members of samples unless they are being `deleted`.
+    """
+    if subcorpora is None:
+        subcorpora = lock_subcorpora(article_ids, matching=False)
+    for subcorpus in subcorpora:
+        ids = list(subcorpus.articles.filter(pk__in=article_ids).values_list("pk", flat=True))
+        if not ids:
+            continue
+        counts = merge_counts(stored_counts(subcorpus), article_counts(ids), sign=-1)
+        if subcorpus.seed is None or deleted:
+            subcorpus.articles.remove(*ids)
+        _store(subcorpus, counts)
+
+
+def _words(term_ids) -> dict[int, str]:
+    from main_app.models import Term
+
+    words = {}
+    term_ids = list(term_ids)
+    for start in range(0, len(term_ids), 5000):
+        words.update(Term.objects.filter(pk__in=term_ids[start : start + 5000]).values_list("pk", "word"))
+    return words
+
+
+def frequency_list(subcorpus, limit: int | None = None) -> FrequencyStats:
+    """Most frequent words of the subcorpus, all of them without `limit`"""
+    counts = stored_counts(subcorpus)
+    order = np.argsort(-counts.term_counts, kind="stable")[:limit]
+    words = _words(counts.term_ids[order].tolist())
+    language = subcorpus.get_language_display()
+    return [
+        {"word": words.get(term_id, ""), "count": count, "language": language}
+        for term_id, count in zip(counts.term_ids[order].tolist(), counts.term_counts[order].tolist())
+    ]
+
+
+def bigram_list(subcorpus, limit: int | None = None) -> FrequencyStats:
+    """Most frequent pairs of adjacent words of the subcorpus"""
+    counts = stored_counts(subcorpus)
+    order = np.argsort(-counts.bigram_counts, kind="stable")[:limit]
+    keys = counts.bigram_keys[order]
+    first, second = (keys >> np.uint64(32)).tolist(), (keys & np.uint64(0xFFFFFFFF)).tolist()
+    words = _words(set(first) | set(second))
+    language = subcorpus.get_language_display()
+    return [
+        {"word": f"{words.get(a, '')} {words.get(b, '')}", "count": count, "language": language}
+        for a, b, count in zip(first, second, counts.bigram_counts[order].tolist())
+    ]
+
+
+def subcorpus_frequency_vector(subcorpus) -> tuple[np.ndarray, int, int]:
+    """Frequency vector indexed by term id, token and article count, like `slices.frequency_vector`"""
+    counts = stored_counts(subcorpus)
+    vector = np.bincount(counts.term_ids, weights=counts.term_counts.astype(np.float64))
+    return vector, subcorpus.token_count, subcorpus.article_count
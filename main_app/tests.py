@@ -1,3 +1,351 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from main_app.chunks import split_text
+from main_app.models import Article, Newspaper, Posting, Subcorpus
+from main_app.routers import ANALYTICS, _health, analytics_reads, reading_analytics
+from main_app.similarity import add_similar
+from main_app.snapshot import write_snapshot
+from main_app.subcorpora import frequency_list, materialize
+from main_app.utils import search_terms
+
+# the router tests need the analytics alias (set ANALYTICS_DB_HOST), in tests
+# it mirrors the default database
+needs_analytics = skipUnless(ANALYTICS in settings.DATABASES, "needs the analytics database, set ANALYTICS_DB_HOST")
+
+
+def routed_view():
+    """View answering with the alias its reads go to, failing while it is the analytics database"""
+    calls = []
+
+    def view(request):
+        calls.append(router.db_for_read(Newspaper))
+        if calls[-1] == ANALYTICS:
+            raise OperationalError("server closed the connection unexpectedly")
+        return HttpResponse(calls[-1])
+
+    return view, calls
+
+
+@needs_analytics
+class AnalyticsRouterTests(SimpleTestCase):
+    def setUp(self):
+        _health.update(up=True, checked=float("-inf"))
+        self.addCleanup(_health.update, up=True, checked=float("-inf"))
+        patcher = mock.patch("main_app.routers._check", return_value=True)
+        self.check = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = RequestFactory().get("/")
+
+    def test_reads_go_to_the_primary_outside_analytics_views(self):
+        self.assertEqual(router.db_for_read(Newspaper), DEFAULT_DB_ALIAS)
+
+    def test_analytics_reads(self):
+        with reading_analytics():
+            self.assertEqual(router.db_for_read(Newspaper), ANALYTICS)
+            self.assertEqual(router.db_for_write(Newspaper), DEFAULT_DB_ALIAS)
+
+    def test_reads_in_transactions_stay_on_the_primary(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], "in_atomic_block", True), reading_analytics():
+            self.assertEqual(router.db_for_read(Newspaper), DEFAULT_DB_ALIAS)
+
+    def test_reads_fall_back_while_the_analytics_database_is_down(self):
+        self.check.return_value = False
+        with reading_analytics():
+            self.assertEqual(router.db_for_read(Newspaper), DEFAULT_DB_ALIAS)
+        self.assertFalse(_health["up"])
+
+    def test_failed_query_runs_the_view_again_on_the_primary(self):
+        # up at the health check before the query, down when checked after it failed
+        self.check.side_effect = [True, False]
+        view, calls = routed_view()
+        response = analytics_reads(view)(self.request)
+        self.assertEqual(response.content, DEFAULT_DB_ALIAS.encode())
+        self.assertEqual(calls, [ANALYTICS, DEFAULT_DB_ALIAS])
+        self.assertFalse(_health["up"])
+
+    def test_failed_query_is_raised_while_the_analytics_database_is_up(self):
+        view, calls = routed_view()
+        with self.assertRaises(OperationalError):
+            analytics_reads(view)(self.request)
+        self.assertEqual(calls, [ANALYTICS])
+        self.assertTrue(_health["up"])
+
+    async def test_failed_query_runs_an_async_view_again_on_the_primary(self):
+        self.check.side_effect = [True, False]
+        view, calls = routed_view()
+
+        async def async_view(request):
+            return view(request)
+
+        response = await analytics_reads(async_view)(self.request)
+        self.assertEqual(response.content, DEFAULT_DB_ALIAS.encode())
+        self.assertEqual(calls, [ANALYTICS, DEFAULT_DB_ALIAS])
+
+    def test_stream_starts_again_on_the_primary_before_any_content(self):
+        self.check.side_effect = [True, False]
+        view, calls = routed_view()
+
+        def streaming_view(request):
+            def content():
+                yield view(request).content
+
+            return StreamingHttpResponse(content())
+
+        response = analytics_reads(streaming_view)(self.request)
+        self.assertEqual(b"".join(response.streaming_content), DEFAULT_DB_ALIAS.encode())
+        self.assertEqual(calls, [ANALYTICS, DEFAULT_DB_ALIAS])
+
+    def test_stream_fails_once_content_was_sent(self):
+        view, calls = routed_view()
+
+        def streaming_view(request):
+            def content():
+                yield b"sent"
+                yield view(request).content
+
+            return StreamingHttpResponse(content())
+
+        content = analytics_reads(streaming_view)(self.request).streaming_content
+        self.assertEqual(next(content), b"sent")
+        with self.assertRaises(OperationalError):
+            next(content)
+        self.assertEqual(calls, [ANALYTICS])
+
+
+@needs_analytics
+class AnalyticsMirrorTests(TransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, ANALYTICS}
+
+    def setUp(self):
+        _health.update(up=True, checked=float("-inf"))
+        self.addCleanup(_health.update, up=True, checked=float("-inf"))
+
+    def test_analytics_views_read_the_mirror(self):
+        Newspaper.objects.create(title="Xalq so'zi")
+
+        @analytics_reads
+        def view(request):
+            newspapers = Newspaper.objects.all()
+            return HttpResponse(f"{newspapers.db} {newspapers.count()}")
+
+        response = view(RequestFactory().get("/"))
+        self.assertEqual(response.content, f"{ANALYTICS} 1".encode())
+
+
+def words(prefix: str, count: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+class SplitTextTests(SimpleTestCase):
+    def test_pieces_join_back_to_the_text(self):
+        text = words("word", 100)
+        pieces = split_text(text, 50)
+        self.assertEqual("".join(pieces), text)
+        self.assertTrue(all(len(piece) <= 50 for piece in pieces))
+
+    def test_pieces_are_cut_between_words(self):
+        pieces = split_text(words("word", 100), 50)
+        self.assertTrue(all(piece.endswith(" ") for piece in pieces[:-1]))
+
+    def test_short_text_is_one_piece(self):
+        self.assertEqual(split_text("short text", 50), ["short text"])
+
+
+@override_settings(ARTICLE_CHUNK_THRESHOLD=200, ARTICLE_CHUNK_SIZE=100)
+class SplitArticleTests(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="Kitob",
+            newspaper=Newspaper.objects.create(title="Xalq so'zi"),
+            content=words("old", 60),
+            published_year="2001-01-01",
+        )
+
+    def saved(self, content: str | None = None) -> Article:
+        article = Article.objects.get(pk=self.article.pk)
+        if content is not None:
+            article.content = content
+        article.save()
+        return Article.objects.get(pk=self.article.pk)
+
+    def indexed_words(self, article: Article) -> set[str]:
+        return set(Posting.objects.filter(article=article).values_list("term__word", flat=True))
+
+    def test_long_text_is_chunked(self):
+        article = Article.objects.get(pk=self.article.pk)
+        self.assertGreater(article.chunk_count, 0)
+        self.assertEqual(article.chunks.count(), article.chunk_count)
+        self.assertEqual(article.full_text(), words("old", 60))
+
+    def test_resave_keeps_the_chunks(self):
+        chunk_count = Article.objects.get(pk=self.article.pk).chunk_count
+        article = self.saved()
+        self.assertEqual(article.chunk_count, chunk_count)
+        self.assertEqual(article.full_text(), words("old", 60))
+
+    def test_resave_with_a_long_text_replaces_the_chunks(self):
+        article = self.saved(words("new", 60))
+        self.assertEqual(article.full_text(), words("new", 60))
+        self.assertEqual(article.chunks.count(), article.chunk_count)
+        self.assertEqual(article.word_count_total, 60)
+        self.assertEqual(self.indexed_words(article), set(words("new", 60).split()))
+
+    def test_resave_with_a_short_text_deletes_the_chunks(self):
+        article = self.saved("short text")
+        self.assertEqual(article.chunk_count, 0)
+        self.assertFalse(article.chunks.exists())
+        self.assertEqual(article.full_text(), "short text")
+        self.assertEqual(article.word_count_total, 2)
+        self.assertEqual(self.indexed_words(article), {"short", "text"})
+
+
+class SubcorpusCountTests(TestCase):
+    def setUp(self):
+        newspaper = Newspaper.objects.create(title="Xalq so'zi")
+        self.articles = [
+            Article.objects.create(title=str(year), newspaper=newspaper, content=text, published_year=f"{year}-01-01")
+            for year, text in [(2001, "kitob va daftar"), (2001, "kitob va qalam"), (2005, "gazeta va jurnal")]
+        ]
+        self.subcorpus = Subcorpus.objects.create(name="2001", language=Article.UZBEK, year_from=2001, year_to=2001)
+        materialize(self.subcorpus.pk)
+
+    def counts(self) -> dict[str, int]:
+        subcorpus = Subcorpus.objects.get(pk=self.subcorpus.pk)
+        return {row["word"]: row["count"] for row in frequency_list(subcorpus)}
+
+    def test_materialize(self):
+        self.assertEqual(self.counts(), {"kitob": 2, "va": 2, "daftar": 1, "qalam": 1})
+        self.assertEqual(Subcorpus.objects.get(pk=self.subcorpus.pk).article_count, 2)
+
+    def test_edited_member_moves_its_counts(self):
+        article = self.articles[0]
+        article.content = "kitob kitob"
+        article.save()
+        self.assertEqual(self.counts(), {"kitob": 3, "va": 1, "qalam": 1})
+
+    def test_article_leaving_and_joining_the_filters(self):
+        self.articles[0].published_year = "2005-01-01"
+        self.articles[0].save()
+        self.articles[2].published_year = "2001-01-01"
+        self.articles[2].save()
+        self.assertEqual(self.counts(), {"kitob": 1, "va": 2, "qalam": 1, "gazeta": 1, "jurnal": 1})
+
+    def test_deleted_member_leaves(self):
+        self.articles[1].delete()
+        self.assertEqual(self.counts(), {"kitob": 1, "va": 1, "daftar": 1})
+
+    def test_materialize_again_when_articles_changed_meanwhile(self):
+        with mock.patch("main_app.models.CorpusState.current", side_effect=[1, 2, 2, 2, 3, 3]):
+            materialize(self.subcorpus.pk)
+        self.assertEqual(self.counts(), {"kitob": 2, "va": 2, "daftar": 1, "qalam": 1})
+
+
+@mock.patch("main_app.views.run_in_background")
+class SubcorpusViewTests(TestCase):
+    def setUp(self):
+        self.newspaper = Newspaper.objects.create(title="Xalq so'zi")
+        self.client.force_login(get_user_model().objects.create_user("user"))
+
+    def test_save(self, run_in_background):
+        response = self.client.post("/subcorpora", {"name": "Xalq so'zi", "newspapers": [self.newspaper.pk]})
+        subcorpus = Subcorpus.objects.get()
+        self.assertRedirects(response, f"/subcorpus/{subcorpus.pk}", fetch_redirect_response=False)
+        self.assertEqual(list(subcorpus.newspapers.all()), [self.newspaper])
+        run_in_background.assert_called_once_with(materialize, subcorpus.pk)
+
+    def test_unknown_newspaper(self, run_in_background):
+        response = self.client.post("/subcorpora", {"name": "Xalq so'zi", "newspapers": [self.newspaper.pk + 1]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subcorpus.objects.exists())
+        run_in_background.assert_not_called()
+
+
+class SnapshotDirectoryTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def snapshots(self) -> set[str]:
+        return {entry for entry in os.listdir(self.directory) if entry.startswith("generation-")}
+
+    @override_settings(VOCABULARY_REFRESH_SECONDS=60)
+    def test_replaced_snapshot_is_kept_for_a_refresh_interval(self):
+        first = write_snapshot(self.directory)
+        second = write_snapshot(self.directory)
+        self.assertEqual(self.snapshots(), {os.path.basename(first), os.path.basename(second)})
+        self.assertEqual(os.path.realpath(os.path.join(self.directory, "current")), second)
+
+    @override_settings(VOCABULARY_REFRESH_SECONDS=0)
+    def test_snapshots_replaced_earlier_are_removed(self):
+        write_snapshot(self.directory)
+        second = write_snapshot(self.directory)
+        self.assertEqual(self.snapshots(), {os.path.basename(second)})
+
+
+class UploadTests(TestCase):
+    @mock.patch("main_app.models.run_in_background")
+    def test_similar_articles_are_found_in_the_background(self, run_in_background):
+        csv_file = io.BytesIO(
+            b"title,author,newspaper,content,published_year,language\n"
+            b"Kitob,Muallif,Xalq so'zi,kitob va daftar,2001,Uzbek\n"
+        )
+        articles = Article.objects.create_from_csv(csv_file, duplicates="keep")
+        self.assertEqual([article.title for article in Article.objects.all()], ["Kitob"])
+        run_in_background.assert_called_once_with(add_similar, articles)
+
+
+class ConcordanceViewTests(TestCase):
+    def test_invalid_numbers(self):
+        for parameter in ["language", "year_from", "year_to", "context"]:
+            with self.subTest(parameter):
+                response = self.client.get("/concordance", {"q": "kitob", parameter: "x"})
+                self.assertEqual(response.status_code, 400)
+
+
+class BalanceViewTests(TestCase):
+    def test_seed_out_of_range(self):
+        for seed in ["-1", str(2**31), "x"]:
+            with self.subTest(seed):
+                response = self.client.get("/balance", {"seed": seed, "format": "json"})
+                self.assertEqual(response.status_code, 400)
+
+    def test_seed(self):
+        response = self.client.get("/balance", {"seed": str(2**31 - 1), "format": "json"})
+        self.assertEqual(response.json()["seed"], 2**31 - 1)
+
+
+class SearchTermsTests(SimpleTestCase):
+    @override_settings(WORD_TOKENIZER="punkt")
+    def test_words_are_split_like_by_the_index(self):
+        found = search_terms("<p>O'zbek tili, o'zbek xalqi.</p>", {"o'zbek"}, {"o'zbek"}, padding=1)
+        self.assertEqual(found["frequency"], 2)
+        self.assertEqual([location["context"] for location in found["locations"]], ["o'zbek tili", "tili o'zbek xalqi"])
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        Article.objects.create(
+            title="Kitob",
+            newspaper=Newspaper.objects.create(title="Xalq so'zi"),
+            content="kitoblar va kitob",
+            published_year="2001-01-01",
+        )
+
+    def test_expanded_words_are_highlighted(self):
+        response = self.client.get("/search", {"q": "kitob*", "language": Article.UZBEK})
+        self.assertEqual(sorted(response.context["highlight"]), ["kitob", "kitoblar"])
+        self.assertContains(response, '<script id="highlight-words" type="application/json">')
+
+    def test_substrings_of_plain_queries_are_highlighted(self):
+        response = self.client.get("/search", {"q": "kitob", "language": Article.UZBEK})
+        self.assertIsNone(response.context["highlight"])
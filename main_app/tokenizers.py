@@ -0,0 +1,69 @@
+"""
+Word tokenizers.
+
+The default tokenizer is a precompiled regular expression, so importing this
+module (and therefore starting a worker) never imports NLTK or touches the
+network. Setting ``WORD_TOKENIZER = "punkt"`` switches to NLTK's
+``word_tokenize``; NLTK is then imported on first use and its data is read
+from ``settings.NLTK_DATA`` only, see the ``download_nltk_data`` command.
+"""
+import logging
+import re
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# words keep inner apostrophes used by Uzbek latin script (o'zbek, g‘isht, maʼno),
+# every other non space character becomes a token of its own like in nltk
+WORD_RE = re.compile(r"\w+(?:['`‘’ʻʼ]\w+)*|[^\w\s]")
+# the same words without punctuation tokens, used to build the search index
+INDEX_WORD_RE = re.compile(r"\w+(?:['`‘’ʻʼ]\w+)*")
+
+NLTK_RESOURCE = "tokenizers/punkt_tab"
+
+_nltk_word_tokenize = None
+
+
+def regexp_tokenize(text: str) -> list[str]:
+    return WORD_RE.findall(text)
+
+
+def index_tokenize(text: str) -> list[str]:
+    """
+    Lowercased words of the text in order, the token positions stored in the
+    search index are indexes into this list
+    """
+    return INDEX_WORD_RE.findall(text.lower())
+
+
+def _load_nltk():
+    """Import nltk and check that punkt is available in settings.NLTK_DATA"""
+    import nltk
+
+    path = str(settings.NLTK_DATA)
+    if path not in nltk.data.path:
+        nltk.data.path.insert(0, path)
+    nltk.data.find(NLTK_RESOURCE)
+    return nltk.word_tokenize
+
+
+def word_tokenize(text: str) -> list[str]:
+    """
+    Split text into word and punctuation tokens with the configured tokenizer,
+    falling back to the regexp tokenizer when the punkt data is not installed
+    """
+    global _nltk_word_tokenize
+    if settings.WORD_TOKENIZER != "punkt":
+        return regexp_tokenize(text)
+    if _nltk_word_tokenize is None:
+        try:
+            _nltk_word_tokenize = _load_nltk()
+        except LookupError:
+            logger.warning(
+                "NLTK punkt data not found in %s, using the regexp tokenizer. "
+                "Run `manage.py download_nltk_data` to install it.",
+                settings.NLTK_DATA,
+            )
+            _nltk_word_tokenize = regexp_tokenize
+    return _nltk_word_tokenize(text)
@@ -19,9 +19,87 @@ class SearchResult(TypedDict): # python 3.10 does not support it yet
     results: List[SearchResultItem[T]]
     total_frequency: int
 
+class ConcordanceLine(TypedDict):
+    article_id: int
+    newspaper: str
+    year: int | None
+    left: str
+    keyword: str
+    right: str
+
 class FrequencyStat(TypedDict):
     word: str
     count: int
     language: str
 
-FrequencyStats= list[FrequencyStat]
\ No newline at end of file
+FrequencyStats= list[FrequencyStat]
+
+class SubcorpusFilter(TypedDict):
+    year_from: int | None
+    year_to: int | None
+    newspaper: int | None
+
+class KeynessRow(TypedDict):
+    word: str
+    frequency_a: int
+    frequency_b: int
+    per_million_a: float
+    per_million_b: float
+    log_likelihood: float
+    percent_diff: float | None
+    log_ratio: float
+    key_for: Literal['a', 'b']
+
+class UniqueWords(TypedDict):
+    count: int
+    exact: bool
+    # relative standard error of an estimated count
+    error: float
+
+class YearTotal(TypedDict):
+    language: int
+    year: int
+    articles: int
+    words: int
+
+class SampleYear(TypedDict):
+    language: int
+    year: int
+    articles: int
+    words: int
+    # whether the words are within the tolerance of the target
+    within: bool
+
+
+class ProfileCount(TypedDict):
+    # a year, or a newspaper title
+    key: int | str
+    count: int
+    tokens: int
+    per_million: float
+
+class Collocate(TypedDict):
+    word: str
+    # occurrences within the window of the word, and in the corpus
+    count: int
+    frequency: int
+    log_dice: float
+
+class ProfileLine(TypedDict):
+    article_id: int
+    title: str
+    year: int | None
+    left: str
+    word: str
+    right: str
+
+class WordProfile(TypedDict):
+    word: str
+    language: int
+    frequency: int
+    articles: int
+    per_million: float
+    years: list[ProfileCount]
+    newspapers: list[ProfileCount]
+    collocates: list[Collocate]
+    lines: list[ProfileLine]
\ No newline at end of file
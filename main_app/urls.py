@@ -7,13 +7,24 @@ register_converter(FourDigitYearConverter, "yyyy")
 urlpatterns = [
     path("", views.index, name="index"),
     path("search", views.search, name="search"),
+    path("autocomplete", views.autocomplete, name="autocomplete"),
+    path("word", views.word_profile, name="word_profile"),
+    path("concordance", views.concordance, name="concordance"),
+    path("keyness", views.keyness, name="keyness"),
+    path("keyness/download", views.keyness_download, name="keyness_download"),
+    path("unique_words", views.unique_words, name="unique_words"),
+    path("subcorpora", views.subcorpora, name="subcorpora"),
+    path("balance", views.balance, name="balance"),
+    path("subcorpus/<int:subcorpus_id>", views.subcorpus_detail, name="subcorpus_detail"),
     path("a", views.handle_csv_upload_view, name="a"),
     path("article/<int:article_id>", views.article_detail, name="article_detail"),
     path("word_frequency_data", views.word_frequency_data, name="word_frequency_data"),
     path("article/<int:article_id>/frequency_data", views.article_frequency, name="article_frequency"),
     path("year/<yyyy:year>", views.year_archive, name="year_archive"),
     path("year/<yyyy:year>/<str:language>/download", views.year_archive_download, name="year_archive_download"),
+    path("archive/download", views.frequency_archive_download, name="frequency_archive_download"),
     path("newspaper/<int:newspaper_id>", views.newspaper_detail, name="newspaper_detail"),
     path("newspaper/<int:newspaper_id>/frequency_data", views.newspaper_frequency, name="newspaper_frequency"),
     path("author", views.author, name="author"),
+    path("metrics", views.metrics, name="metrics"),
 ]
\ No newline at end of file
@@ -1,27 +1,27 @@
-import nltk
 import string
+from collections import Counter, deque
+from typing import Iterator
 from django.db.models import Func, Count, QuerySet
-from nltk.tokenize import RegexpTokenizer
 from main_app.counter import WordCounter
+from main_app.instrumentation import track
+from main_app.tokenizers import WORD_RE, index_tokenize, word_tokenize
 from main_app.types import Context, FrequencyStats, SearchResult, SearchResultItem
 
-nltk.download("punkt")
-
 
 def get_frequency_distribution(text: str, raw=False):
     """
     Get overall frequency distribution of a given text
     """
     if raw:
-        fd = nltk.FreqDist(
+        fd = Counter(
             word.lower() for word in text.split() if word not in string.punctuation
         )
         return fd
     else:
-        words = nltk.word_tokenize(text)
+        words = word_tokenize(text)
 
         # Calculate the frequency distribution with words punctuation removed
-        freq_dist = nltk.FreqDist(
+        freq_dist = Counter(
             word.lower() for word in words if word not in string.punctuation
         )
         # freq_dist = nltk.FreqDist(word.lower() for word in nltk.word_tokenize(sent))
@@ -37,7 +37,7 @@ def get_word_frequency(word: str, text: str):
 
 
 class RegexpReplace(Func):
-    """
+    r"""
 
     exaple RegexpReplace(
         'content',
@@ -51,10 +51,10 @@ class RegexpReplace(Func):
     arity = 2  # The number of arguments the function takes
 
 
-from nltk.tokenize import word_tokenize
 from django.utils.html import strip_tags
 
 
+@track("search")
 def search_word(text: str, word: str, padding=5) -> SearchResultItem:
     word = word.lower()
     text = strip_tags(text)  # remove HTML tags
@@ -84,6 +84,60 @@ def search_word(text: str, word: str, padding=5) -> SearchResultItem:
     return results
 
 
+@track("search")
+def search_terms(text: str, words: set[str], exact: set[str], padding=5) -> SearchResultItem:
+    """
+    Find the tokens that are one of the given vocabulary words, tokens in
+    `exact` are exact matches, other variants partial ones. The text is split
+    like by the search index, whichever ``WORD_TOKENIZER`` is configured, so
+    every indexed occurrence is found
+    """
+    text = strip_tags(text)  # remove HTML tags
+    tokens = index_tokenize(text)
+    count = 0
+    results = {"article": None, "frequency": 0, "locations": []}  # type: ignore
+    for i, token in enumerate(tokens):
+        if token in words:
+            count += 1
+            start = max(0, i - padding)
+            end = min(len(tokens), i + padding + 1)
+            results["locations"].append(
+                Context(
+                    count=count,
+                    context=" ".join(tokens[start:end]),
+                    type="exact" if token in exact else "partial",
+                )
+            )
+    results["frequency"] = count
+
+    # sort locations that exact matches come first
+    results["locations"].sort(key=lambda x: x["type"], reverse=False)
+    return results
+
+
+def concordance_lines(text: str, words: set[str], padding=10) -> Iterator[tuple[str, str, str]]:
+    """
+    (left context, keyword, right context) of every token of the text that is
+    one of the lowercased `words`, generated while scanning the tokens so
+    that neither the token list nor the lines are held in memory
+    """
+    left: deque[str] = deque(maxlen=padding)
+    # hits still collecting their right context
+    open_hits: deque[tuple[str, str, list[str]]] = deque()
+    for match in WORD_RE.finditer(strip_tags(text)):
+        token = match.group()
+        for _, _, right in open_hits:
+            right.append(token)
+        if token.lower() in words:
+            open_hits.append((" ".join(left), token, []))
+        while open_hits and len(open_hits[0][2]) >= padding:
+            before, keyword, right = open_hits.popleft()
+            yield before, keyword, " ".join(right)
+        left.append(token)
+    for before, keyword, right in open_hits:
+        yield before, keyword, " ".join(right)
+
+
 # class FrequencyStat(TypedDict):
 #     word: str
 #     count: int
@@ -92,34 +146,96 @@ def search_word(text: str, word: str, padding=5) -> SearchResultItem:
 # FrequencyStats= list[FrequencyStat]
 
 
+@track("count")
 def frequency_stats(articles: QuerySet) -> FrequencyStats:
+    from main_app.chunks import chunk_counts
+
     # tokenizer = RegexpTokenizer(r'\w+')
 
-    frequency_count: FrequencyStats = []
     # for article in articles:
     # words = tokenizer.tokenize(article.content.lower())
     # word_count = nltk.Counter(words)
     word_count = WordCounter([article.content for article in articles])
+    add_chunk_counts(word_count, chunk_counts(articles))
     # print(f"article: {article.title}, word_count: {word_count.total()}\n\n")
     # print(f"word_count: {word_count.total_words}\n\n", word_count.display_top_words())
     # for word, count in word_count.items():
-    for word, count in word_count.word_freq.items():
-        frequency_count.append(
-            {
-                "word": word,
-                "count": count,
-            }
-        )
-
-    frequency_count = sorted(frequency_count, key=lambda x: (-x["count"]))
+    frequency_count = frequency_list(word_count.word_freq)
     return frequency_count
 
 
+def frequency_list(word_freq: dict[str, int]) -> FrequencyStats:
+    """
+    Convert a word -> count mapping to a frequency list, most frequent first
+    """
+    frequency_count: FrequencyStats = [{"word": word, "count": count} for word, count in word_freq.items()]
+    return sorted(frequency_count, key=lambda x: (-x["count"]))
+
+
+@track("count")
 def word_count(articles: QuerySet) -> WordCounter:
     word_count = WordCounter([article.content for article in articles])
     return word_count
 
 
+def search_terms_contents(
+    contents: list[str], words: list[str], exact: list[str], padding=5
+) -> list[SearchResultItem]:
+    """
+    `search_terms` over several texts, takes plain strings so that it can run in a worker process
+    """
+    words, exact = set(words), set(exact)
+    return [search_terms(content, words, exact, padding=padding) for content in contents]
+
+
+def add_chunk_counts(counter: WordCounter, chunks: list[tuple[dict[str, int], int]]):
+    """Add the stored (word frequencies, word count) of chunks of long texts to the counter"""
+    for word_freq, total in chunks:
+        for word, count in word_freq.items():
+            counter.word_freq[word] = counter.word_freq.get(word, 0) + count
+        counter.total_words += total
+
+
+def content_stats(contents: list[str], chunks: list[tuple[dict[str, int], int]] = ()) -> tuple[FrequencyStats, int]:
+    """
+    Frequency list and total word count of the given texts in one pass, plus
+    the stored counts of their chunks. Takes plain values so that it can run
+    in a worker process.
+    """
+    counter = WordCounter(contents)
+    add_chunk_counts(counter, chunks)
+    return frequency_list(counter.word_freq), counter.total_words
+
+
+def search_contents(contents: list[str], word: str, padding=5) -> list[SearchResultItem]:
+    """
+    `search_word` over several texts, takes plain strings so that it can run in a worker process
+    """
+    return [search_word(content, word, padding=padding) for content in contents]
+
+
+def merge_search_results(size: int, owners: list[int], found: list[SearchResultItem]) -> list[SearchResultItem]:
+    """
+    Combine the results of several texts of the same article (`owners` holds
+    the index of the article of every text) into one result per article
+    """
+    parts: list[list[SearchResultItem]] = [[] for _ in range(size)]
+    for i, result in zip(owners, found):
+        parts[i].append(result)
+    merged = []
+    for results in parts:
+        if len(results) == 1:
+            merged.append(results[0])
+            continue
+        # number the locations in text order again, then exact matches first
+        locations = [location for result in results for location in sorted(result["locations"], key=lambda x: x["count"])]
+        for count, location in enumerate(locations, start=1):
+            location["count"] = count
+        locations.sort(key=lambda x: x["type"], reverse=False)
+        merged.append({"article": None, "frequency": sum(result["frequency"] for result in results), "locations": locations})
+    return merged
+
+
 def filter_by_match_type(results: SearchResult, match_type: int) -> SearchResult:
     """
     Filter search results by match type
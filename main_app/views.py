@@ -1,11 +1,74 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse, FileResponse
-from django.shortcuts import render
-from main_app.models import Article, Newspaper, create_frequency_csv
-from main_app.types import SearchResult
-from main_app.utils import filter_by_match_type, frequency_stats, word_count
+import asyncio
+import csv
+import json
+import secrets
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils.text import slugify
+from main_app.admission import EXPORT, REPORT, admission
+from main_app.exports import frequency_archive
+from main_app.executors import STATISTICS, run_in_background, run_in_pool
+from main_app.instrumentation import registry
+from main_app.keyness import keyness_rows, keyness_scores, top_keywords
+from main_app.models import Article, CorpusSlice, Newspaper, SimilarArticle, Subcorpus, frequency_csv_response
+from main_app.profiles import word_profiles
+from main_app.routers import analytics_reads
+from main_app.sampling import balanced_sample, year_totals
+from main_app.search_cache import cached_search
+from main_app.types import KeynessRow, SearchResult, SubcorpusFilter
+from main_app.chunks import achunk_counts
+from main_app.snapshot import get_snapshot, snapshot_frequency
+from main_app.slices import frequency_vector, slice_frequency, slice_unique_words, subcorpus_slices
+from main_app.subcorpora import bigram_list, frequency_list, materialize, subcorpus_frequency_vector
+from main_app.utils import content_stats
+from main_app.vocabulary import get_vocabulary
 
 # from main_app.utils import frequency_stats as f
 
+# templates may still touch the ORM (request.user, related managers), so the
+# async views render in a worker thread
+arender = sync_to_async(render)
+
+
+async def corpus_frequency(limit: int | None = None, **filters) -> tuple[list, int]:
+    """
+    Frequency list and total word count of the articles matching `filters`
+    of `CorpusSnapshot.rows`, counted from the corpus snapshot when it is
+    current and from the stored slice vectors otherwise, both index terms
+    without flagged duplicates so the lists don't change with the snapshot
+    """
+    snapshot = await sync_to_async(get_snapshot)()
+    if snapshot is not None:
+        try:
+            return await run_in_pool(STATISTICS, snapshot_frequency, snapshot.path, limit, **filters)
+        except OSError:
+            # the snapshot was removed after it was replaced
+            pass
+    return await sync_to_async(slice_frequency)(limit, **filters)
+
+
+async def count_article(article: Article) -> tuple[list, int]:
+    """
+    Statistics of a single article are cheap, count them in a thread outside
+    of the statistics pool so article pages don't queue behind corpus counts
+    """
+    chunks = await achunk_counts(Article.objects.filter(pk=article.pk)) if article.chunk_count else []
+    return await sync_to_async(content_stats, thread_sensitive=False)([article.content], chunks)
+
 
 # index view
 def index(request):
@@ -13,8 +76,7 @@ def index(request):
     Index view for main page
     """
     context = {
-        "newspapers": Newspaper.objects.prefetch_related("article_set"),
-        "word_frequency": frequency_stats(Article.objects.all()),
+        "newspapers": Newspaper.objects.all(),
         "article_count": Article.objects.count(),
         "word_count": Article.objects.count() * 500,
         "published_years": Article.objects.values("published_year")
@@ -27,7 +89,8 @@ def index(request):
 
 
 # search view
-def search(request: HttpRequest):
+@analytics_reads
+async def search(request: HttpRequest):
     """
     Search view for searching articles
     """
@@ -36,71 +99,139 @@ def search(request: HttpRequest):
     language = int(request.GET.get("language"))
     year = request.GET.get("year") or None
     match_type = int(request.GET.get("match_type") or 0)
-    print(f"match_type: {match_type}")
+    variants = bool(request.GET.get("variants"))
+    fuzzy = min(int(request.GET.get("fuzzy") or 0), 2)
+    subcorpus = int(request.GET.get("subcorpus") or 0) or None
     # get search results
-    results: SearchResult = Article.objects.search(query, language, year)
-    if match_type != 0:
-        results = filter_by_match_type(results, match_type)
+    try:
+        results: SearchResult = await cached_search(query, language, year, match_type, variants, fuzzy, subcorpus)
+        words = await sync_to_async(Article.objects.search_words)(query, language, variants, fuzzy)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
     # render search results
-    return render(
-        request, "search.html", {"results": results, "match_type": match_type}
+    return await arender(
+        request, "search.html", {"results": results, "match_type": match_type, "highlight": words}
     )
 
 
-def article_detail(request, article_id):
+async def article_detail(request, article_id):
     """
     Article detail view
     """
     # get article
-    article = Article.objects.get(id=article_id)
+    article = await Article.objects.aget(id=article_id)
+    frequency, total_words = await count_article(article)
+    # long texts are read one chunk per page, the content is the first one
+    page = min(max(int(request.GET.get("page") or 1), 1), article.chunk_count + 1)
+    if page == 1:
+        text = article.content
+    else:
+        text = await article.chunks.filter(number=page - 1).values_list("content", flat=True).aget()
+    # precomputed neighbors, see main_app.similarity
+    similar = [
+        item
+        async for item in SimilarArticle.objects.filter(article=article)
+        .select_related("neighbor__newspaper")
+        .defer("neighbor__content")
+    ]
     # render article detail
-    return render(
+    return await arender(
         request,
         "article_detail.html",
         {
             "article": article,
-            "word_frequency": frequency_stats([article]),
-            "word_count": word_count([article]).total_words,
+            "word_frequency": frequency,
+            "word_count": total_words,
+            "similar": similar,
+            "text": text,
+            "page": page,
+            "pages": range(1, article.chunk_count + 2),
         },
     )
 
 
-def word_frequency_data(request: HttpRequest) -> JsonResponse | HttpResponse:
+def statistics_pending(subcorpus: Subcorpus) -> HttpResponse:
+    """409 for a saved subcorpus whose statistics are still being computed"""
+    return HttpResponse(
+        f"The statistics of subcorpus {subcorpus.pk} are still being computed, please retry in a moment",
+        status=409,
+        content_type="text/plain",
+    )
+
+
+@admission(EXPORT)
+async def word_frequency_csv(request: HttpRequest) -> HttpResponse:
+    """
+    return the full frequency list of a language or of a saved subcorpus as csv
+    """
+    if request.GET.get("subcorpus"):
+        subcorpus = await aget_object_or_404(Subcorpus, pk=request.GET["subcorpus"])
+        if subcorpus.materialized is None:
+            return statistics_pending(subcorpus)
+        frequency = await sync_to_async(frequency_list)(subcorpus)
+        return frequency_csv_response(frequency, f"subcorpus-{subcorpus.pk}-frequency.csv")
+
+    if request.GET.get("language") == "uzbek":
+        language = Article.UZBEK
+    else:
+        language = Article.ENGLISH
+    frequency, _ = await corpus_frequency(language=language)
+    return frequency_csv_response(frequency)
+
+
+@analytics_reads
+async def word_frequency_data(request: HttpRequest) -> JsonResponse | HttpResponse:
     """
     return json object of word frequency data
     """
 
-    # check if "full" parameter is passed
+    # check if "full" parameter is passed, the full lists are exports and
+    # wait for a slot, the top 20 of the home page chart don't
     if request.GET.get("full"):
-        if request.GET.get("language") == "uzbek":
-            # articles = Article.objects.filter(language=Article.UZBEK).create_frequency_csv()
-            articles = Article.objects.create_frequency_csv(language=Article.UZBEK)
-        else:
-            # articles = Article.objects.filter(language=Article.ENGLISH).create_frequency_csv()
-            articles = Article.objects.create_frequency_csv(language=Article.ENGLISH)
-        return articles
+        return await word_frequency_csv(request)
 
-    else:
-        english = Article.objects.filter(language=Article.ENGLISH)
-        uzbek = Article.objects.filter(language=Article.UZBEK)
-        return JsonResponse(
-            {
-                "english": frequency_stats(english)[:20],
-                "uzbek": frequency_stats(uzbek)[:20],
-            },
-            safe=False,
-        )
+    # the stored frequency list of a saved subcorpus
+    if request.GET.get("subcorpus"):
+        subcorpus = await aget_object_or_404(Subcorpus, pk=request.GET["subcorpus"])
+        if subcorpus.materialized is None:
+            return statistics_pending(subcorpus)
+        return JsonResponse(await sync_to_async(frequency_list)(subcorpus, 20), safe=False)
+
+    (english, _), (uzbek, _) = await asyncio.gather(
+        corpus_frequency(20, language=Article.ENGLISH),
+        corpus_frequency(20, language=Article.UZBEK),
+    )
+    return JsonResponse(
+        {
+            "english": english[:20],
+            "uzbek": uzbek[:20],
+        },
+        safe=False,
+    )
 
     # return JsonResponse(frequency_stats(Article.objects.all())[:20], safe=False)
 
 
-def article_frequency(request, article_id) -> JsonResponse:
+async def article_frequency(request, article_id) -> JsonResponse:
     """
     return json object of word frequency data
     """
-    return JsonResponse(
-        frequency_stats([Article.objects.get(id=article_id)])[:20], safe=False
-    )
+    article = await Article.objects.aget(id=article_id)
+    frequency, _ = await count_article(article)
+    return JsonResponse(frequency[:20], safe=False)
+
+
+async def autocomplete(request: HttpRequest) -> JsonResponse:
+    """
+    return json list of the most frequent vocabulary words starting with `q`
+    """
+    prefix = request.GET.get("q", "").strip()
+    language = int(request.GET.get("language") or Article.ENGLISH)
+    limit = min(int(request.GET.get("limit") or 10), 50)
+    if not prefix:
+        return JsonResponse([], safe=False)
+    vocabulary = await sync_to_async(get_vocabulary)(language)
+    return JsonResponse(vocabulary.complete(prefix, limit), safe=False)
 
 
 def handle_csv_upload_view(request: HttpRequest):
@@ -118,79 +249,431 @@ def handle_csv_upload_view(request: HttpRequest):
     return render(request, "upload.html", {"newspapers": Newspaper.objects.all()})
 
 
-def year_archive(request, year: int):
+@admission(REPORT)
+@analytics_reads
+async def year_archive(request, year: int):
     """
     Year archive view
     """
-    # get articles
-    # articles = Article.objects.filter(published_year=f"{year}-01-01")
-
-    # get english and uzbek articles separately
+    # get english and uzbek articles separately, flagged duplicates are left out of the counts like of the frequencies
 
     english = Article.objects.filter(
-        language=Article.ENGLISH, published_year=f"{year}-01-01"
+        language=Article.ENGLISH, published_year=f"{year}-01-01", duplicate_of=None
     )
     uzbek = Article.objects.filter(
-        language=Article.UZBEK, published_year=f"{year}-01-01"
+        language=Article.UZBEK, published_year=f"{year}-01-01", duplicate_of=None
+    )
+    (english_frequency, total_english_words), (uzbek_frequency, total_uzbek_words) = await asyncio.gather(
+        corpus_frequency(language=Article.ENGLISH, year_from=year, year_to=year),
+        corpus_frequency(language=Article.UZBEK, year_from=year, year_to=year),
     )
 
     # render year archive
-    return render(
+    return await arender(
         request,
         "year_archive.html",
         {
-            "english_article_count": english.count(),
-            "english_frequency": frequency_stats(english),
-            "total_english_words": word_count(english).total_words,
-            "uzbek_article_count": uzbek.count(),
-            "uzbek_frequency": frequency_stats(uzbek),
-            "total_uzbek_words": word_count(uzbek).total_words,
+            "english_article_count": await english.acount(),
+            "english_frequency": english_frequency,
+            "total_english_words": total_english_words,
+            "uzbek_article_count": await uzbek.acount(),
+            "uzbek_frequency": uzbek_frequency,
+            "total_uzbek_words": total_uzbek_words,
             "year": year,
         },
     )
 
 
-def year_archive_download(request, year: int, language: str):
+@admission(EXPORT)
+@analytics_reads
+async def year_archive_download(request, year: int, language: str):
     """
     Year archive view
     """
-    # get articles
-    articles = Article.objects.filter(published_year=f"{year}-01-01", language=language)
-    csv_response = create_frequency_csv(articles, f"{year}_{language}_archieve.csv")
+    frequency, _ = await corpus_frequency(language=int(language), year_from=year, year_to=year)
 
     # render year archive
-    return csv_response
+    return frequency_csv_response(frequency, f"{year}_{language}_archieve.csv")
+
+
+@admission(EXPORT)
+@analytics_reads
+def frequency_archive_download(request: HttpRequest):
+    """
+    Stream a ZIP of the frequency lists of every year and language, and of
+    every newspaper with ``newspapers=1``, read from the corpus slices
+    """
+    try:
+        language = int(request.GET.get("language") or 0) or None
+        year_from = int(request.GET.get("year_from") or 0) or None
+        year_to = int(request.GET.get("year_to") or 0) or None
+    except ValueError:
+        return HttpResponseBadRequest("Invalid filters")
+    archive = frequency_archive(language, year_from, year_to, newspapers=bool(request.GET.get("newspapers")))
+    response = StreamingHttpResponse(streamed(request, archive), content_type="application/zip")
+    response["Content-Disposition"] = 'attachment; filename="frequencies.zip"'
+    return response
 
 
-def newspaper_detail(request, newspaper_id):
+async def newspaper_detail(request, newspaper_id):
     """
     Newspaper detail view
     """
     # get newspaper
-    newspaper = Newspaper.objects.get(id=newspaper_id)
+    newspaper = await Newspaper.objects.aget(id=newspaper_id)
+    article_count = await newspaper.article_set.acount()
+    unique_words = await sync_to_async(slice_unique_words)(CorpusSlice.objects.filter(newspaper=newspaper))
+    articles = [article async for article in newspaper.article_set.all().with_excerpt()]
     # render newspaper detail
-    return render(
+    return await arender(
         request,
         "newspaper_detail.html",
         {
             "newspaper": newspaper,
-            "article_count": newspaper.article_set.count(),
-            "word_count": newspaper.article_set.count() * 500,
-            "word_frequency": frequency_stats(newspaper.article_set.all()),
+            "articles": articles,
+            "article_count": article_count,
+            "word_count": article_count * 500,
+            "unique_words": unique_words,
         },
     )
 
 
-def newspaper_frequency(request, newspaper_id) -> JsonResponse:
+@admission(REPORT)
+@analytics_reads
+async def word_profile(request: HttpRequest):
     """
-    return json object of word frequency data
+    Frequency by year and newspaper, collocates and sample lines of a word in
+    every language, or in ``language``, read from the search index (as JSON
+    with ``format=json``)
     """
-    return JsonResponse(
-        frequency_stats(Article.objects.filter(newspaper_id=newspaper_id)[:20]),
-        safe=False,
+    word = request.GET.get("q", "").strip()
+    try:
+        language = int(request.GET.get("language") or 0) or None
+    except ValueError:
+        return HttpResponseBadRequest("Invalid language")
+    if not word:
+        return redirect("index")
+    profiles = await sync_to_async(word_profiles)(word, language)
+    if request.GET.get("format") == "json":
+        return JsonResponse(profiles, safe=False)
+    return await arender(request, "word_profile.html", {"word": word, "profiles": profiles})
+
+
+@admission(REPORT)
+@analytics_reads
+async def newspaper_frequency(request, newspaper_id) -> JsonResponse:
+    """
+    return json object of the 20 most frequent words of the newspaper, summed from its stored slices
+    """
+    frequency, _ = await sync_to_async(slice_frequency)(20, newspaper=newspaper_id)
+    return JsonResponse(frequency, safe=False)
+
+
+class Echo:
+    """File-like object handing back what is written, lets csv.writer produce streamed rows"""
+
+    def write(self, value):
+        return value
+
+
+async def _athread(iterator):
+    iterator = iter(iterator)
+    done = object()
+    try:
+        while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+            yield chunk
+    finally:
+        if close := getattr(iterator, "close", None):
+            await sync_to_async(close)()
+
+
+def streamed(request: HttpRequest, iterator):
+    """
+    Content of a `StreamingHttpResponse` of a sync view. Under ASGI Django
+    would read a sync iterator into a list before sending it, so every chunk
+    is produced through `sync_to_async` instead, in the thread of the view.
+    """
+    if isinstance(request, ASGIRequest):
+        return _athread(iterator)
+    return iterator
+
+
+@admission(EXPORT)
+@analytics_reads
+def concordance(request: HttpRequest):
+    """
+    Stream every concordance (KWIC) line of a word over a year range as CSV
+    or JSONL, rows are written while the matching articles are read
+    """
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return HttpResponseBadRequest("q is required")
+    output = "jsonl" if request.GET.get("format") == "jsonl" else "csv"
+    try:
+        language = int(request.GET.get("language") or Article.UZBEK)
+        year_from = int(request.GET.get("year_from") or 0) or None
+        year_to = int(request.GET.get("year_to") or 0) or None
+        padding = max(1, min(int(request.GET.get("context") or 10), 50))
+        lines = Article.objects.concordance(
+            query,
+            language,
+            year_from,
+            year_to,
+            variants=bool(request.GET.get("variants")),
+            padding=padding,
+            subcorpus=int(request.GET.get("subcorpus") or 0) or None,
+        )
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+
+    if output == "jsonl":
+        rows = (json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+        content_type = "application/x-ndjson; charset=utf-8"
+    else:
+        writer = csv.writer(Echo())
+        header = ["article_id", "newspaper", "year", "left", "keyword", "right"]
+        rows = (writer.writerow(row) for row in chain([header], (line.values() for line in lines)))
+        content_type = "text/csv; charset=utf-8"
+    response = StreamingHttpResponse(streamed(request, rows), content_type=content_type)
+    filename = f"concordance-{slugify(query) or 'pattern'}.{output}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def subcorpus_filter(request: HttpRequest, side: str) -> SubcorpusFilter:
+    """Year range and newspaper of subcorpus `side` ("a" or "b") from the query string"""
+    return SubcorpusFilter(
+        year_from=int(request.GET.get(f"{side}_from") or 0) or None,
+        year_to=int(request.GET.get(f"{side}_to") or 0) or None,
+        newspaper=int(request.GET.get(f"{side}_newspaper") or 0) or None,
     )
 
 
+def subcorpus_vector(request: HttpRequest, side: str, language: int):
+    """
+    Frequency vector, token and article count of subcorpus `side`: the saved
+    subcorpus ``{side}_subcorpus`` or the slices matching its filters
+    """
+    saved = int(request.GET.get(f"{side}_subcorpus") or 0)
+    if not saved:
+        return frequency_vector(subcorpus_slices(language, **subcorpus_filter(request, side)))
+    subcorpus = Subcorpus.objects.filter(pk=saved, language=language).exclude(materialized=None).first()
+    if subcorpus is None:
+        raise ValueError(f"No saved subcorpus {saved} with computed statistics in this language")
+    return subcorpus_frequency_vector(subcorpus)
+
+
+@admission(REPORT)
+@analytics_reads
+async def keyness(request: HttpRequest):
+    """
+    Keywords of subcorpus A compared to subcorpus B (the whole language by
+    default) and of B compared to A, as a page or as JSON with ``format=json``
+    """
+    try:
+        language = int(request.GET.get("language") or Article.UZBEK)
+        k = min(int(request.GET.get("k") or 50), 500)
+        min_frequency = int(request.GET.get("min_frequency") or 5)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid subcorpus filters")
+    context = {
+        "newspapers": [newspaper async for newspaper in Newspaper.objects.order_by("title")],
+        "saved": [
+            subcorpus async for subcorpus in Subcorpus.objects.exclude(materialized=None).only("name", "language")
+        ],
+        "sides": [("a", "A"), ("b", "B")],
+        "k": k,
+    }
+    if request.GET.get("compare") or request.GET.get("format") == "json":
+        try:
+            vector = sync_to_async(subcorpus_vector)
+            (vector_a, tokens_a, _), (vector_b, tokens_b, _) = (
+                await vector(request, "a", language),
+                await vector(request, "b", language),
+            )
+            result = await run_in_pool(
+                STATISTICS, keyness_scores, vector_a, tokens_a, vector_b, tokens_b, min_frequency
+            )
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+        rows = sync_to_async(lambda positions: list(keyness_rows(result, positions)))
+        context.update(
+            {
+                "tokens_a": result.tokens_a,
+                "tokens_b": result.tokens_b,
+                "keywords_a": await rows(top_keywords(result, k, "a")),
+                "keywords_b": await rows(top_keywords(result, k, "b")),
+            }
+        )
+        if request.GET.get("format") == "json":
+            del context["newspapers"], context["saved"], context["sides"]
+            return JsonResponse(context)
+        context["results"] = [
+            ("A", result.tokens_a, context["keywords_a"]),
+            ("B", result.tokens_b, context["keywords_b"]),
+        ]
+    return await arender(request, "keyness.html", context)
+
+
+@admission(EXPORT)
+@analytics_reads
+def keyness_download(request: HttpRequest):
+    """
+    Stream the keyness of every word of subcorpus A against B as CSV, sorted by log-likelihood
+    """
+    try:
+        language = int(request.GET.get("language") or Article.UZBEK)
+        vector_a, tokens_a, _ = subcorpus_vector(request, "a", language)
+        vector_b, tokens_b, _ = subcorpus_vector(request, "b", language)
+        result = keyness_scores(vector_a, tokens_a, vector_b, tokens_b, int(request.GET.get("min_frequency") or 5))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    writer = csv.writer(Echo())
+    header = list(KeynessRow.__annotations__)
+    rows = (writer.writerow(row) for row in chain([header], (row.values() for row in keyness_rows(result))))
+    response = StreamingHttpResponse(streamed(request, rows), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = 'attachment; filename="keyness.csv"'
+    return response
+
+
+@analytics_reads
+async def unique_words(request: HttpRequest) -> JsonResponse | HttpResponse:
+    """
+    Unique word count of the articles of a language within a year range and
+    of one newspaper, estimated from the slice sketches or exact with ``exact=1``
+    """
+    try:
+        language = int(request.GET.get("language") or Article.UZBEK)
+        slices = subcorpus_slices(
+            language,
+            year_from=int(request.GET.get("year_from") or 0) or None,
+            year_to=int(request.GET.get("year_to") or 0) or None,
+            newspaper=int(request.GET.get("newspaper") or 0) or None,
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid filters")
+    return JsonResponse(await sync_to_async(slice_unique_words)(slices, exact=bool(request.GET.get("exact"))))
+
+
+def subcorpora(request: HttpRequest):
+    """
+    Saved subcorpora, and a form to save a new one: its statistics are
+    computed in the background and refreshed as its articles change
+    """
+    if request.method == "POST":
+        if not request.user.is_authenticated:
+            return HttpResponseForbidden()
+        try:
+            name = request.POST["name"].strip()[:200] or "Untitled"
+            language = int(request.POST.get("language") or Article.UZBEK)
+            year_from = int(request.POST.get("year_from") or 0) or None
+            year_to = int(request.POST.get("year_to") or 0) or None
+            newspapers = {int(newspaper) for newspaper in request.POST.getlist("newspapers")}
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest("Invalid subcorpus definition")
+        if Newspaper.objects.filter(pk__in=newspapers).count() != len(newspapers):
+            return HttpResponseBadRequest("Unknown newspaper")
+        with transaction.atomic():
+            subcorpus = Subcorpus.objects.create(
+                name=name, owner=request.user, language=language, year_from=year_from, year_to=year_to
+            )
+            subcorpus.newspapers.set(newspapers)
+        run_in_background(materialize, subcorpus.pk)
+        return redirect("subcorpus_detail", subcorpus_id=subcorpus.pk)
+    context = {
+        "subcorpora": Subcorpus.objects.select_related("owner").defer(
+            "term_ids", "counts", "bigram_keys", "bigram_counts"
+        ),
+        "newspapers": Newspaper.objects.order_by("title"),
+    }
+    return render(request, "subcorpora.html", context)
+
+
+@admission(REPORT)
+def balance(request: HttpRequest):
+    """
+    Words of every language and year of the corpus, and a balanced sample of
+    about ``words_per_year`` words per year of one language: previewed on GET
+    (as JSON with ``format=json``), saved as a subcorpus on POST
+    """
+    data = request.POST if request.method == "POST" else request.GET
+    try:
+        language = int(data.get("language") or Article.UZBEK)
+        year_from = int(data.get("year_from") or 0) or None
+        year_to = int(data.get("year_to") or 0) or None
+        newspapers = [int(newspaper) for newspaper in data.getlist("newspapers")]
+        words_per_year = int(data.get("words_per_year") or 0)
+        tolerance = float(data.get("tolerance") or 0.05)
+        seed = int(data.get("seed") or secrets.randbelow(2**31))
+        if not 0 <= seed < 2**31:
+            raise ValueError(seed)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid sample definition")
+    articles = Article.objects.filter(language=language, duplicate_of=None)
+    if year_from:
+        articles = articles.filter(published_year__year__gte=year_from)
+    if year_to:
+        articles = articles.filter(published_year__year__lte=year_to)
+    if newspapers:
+        articles = articles.filter(newspaper_id__in=newspapers)
+    totals = year_totals(Article.objects.filter(duplicate_of=None))
+    context = {"totals": totals, "seed": seed, "tolerance": tolerance}
+    if words_per_year:
+        ids, report = balanced_sample(articles, words_per_year, tolerance, seed)
+        if request.method == "POST":
+            if not request.user.is_authenticated:
+                return HttpResponseForbidden()
+            subcorpus = Subcorpus.objects.create(
+                name=data.get("name", "").strip()[:200] or f"Balanced sample {seed}",
+                owner=request.user,
+                language=language,
+                year_from=year_from,
+                year_to=year_to,
+                seed=seed,
+                words_per_year=words_per_year,
+                tolerance=tolerance,
+            )
+            subcorpus.newspapers.set(newspapers)
+            subcorpus.articles.set(ids)
+            run_in_background(materialize, subcorpus.pk)
+            return redirect("subcorpus_detail", subcorpus_id=subcorpus.pk)
+        context.update(
+            {
+                "sample": report,
+                "sample_articles": len(ids),
+                "sample_words": sum(year["words"] for year in report),
+                "words_per_year": words_per_year,
+            }
+        )
+    if data.get("format") == "json":
+        return JsonResponse(context)
+    years = {}
+    for total in totals:
+        years.setdefault(total["year"], {})[total["language"]] = total
+    context.update(
+        {
+            "years": [(year, row.get(Article.ENGLISH), row.get(Article.UZBEK)) for year, row in years.items()],
+            "newspapers": Newspaper.objects.order_by("title"),
+            "form": {"language": language, "year_from": year_from, "year_to": year_to, "newspapers": newspapers},
+        }
+    )
+    return render(request, "balance.html", context)
+
+
+async def subcorpus_detail(request, subcorpus_id):
+    """
+    Saved subcorpus view with its stored totals, frequency list and bigrams
+    """
+    subcorpus = await aget_object_or_404(Subcorpus, id=subcorpus_id)
+    context = {"subcorpus": subcorpus, "newspapers": [newspaper async for newspaper in subcorpus.newspapers.all()]}
+    if subcorpus.materialized:
+        context["frequency"] = await sync_to_async(frequency_list)(subcorpus, 100)
+        context["bigrams"] = await sync_to_async(bigram_list)(subcorpus, 50)
+        # one packed 32 bit term id per distinct word
+        context["unique_words"] = len(subcorpus.term_ids) // 4
+    return await arender(request, "subcorpus_detail.html", context)
+
+
 def author(request):
     """
     Author view that returns pdf file
@@ -198,3 +681,13 @@ def author(request):
     response = FileResponse(open("author.pdf", "rb"), content_type="application/pdf")
     response["Content-Disposition"] = "attachment; filename=NozimjonAtaboyevCV.pdf"
     return response
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    """
+    Prometheus metrics endpoint, open to staff and to METRICS_ALLOWED_IPS
+    """
+    allowed = request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+    if not allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
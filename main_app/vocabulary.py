@@ -0,0 +1,207 @@
+"""
+In-memory term dictionaries built from the search index vocabulary.
+
+Every worker keeps one sorted array of words per language together with their
+corpus frequencies. Prefix lookups are two binary searches, so autocomplete
+never touches `Article.content` or even the database. Spelling variants are
+grouped by their normalized key and fuzzy lookups go through a BK-tree.
+Wildcard and regex patterns are matched against the words whose prefix or
+suffix (through a sorted index of reversed words) they require.
+The dictionaries are rebuilt from `Term` when the corpus generation changes,
+checked at most every ``settings.VOCABULARY_REFRESH_SECONDS``.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import NamedTuple
+
+from django.conf import settings
+
+from main_app.orthography import BKTree, normalize_term
+from main_app.types import FrequencyStats
+
+MAX_PATTERN_LENGTH = 64
+MAX_PATTERN_REPEATS = 4
+REGEX_SPECIAL = set(".[]{}*+?|^$")
+
+
+class TermPattern(NamedTuple):
+    regex: re.Pattern
+    # literal start and end every matching word has, used to narrow the candidates
+    prefix: str
+    suffix: str
+
+
+def _literal_prefix(pattern: str) -> str:
+    end = 0
+    while end < len(pattern) and pattern[end] not in REGEX_SPECIAL:
+        end += 1
+    if end < len(pattern) and pattern[end] in "*?{":
+        # the last literal is optional or repeated
+        end -= 1
+    return pattern[: max(end, 0)]
+
+
+def _literal_suffix(pattern: str) -> str:
+    start = len(pattern)
+    while start > 0 and pattern[start - 1] not in REGEX_SPECIAL:
+        start -= 1
+    return pattern[start:]
+
+
+def parse_pattern(query: str) -> TermPattern | None:
+    """
+    Term pattern of a wildcard query (`kitob*`, `*lar`, `o?qituvchi`) or of a
+    restricted regex between slashes (`/kitob(lar)?/` is written `/kitob|kitoblar/`):
+    literals, `.`, character classes, quantifiers and alternation only, without
+    groups a word can not make the matching backtrack exponentially.
+    None if the query is a plain word, ValueError if the pattern is invalid.
+    """
+    query = query.strip().lower()
+    if len(query) > 2 and query.startswith("/") and query.endswith("/"):
+        pattern = query[1:-1].removeprefix("^").removesuffix("$")
+        if "(" in pattern or ")" in pattern or "\\" in pattern:
+            raise ValueError("Groups and escapes are not supported in regex queries")
+        repeats = sum(pattern.count(char) for char in "*+{")
+        alternatives = "|" in pattern
+        prefix = "" if alternatives else _literal_prefix(pattern)
+        suffix = "" if alternatives else _literal_suffix(pattern)
+    elif "*" in query or "?" in query:
+        pattern = "".join(".*" if char == "*" else "." if char == "?" else re.escape(char) for char in query)
+        repeats = query.count("*")
+        prefix = re.split(r"[*?]", query)[0]
+        suffix = re.split(r"[*?]", query)[-1]
+    else:
+        return None
+    if len(pattern) > MAX_PATTERN_LENGTH or repeats > MAX_PATTERN_REPEATS:
+        raise ValueError("The pattern is too long or has too many repetitions")
+    try:
+        regex = re.compile(pattern)
+    except re.error as error:
+        raise ValueError(f"Invalid pattern: {error}") from error
+    return TermPattern(regex, prefix, suffix)
+
+
+class Vocabulary:
+    """
+    Sorted words of one language with their corpus frequencies and their
+    spelling-variant keys
+    """
+
+    def __init__(self, language: int, generation: int, entries: list[tuple[str, str, int]]):
+        entries.sort()
+        self.language = language
+        self.generation = generation
+        self.words = [word for word, _, _ in entries]
+        self.frequencies = [frequency for _, _, frequency in entries]
+        self.variants: dict[str, list[int]] = {}
+        for i, (_, normalized, _) in enumerate(entries):
+            self.variants.setdefault(normalized, []).append(i)
+        self._bk_tree = None
+        self._suffix_index = None
+        self._bk_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, language: int, generation: int) -> "Vocabulary":
+        from main_app.models import Term
+
+        entries = Term.objects.filter(language=language, frequency__gt=0).values_list("word", "normalized", "frequency")
+        return cls(language, generation, list(entries))
+
+    def __len__(self):
+        return len(self.words)
+
+    def prefix_range(self, prefix: str) -> tuple[int, int]:
+        """Index range of the words starting with `prefix`"""
+        start = bisect_left(self.words, prefix)
+        end = bisect_left(self.words, prefix + "\U0010ffff", lo=start)
+        return start, end
+
+    def complete(self, prefix: str, limit: int = 10) -> FrequencyStats:
+        """The `limit` most frequent words starting with `prefix`"""
+        start, end = self.prefix_range(prefix.lower())
+        best = heapq.nlargest(limit, range(start, end), key=self.frequencies.__getitem__)
+        return [{"word": self.words[i], "count": self.frequencies[i]} for i in best]
+
+    @property
+    def suffix_index(self) -> tuple[list[str], list[int]]:
+        """Reversed words in sorted order with the index of their word, built on first use"""
+        if self._suffix_index is None:
+            with self._bk_lock:
+                if self._suffix_index is None:
+                    entries = sorted((word[::-1], i) for i, word in enumerate(self.words))
+                    self._suffix_index = ([word for word, _ in entries], [i for _, i in entries])
+        return self._suffix_index
+
+    def suffix_range(self, suffix: str) -> list[int]:
+        """Indexes of the words ending with `suffix`"""
+        reversed_words, order = self.suffix_index
+        reversed_suffix = suffix[::-1]
+        start = bisect_left(reversed_words, reversed_suffix)
+        end = bisect_left(reversed_words, reversed_suffix + "\U0010ffff", lo=start)
+        return order[start:end]
+
+    @property
+    def bk_tree(self) -> BKTree:
+        """BK-tree of the spelling-variant keys, built on first fuzzy lookup"""
+        if self._bk_tree is None:
+            with self._bk_lock:
+                if self._bk_tree is None:
+                    self._bk_tree = BKTree(self.variants)
+        return self._bk_tree
+
+    def most_frequent(self, indexes, limit: int | None = None) -> list[str]:
+        limit = limit or settings.TERM_EXPANSION_LIMIT
+        return [self.words[i] for i in heapq.nlargest(limit, indexes, key=self.frequencies.__getitem__)]
+
+    def expand(self, query: str, fuzzy: int = 0) -> list[str]:
+        """
+        Vocabulary words sharing the spelling-variant key of `query`, or within
+        `fuzzy` edits of it, most frequent first
+        """
+        key = normalize_term(query.strip())
+        if fuzzy:
+            keys = [variant for _, variant in self.bk_tree.search(key, fuzzy)]
+        else:
+            keys = [key]
+        return self.most_frequent(i for variant in keys for i in self.variants.get(variant, ()))
+
+    def match(self, pattern: TermPattern) -> list[str]:
+        """
+        Vocabulary words matching the whole pattern, most frequent first. Only
+        the words with its literal prefix or suffix, whichever are fewer, are tested.
+        """
+        candidates = range(*self.prefix_range(pattern.prefix))
+        if pattern.suffix:
+            ending = self.suffix_range(pattern.suffix)
+            if len(ending) < len(candidates):
+                candidates = ending
+        fullmatch = pattern.regex.fullmatch
+        return self.most_frequent(i for i in candidates if fullmatch(self.words[i]))
+
+
+_vocabularies: dict[int, Vocabulary] = {}
+_checked: dict[int, float] = {}
+_lock = threading.Lock()
+
+
+def get_vocabulary(language: int) -> Vocabulary:
+    """
+    The term dictionary of `language`, reloaded when the corpus generation
+    changed since it was built
+    """
+    from main_app.models import CorpusState
+
+    vocabulary = _vocabularies.get(language)
+    now = time.monotonic()
+    if vocabulary is not None and now - _checked.get(language, 0) < settings.VOCABULARY_REFRESH_SECONDS:
+        return vocabulary
+    with _lock:
+        vocabulary = _vocabularies.get(language)
+        generation = CorpusState.current()
+        if vocabulary is None or vocabulary.generation != generation:
+            vocabulary = _vocabularies[language] = Vocabulary.load(language, generation)
+        _checked[language] = now
+    return vocabulary
@@ -59,6 +59,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "main_app.instrumentation.TimingMiddleware",
+    # warns about views loading article texts they don't read, only with DEBUG on
+    "main_app.content_guard.ContentGuardMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -67,6 +70,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",
+    "main_app.profiling.ProfilerMiddleware",
 ]
 
 SITE_ID = 1
@@ -78,7 +82,7 @@ ROOT_URLCONF = "uzAnalytica.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "main_app.instrumentation.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -100,6 +104,22 @@ WSGI_APPLICATION = "uzAnalytica.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# With DB_POOL=true every worker keeps a psycopg 3 connection pool (from
+# `psycopg[pool]`) of DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections,
+# otherwise connections are reused for DB_CONN_MAX_AGE seconds
+DB_POOL = os.environ.get("DB_POOL") == "true"
+DB_OPTIONS = (
+    {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            "timeout": int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        }
+    }
+    if DB_POOL
+    else {}
+)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -108,9 +128,31 @@ DATABASES = {
         "PASSWORD": os.environ.get("DB_PASSWORD"),
         "HOST": os.environ.get("DB_HOST"),
         "PORT": os.environ.get("DB_PORT"),
+        "CONN_MAX_AGE": 0 if DB_POOL else int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": DB_OPTIONS,
     }
 }
 
+# Read-only analytics queries (search, frequencies, keyness, exports) go to a
+# second database, e.g. a streaming replica, when ANALYTICS_DB_HOST is set,
+# see main_app/routers.py. Unset ANALYTICS_DB_* values default to the DB_* ones.
+if os.environ.get("ANALYTICS_DB_HOST"):
+    DATABASES["analytics"] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get("ANALYTICS_DB_NAME", DATABASES["default"]["NAME"]),
+        "USER": os.environ.get("ANALYTICS_DB_USER", DATABASES["default"]["USER"]),
+        "PASSWORD": os.environ.get("ANALYTICS_DB_PASSWORD", DATABASES["default"]["PASSWORD"]),
+        "HOST": os.environ.get("ANALYTICS_DB_HOST"),
+        "PORT": os.environ.get("ANALYTICS_DB_PORT", DATABASES["default"]["PORT"]),
+        # fail fast so the health check can fall back to the primary
+        "OPTIONS": {**DB_OPTIONS, "connect_timeout": int(os.environ.get("ANALYTICS_DB_CONNECT_TIMEOUT", "3"))},
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["main_app.routers.AnalyticsRouter"]
+# Seconds between health checks of the analytics database
+ANALYTICS_HEALTH_CHECK_SECONDS = int(os.environ.get("ANALYTICS_HEALTH_CHECK_SECONDS", "10"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -159,3 +201,78 @@ MEDIA_URL = os.getenv("MEDIA_URL")
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = None
+
+# Performance instrumentation: Server-Timing header on every response and
+# prometheus metrics at /metrics. Set METRICS_DIR to a directory shared by the
+# gunicorn workers so /metrics exports the totals of all workers.
+SERVER_TIMING_HEADER = os.environ.get("SERVER_TIMING_HEADER", "true") == "true"
+METRICS_ALLOWED_IPS = os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1").split(",")
+METRICS_DIR = os.environ.get("METRICS_DIR")
+
+# On-demand request profiler for staff users: add ?_profile=1 to a url
+PROFILER_PARAM = "_profile"
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", "0.005"))
+
+# Word tokenizer used for search contexts: "regexp" (default, no NLTK import)
+# or "punkt" (NLTK word_tokenize with data loaded from NLTK_DATA, never
+# downloaded at runtime, see `manage.py download_nltk_data`)
+WORD_TOKENIZER = os.environ.get("WORD_TOKENIZER", "regexp")
+NLTK_DATA = os.environ.get("NLTK_DATA", BASE_DIR / "nltk_data")
+
+# CPU heavy work of the async views (search, frequency statistics) runs in one
+# bounded pool per endpoint class, the pool size is its concurrency limit
+CPU_POOL_KIND = os.environ.get("CPU_POOL_KIND", "process")
+CPU_POOL_WORKERS = {
+    "search": int(os.environ.get("SEARCH_POOL_WORKERS", "2")),
+    "statistics": int(os.environ.get("STATISTICS_POOL_WORKERS", "2")),
+}
+
+# Per worker LRU cache of search results, keyed by query, filters and corpus generation
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# How often workers check whether their in-memory term dictionaries are stale
+VOCABULARY_REFRESH_SECONDS = int(os.environ.get("VOCABULARY_REFRESH_SECONDS", "5"))
+
+# Fold Uzbek Cyrillic spellings into the Latin spelling-variant keys of the
+# search index (changing it requires `manage.py normalize_terms`)
+TRANSLITERATE_CYRILLIC = os.environ.get("TRANSLITERATE_CYRILLIC", "true") == "true"
+# Maximum number of vocabulary words a variant, fuzzy or wildcard query expands to
+TERM_EXPANSION_LIMIT = int(os.environ.get("TERM_EXPANSION_LIMIT", "200"))
+
+# near-duplicate articles found at import are skipped, flagged (duplicate_of) or kept
+DUPLICATE_POLICY = os.environ.get("DUPLICATE_POLICY", "flag")
+# estimated Jaccard similarity of word 3-grams above which articles are near-duplicates
+DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", 0.8))
+
+# Directory of the memory-mapped corpus snapshot (see main_app/snapshot.py)
+# shared by the workers of a host; when set, the year archive and corpus
+# frequency lists count index tokens from it instead of reading the texts
+CORPUS_SNAPSHOT_DIR = os.environ.get("CORPUS_SNAPSHOT_DIR")
+
+# Number of precomputed TF-IDF neighbors shown as similar articles
+SIMILAR_ARTICLES = int(os.environ.get("SIMILAR_ARTICLES", "5"))
+
+# Texts longer than ARTICLE_CHUNK_THRESHOLD characters (books) are stored in
+# chunks of about ARTICLE_CHUNK_SIZE characters, see main_app/chunks.py
+ARTICLE_CHUNK_THRESHOLD = int(os.environ.get("ARTICLE_CHUNK_THRESHOLD", 100_000))
+ARTICLE_CHUNK_SIZE = int(os.environ.get("ARTICLE_CHUNK_SIZE", 20_000))
+
+# Admission control of the expensive views, shared by the workers of a host
+# through lock files in ADMISSION_DIR (see main_app/admission.py): at most
+# `limit` requests of a class run at once, up to `queue` more wait `timeout`
+# seconds for a slot and the others get a 429 with Retry-After `retry_after`
+ADMISSION_DIR = os.environ.get("ADMISSION_DIR", "/tmp/corpus-admission")
+ADMISSION_CLASSES = {
+    "export": {
+        "limit": int(os.environ.get("EXPORT_LIMIT", "2")),
+        "queue": int(os.environ.get("EXPORT_QUEUE", "4")),
+        "timeout": float(os.environ.get("EXPORT_QUEUE_TIMEOUT", "10")),
+        "retry_after": 30,
+    },
+    "report": {
+        "limit": int(os.environ.get("REPORT_LIMIT", "4")),
+        "queue": int(os.environ.get("REPORT_QUEUE", "8")),
+        "timeout": float(os.environ.get("REPORT_QUEUE_TIMEOUT", "5")),
+        "retry_after": 10,
+    },
+}